@@ -19,7 +19,21 @@ def calculate_distance(coord1, coord2):
     return distance
 """
 
+import heapq
+import itertools
 import math
+from abc import ABC, abstractmethod
+from array import array
+
+from p15 import STATS, instrumented
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; calculate_distances falls back to a pure Python loop.
+    np = None
+
+# Leaves with at least this many hospitals use the NumPy kernel; below it the call overhead outweighs the gain.
+VECTORIZE_MIN_POINTS = 32
 
 def calculate_distance(coord1, coord2):
     """
@@ -32,6 +46,8 @@ def calculate_distance(coord1, coord2):
     Returns:
     Distance between the two points in kilometers.
     """
+    if STATS.enabled:
+        STATS.count("distance_evaluations")
     # Convert latitude and longitude from degrees to radians.
     lat1, lon1 = math.radians(coord1[0]), math.radians(coord1[1])
     lat2, lon2 = math.radians(coord2[0]), math.radians(coord2[1])
@@ -49,50 +65,381 @@ def calculate_distance(coord1, coord2):
     return distance
 
 
+def calculate_distances(coord, latitudes, longitudes):
+    """
+    Calculate the Haversine distances from one point to many points in a single pass.
+
+    Parameters:
+    coord: tuple of (latitude, longitude) of the reference point in degrees.
+    latitudes, longitudes: sequences (ideally array('d') or NumPy float64 arrays) of the other points in degrees.
+
+    Returns:
+    List of distances in kilometers, in the same order as the input points.
+    """
+    if STATS.enabled:
+        STATS.count("distance_evaluations", len(latitudes))
+    lat1, lon1 = math.radians(coord[0]), math.radians(coord[1])
+    R = 6371  # Earth's radius in kilometers.
+
+    if np is not None and len(latitudes) >= VECTORIZE_MIN_POINTS:
+        # array('d') exposes its buffer, so the coordinates are viewed, not copied.
+        lat2 = np.radians(np.frombuffer(latitudes, dtype=np.float64) if isinstance(latitudes, array) else np.asarray(latitudes, dtype=np.float64))
+        lon2 = np.radians(np.frombuffer(longitudes, dtype=np.float64) if isinstance(longitudes, array) else np.asarray(longitudes, dtype=np.float64))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return (R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+
+    # Same formula as calculate_distance, with the reference point's terms hoisted out of the loop.
+    cos_lat1 = math.cos(lat1)
+    radians, sin, cos, sqrt, atan2 = math.radians, math.sin, math.cos, math.sqrt, math.atan2
+    distances = []
+    for lat2, lon2 in zip(latitudes, longitudes):
+        lat2, lon2 = radians(lat2), radians(lon2)
+        a = sin((lat2 - lat1) / 2)**2 + cos_lat1 * cos(lat2) * sin((lon2 - lon1) / 2)**2
+        distances.append(R * (2 * atan2(sqrt(a), sqrt(1 - a))))
+    return distances
+
+
+# Angular gap in degrees between two longitudes, taking the shorter way around the globe.
+def _longitude_gap(lon1, lon2):
+    gap = abs(lon1 - lon2) % 360
+    return min(gap, 360 - gap)
+
+
+# Smallest haversine distance (in kilometers) from a point to any point inside a bounding box.
+# No hospital stored under a node can be closer to the point than this, which makes it a safe
+# priority for the best-first nearest neighbour search.
+def min_distance_to_bounding_box(point, bounding_box):
+    lat, lon = point
+    (min_lat, min_lon), (max_lat, max_lon) = bounding_box
+    if min_lon <= lon <= max_lon:
+        # The point is inside, above or below the box: the closest point shares its longitude,
+        # and the great-circle distance along a meridian is just the latitude gap.
+        if lat < min_lat:
+            return 6371 * math.radians(min_lat - lat)
+        if lat > max_lat:
+            return 6371 * math.radians(lat - max_lat)
+        return 0.0
+
+    # Otherwise the closest point lies on the meridian edge that is nearer in longitude.
+    if _longitude_gap(lon, min_lon) <= _longitude_gap(lon, max_lon):
+        edge_lon = min_lon
+    else:
+        edge_lon = max_lon
+
+    # Latitude on that meridian which is closest to the point, clamped to the box.
+    phi = math.radians(lat)
+    cos_dlon = math.cos(math.radians(edge_lon - lon))
+    closest_lat = math.degrees(math.atan2(math.sin(phi), math.cos(phi) * cos_dlon))
+    candidates = [min(max(closest_lat, min_lat), max_lat)]
+    if cos_dlon < 0:
+        # More than 90 degrees away the distance along the edge is no longer unimodal
+        # inside the box, so the corners have to be checked as well.
+        candidates.extend((min_lat, max_lat))
+    return min(calculate_distance(point, (edge_lat, edge_lon)) for edge_lat in candidates)
+
+
+# Lower and upper bounds (in kilometers) on the haversine distance between any point of one bounding
+# box and any point of another. They follow from hav(d) = hav(dlat) + cos(lat1) * cos(lat2) * hav(dlon),
+# taking the smallest and largest latitude and longitude gaps the two boxes allow.
+def bounding_box_distance_bounds(box1, box2):
+    (min_lat1, min_lon1), (max_lat1, max_lon1) = box1
+    (min_lat2, min_lon2), (max_lat2, max_lon2) = box2
+    min_lat_gap = max(0.0, min_lat2 - max_lat1, min_lat1 - max_lat2)
+    max_lat_gap = max(max_lat1 - min_lat2, max_lat2 - min_lat1)
+    if min_lon1 <= max_lon2 and min_lon2 <= max_lon1:
+        min_lon_gap = 0.0
+    else:
+        min_lon_gap = min(_longitude_gap(max_lon1, min_lon2), _longitude_gap(max_lon2, min_lon1))
+    max_lon_gap = min(180.0, max(max_lon1 - min_lon2, max_lon2 - min_lon1))
+    # No point of either box is farther from the equator than the largest |latitude|, which bounds cos(lat) from below.
+    min_cos_lat = math.cos(math.radians(max(abs(min_lat1), abs(max_lat1), abs(min_lat2), abs(max_lat2))))
+
+    def haversine(gap):
+        return math.sin(math.radians(gap) / 2) ** 2
+
+    R = 6371  # Earth's radius in kilometers.
+    lower = haversine(min_lat_gap) + min_cos_lat ** 2 * haversine(min_lon_gap)
+    upper = haversine(max_lat_gap) + haversine(max_lon_gap)
+    return 2 * R * math.asin(math.sqrt(min(lower, 1.0))), 2 * R * math.asin(math.sqrt(min(upper, 1.0)))
+
+
+# Default maximum number of children (hospitals or nodes) a single R-Tree node holds before it splits,
+# and the minimum a non-root node keeps before it is dissolved and its entries reinserted.
+MAX_NODE_CHILDREN = 4
+MIN_NODE_CHILDREN = 2
+# Default maximum number of hospitals in a leaf. Leaves are larger than internal nodes so that a query
+# scans each one in a single calculate_distances call that is long enough for the NumPy kernel.
+MAX_LEAF_HOSPITALS = 64
+
+# Number of neighbouring locations that share one tree traversal in RTree.search_nearest_batch.
+NEAREST_BATCH_GROUP_SIZE = 32
+
+
+# Groups items into tiles of at most `capacity` using Sort-Tile-Recursive ordering:
+# items are sorted by longitude into vertical slices, and each slice is sorted by latitude
+# and cut into consecutive runs. `point_of` gives the (lat, lon) position used for sorting.
+# A short run at the end of a slice is evened out with the run before it, so that every tile holds
+# at least `min_fill` items whenever there are that many items at all.
+def _sort_tile_recursive(items, point_of, capacity, min_fill=1):
+    if not items:
+        return []
+    node_count = math.ceil(len(items) / capacity)
+    slice_count = math.ceil(math.sqrt(node_count))
+    slice_size = slice_count * capacity
+
+    items = sorted(items, key=lambda item: point_of(item)[1])
+    groups = []
+    for slice_start in range(0, len(items), slice_size):
+        vertical_slice = sorted(items[slice_start:slice_start + slice_size], key=lambda item: point_of(item)[0])
+        for group_start in range(0, len(vertical_slice), capacity):
+            groups.append(vertical_slice[group_start:group_start + capacity])
+        if len(groups) > 1 and len(groups[-1]) < min_fill:
+            merged = groups[-2] + groups[-1]
+            if len(merged) <= capacity:
+                groups[-2:] = [merged]
+            else:
+                groups[-2:] = [merged[:len(merged) // 2], merged[len(merged) // 2:]]
+    return groups
+
+
+# Center of a node's bounding box, used to order nodes while packing the upper levels.
+def _bounding_box_center(node):
+    (min_lat, min_lon), (max_lat, max_lon) = node.bounding_box
+    return ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+
+
+# Bounding box geometry helpers used by the split and child selection heuristics.
+# Boxes are ((min_lat, min_lon), (max_lat, max_lon)); areas and margins are in square/plain degrees.
+def _entry_box(entry, is_leaf):
+    # A hospital is a degenerate box around its location; a node already has its own box.
+    if is_leaf:
+        point = (entry['latitude'], entry['longitude'])
+        return (point, point)
+    return entry.bounding_box
+
+
+def _box_union(box1, box2):
+    (min_lat1, min_lon1), (max_lat1, max_lon1) = box1
+    (min_lat2, min_lon2), (max_lat2, max_lon2) = box2
+    # Plain comparisons are noticeably cheaper than min()/max() calls on this hot path.
+    return ((min_lat1 if min_lat1 < min_lat2 else min_lat2, min_lon1 if min_lon1 < min_lon2 else min_lon2),
+            (max_lat1 if max_lat1 > max_lat2 else max_lat2, max_lon1 if max_lon1 > max_lon2 else max_lon2))
+
+
+def _box_area(box):
+    return (box[1][0] - box[0][0]) * (box[1][1] - box[0][1])
+
+
+def _box_margin(box):
+    return (box[1][0] - box[0][0]) + (box[1][1] - box[0][1])
+
+
+def _box_overlap(box1, box2):
+    lat_overlap = min(box1[1][0], box2[1][0]) - max(box1[0][0], box2[0][0])
+    lon_overlap = min(box1[1][1], box2[1][1]) - max(box1[0][1], box2[0][1])
+    if lat_overlap <= 0 or lon_overlap <= 0:
+        return 0.0
+    return lat_overlap * lon_overlap
+
+
+# How much a box has to grow to cover another one. Points spread along a line enclose no area,
+# so the growth in margin breaks ties between equal area growths.
+def _box_enlargement(box, other):
+    union = _box_union(box, other)
+    return (_box_area(union) - _box_area(box), _box_margin(union) - _box_margin(box))
+
+
+# Guttman's quadratic split of a node's entry boxes into two groups of at least `min_entries`.
+# The two entries that would waste the most area together seed the groups; the remaining entries
+# are then assigned one at a time, strongest preference first, to the group that grows least.
+# Returns the two groups of entry positions and their bounding boxes.
+def _quadratic_split(boxes, min_entries):
+    # Pick the pair of entries that are worst to keep together as seeds.
+    seeds = (0, 1)
+    worst_waste = None
+    for i in range(len(boxes)):
+        for j in range(i + 1, len(boxes)):
+            union = _box_union(boxes[i], boxes[j])
+            waste = (_box_area(union) - _box_area(boxes[i]) - _box_area(boxes[j]), _box_margin(union))
+            if worst_waste is None or waste > worst_waste:
+                worst_waste = waste
+                seeds = (i, j)
+
+    groups = [[seeds[0]], [seeds[1]]]
+    group_boxes = [boxes[seeds[0]], boxes[seeds[1]]]
+    remaining = [index for index in range(len(boxes)) if index not in seeds]
+    while remaining:
+        # If a group needs every remaining entry to reach the minimum fill, it gets them all.
+        needy = next((g for g in (0, 1) if len(groups[g]) + len(remaining) <= min_entries), None)
+        if needy is not None:
+            for index in remaining:
+                groups[needy].append(index)
+                group_boxes[needy] = _box_union(group_boxes[needy], boxes[index])
+            break
+
+        # Pick the entry whose enlargement cost differs most between the two groups.
+        best_index, best_growths, best_preference = None, None, None
+        for index in remaining:
+            growths = (_box_enlargement(group_boxes[0], boxes[index]), _box_enlargement(group_boxes[1], boxes[index]))
+            preference = (abs(growths[0][0] - growths[1][0]), abs(growths[0][1] - growths[1][1]))
+            if best_preference is None or preference > best_preference:
+                best_index, best_growths, best_preference = index, growths, preference
+        remaining.remove(best_index)
+
+        # Assign it to the group that grows least, then the smaller group, then the one with fewer entries.
+        target = min((0, 1), key=lambda g: (best_growths[g], _box_area(group_boxes[g]), len(groups[g])))
+        groups[target].append(best_index)
+        group_boxes[target] = _box_union(group_boxes[target], boxes[best_index])
+    return groups, group_boxes
+
+
+# R*-tree split of a leaf's entry boxes into two groups of at least `min_entries`: the entries are sorted
+# along the axis whose possible cuts give the smallest total margin, then cut where the two halves overlap
+# least (and cover the least area). Sorting keeps this O(n log n), where the quadratic split is O(n^2)
+# and too slow for large leaves. Returns the two groups of entry positions and their bounding boxes.
+def _sorted_split(boxes, min_entries):
+    count = len(boxes)
+    cuts = range(min_entries, count - min_entries + 1)
+    best = None
+    for axis in (0, 1):
+        order = sorted(range(count), key=lambda index: boxes[index][0][axis])
+        # Boxes of the first i + 1 and of the last count - i entries in this order.
+        prefix, suffix = [None] * count, [None] * count
+        box = None
+        for position, index in enumerate(order):
+            box = boxes[index] if box is None else _box_union(box, boxes[index])
+            prefix[position] = box
+        box = None
+        for position in range(count - 1, -1, -1):
+            box = boxes[order[position]] if box is None else _box_union(box, boxes[order[position]])
+            suffix[position] = box
+        margin = sum(_box_margin(prefix[cut - 1]) + _box_margin(suffix[cut]) for cut in cuts)
+        if best is None or margin < best[0]:
+            best = (margin, order, prefix, suffix)
+    _, order, prefix, suffix = best
+    cut = min(cuts, key=lambda cut: (_box_overlap(prefix[cut - 1], suffix[cut]),
+                                     _box_area(prefix[cut - 1]) + _box_area(suffix[cut])))
+    return [order[:cut], order[cut:]], [prefix[cut - 1], suffix[cut]]
+
+
+# Collects every hospital stored below a node.
+def _subtree_hospitals(node):
+    hospitals = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.is_leaf:
+            hospitals.extend(node.children)
+        else:
+            stack.extend(node.children)
+    return hospitals
+
+
 # R-Tree Node class
 class RTreeNode:
     # Initializes a node, which can be either an internal node or a leaf node.
     # - `is_leaf`: Determines if the node is a leaf (holds data points) or an internal node (holds child nodes).
     # - `children`: Stores either other RTreeNodes (if internal) or actual hospital data points (if leaf).
     # - `bounding_box`: A rectangular area defined by min and max latitude/longitude values that encloses all its children.
+    # - `max_rating`: The highest hospital rating anywhere in this subtree, used to skip subtrees in rating queries.
+    # - `latitudes`/`longitudes`/`ratings` (leaves only): the hospitals' coordinates and ratings as contiguous
+    #   float64 arrays, kept in the same order as `children`, so a whole leaf is scanned in one call.
+    # - `parent`: The node this one is a child of (None for the root), so deletes can walk back up from a leaf.
     def __init__(self, is_leaf=False):
         self.is_leaf = is_leaf
         self.children = []
+        self.parent = None
         self.bounding_box = None  # Min and max lat/long for the node
+        self.max_rating = float('-inf')  # No hospitals yet
+        if is_leaf:
+            self.latitudes = array('d')
+            self.longitudes = array('d')
+            self.ratings = array('d')
+
+    # Replaces the hospitals held by a leaf and rebuilds its coordinate and rating arrays.
+    # `leaf_of`, when given, is the tree's hospital -> leaf locator and is pointed at this leaf.
+    def set_hospitals(self, hospitals, leaf_of=None):
+        self.children = list(hospitals)
+        self.latitudes = array('d', [hospital['latitude'] for hospital in self.children])
+        self.longitudes = array('d', [hospital['longitude'] for hospital in self.children])
+        self.ratings = array('d', [hospital['rating'] for hospital in self.children])
+        if leaf_of is not None:
+            for hospital in self.children:
+                leaf_of[id(hospital)] = self
+
+    # Replaces the child nodes of an internal node and points their parent links here.
+    def set_children(self, children):
+        self.children = list(children)
+        for child in self.children:
+            child.parent = self
 
-    # Inserts a hospital into the R-Tree and adjusts the bounding box.
-    # If the node is a leaf and exceeds capacity, it will split.
-    def insert(self, hospital):
+    # Removes the hospital at the given position of a leaf, keeping the arrays in step.
+    def remove_hospital_at(self, index):
+        del self.children[index]
+        del self.latitudes[index]
+        del self.longitudes[index]
+        del self.ratings[index]
+
+    # Inserts a hospital into the subtree and grows the bounding box to cover it.
+    # If the node ends up with more than `max_entries` children it splits, and the new sibling is returned.
+    # Leaves use `max_leaf_entries` and `min_leaf_entries` instead when they are given.
+    # `leaf_of`, when given, records which leaf each hospital ends up in.
+    def insert(self, hospital, max_entries=MAX_NODE_CHILDREN, min_entries=MIN_NODE_CHILDREN, leaf_of=None,
+               max_leaf_entries=None, min_leaf_entries=None):
         if self.is_leaf:
             # If it's a leaf, add the hospital data to the children.
             self.children.append(hospital)
-            # Adjust the bounding box to include the new data point.
-            self.adjust_bounding_box()
-            if len(self.children) > 4:  # Max capacity reached, split the node
-                return self.split()  # Splits the node into two if it has too many children.
+            self.latitudes.append(hospital['latitude'])
+            self.longitudes.append(hospital['longitude'])
+            self.ratings.append(hospital['rating'])
+            if leaf_of is not None:
+                leaf_of[id(hospital)] = self
+            if max_leaf_entries is not None:
+                max_entries, min_entries = max_leaf_entries, min_leaf_entries
         else:
             # If it's an internal node, find the best child to insert the hospital into.
             best_child = self.choose_best_child(hospital)
             # Recursively insert the hospital into the selected child node.
-            new_node = best_child.insert(hospital)
+            new_node = best_child.insert(hospital, max_entries, min_entries, leaf_of, max_leaf_entries, min_leaf_entries)
             # If the child node split, add the new node to the current node.
             if new_node:
                 self.children.append(new_node)
-                # Adjust the bounding box after adding the new child.
-                self.adjust_bounding_box()
+                new_node.parent = self
+
+        if len(self.children) > max_entries:  # Max capacity reached, split the node
+            return self.split(min_entries, leaf_of)
+
+        # Both halves of a split child lie inside the old box plus the new point, so growing
+        # the box (and the max rating) to include the new hospital is enough; there is no need to rescan every child.
+        point_box = _entry_box(hospital, True)
+        if self.bounding_box is None:
+            self.bounding_box = point_box
+        else:
+            self.bounding_box = _box_union(self.bounding_box, point_box)
+        if hospital['rating'] > self.max_rating:
+            self.max_rating = hospital['rating']
         return None
 
-    # Adjusts the bounding box to fit all children within this node.
+    # Recomputes the highest rating in this subtree from the node's children.
+    def adjust_max_rating(self):
+        if not self.children:
+            self.max_rating = float('-inf')
+        elif self.is_leaf:
+            self.max_rating = max(self.ratings)
+        else:
+            self.max_rating = max(child.max_rating for child in self.children)
+
+    # Adjusts the bounding box (and the max rating) to fit all children within this node.
     def adjust_bounding_box(self):
+        self.adjust_max_rating()
         if not self.children:
+            self.bounding_box = None
             return
 
         # If the node is a leaf, adjust the bounding box to fit all hospital locations.
         if self.is_leaf:
-            min_lat = min(child["latitude"] for child in self.children)
-            max_lat = max(child["latitude"] for child in self.children)
-            min_lon = min(child["longitude"] for child in self.children)
-            max_lon = max(child["longitude"] for child in self.children)
+            min_lat, max_lat = min(self.latitudes), max(self.latitudes)
+            min_lon, max_lon = min(self.longitudes), max(self.longitudes)
         else:
             # If it's an internal node, adjust the bounding box to fit all child bounding boxes.
             min_lat = min(child.bounding_box[0][0] for child in self.children)
@@ -102,63 +449,66 @@ class RTreeNode:
 
         self.bounding_box = ((min_lat, min_lon), (max_lat, max_lon))
 
-    # Splits the node into two, creating a new node with half of the current node's children.
-    def split(self):
-        mid_index = len(self.children) // 2
+    # Splits an overflowing node in two and returns the new node; each half keeps at least `min_entries`
+    # children. Leaves, which hold many hospitals, are cut along a sorted axis; internal nodes, which hold
+    # only a few children, use Guttman's quadratic split.
+    def split(self, min_entries=MIN_NODE_CHILDREN, leaf_of=None):
+        entries = self.children
+        boxes = [_entry_box(entry, self.is_leaf) for entry in entries]
+        if self.is_leaf:
+            groups, group_boxes = _sorted_split(boxes, min_entries)
+        else:
+            groups, group_boxes = _quadratic_split(boxes, min_entries)
+
         new_node = RTreeNode(is_leaf=self.is_leaf)
-        new_node.children = self.children[mid_index:]  # Move the second half to the new node.
-        self.children = self.children[:mid_index]  # Keep the first half in the current node.
-        self.adjust_bounding_box()  # Adjust bounding boxes for both nodes.
-        new_node.adjust_bounding_box()
+        if self.is_leaf:
+            self.set_hospitals(entries[index] for index in groups[0])
+            new_node.set_hospitals((entries[index] for index in groups[1]), leaf_of)
+        else:
+            self.children = [entries[index] for index in groups[0]]
+            new_node.set_children(entries[index] for index in groups[1])
+        self.bounding_box = group_boxes[0]
+        new_node.bounding_box = group_boxes[1]
+        self.adjust_max_rating()
+        new_node.adjust_max_rating()
         return new_node
 
-    # Chooses the best child node to insert a new hospital into, based on distance.
+    # Chooses the child to insert a new hospital into (R*-tree ChooseSubtree).
+    # Just above the leaves the child whose box would add the least overlap with its siblings wins;
+    # higher up, and to break ties, the child needing the least enlargement, then the smallest one.
     def choose_best_child(self, hospital):
-        best_child = None
-        min_distance = float('inf')  # Initialize with infinity to find the minimum distance.
+        point_box = _entry_box(hospital, True)
+        lat, lon = point_box[0]
 
-        # Get the hospital's latitude and longitude.
-        hospital_lat = hospital["latitude"]
-        hospital_lon = hospital["longitude"]
-
-        # Iterate through each child and calculate the distance to find the best one.
+        # Rank the children by enlargement first; a child that already contains the point needs none.
+        ranked = []
         for child in self.children:
-            # Get the child's bounding box coordinates (assuming lower-left corner for comparison).
-            child_lat = child.bounding_box[0][0]
-            child_lon = child.bounding_box[0][1]
-
-            # Calculate the distance between the hospital and the child's bounding box corner.
-            distance = calculate_distance((child_lat, child_lon), (hospital_lat, hospital_lon))
+            (min_lat, min_lon), (max_lat, max_lon) = box = child.bounding_box
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                growth = (0.0, 0.0)
+            else:
+                growth = _box_enlargement(box, point_box)
+            ranked.append((growth, _box_area(box), child))
+        best = min(ranked, key=lambda candidate: candidate[:2])
+        if not self.children[0].is_leaf or best[0] == (0.0, 0.0):
+            return best[2]
 
-            # Find the child with the minimum distance.
-            if distance < min_distance:
-                min_distance = distance
+        # Extra overlap each enlarged leaf box would create with its siblings.
+        best_child = None
+        best_cost = None
+        for growth, area, child in ranked:
+            if growth == (0.0, 0.0):
+                overlap_growth = 0.0
+            else:
+                enlarged = _box_union(child.bounding_box, point_box)
+                overlap_growth = sum(_box_overlap(enlarged, sibling.bounding_box) - _box_overlap(child.bounding_box, sibling.bounding_box)
+                                     for sibling in self.children if sibling is not child)
+            cost = (overlap_growth, growth, area)
+            if best_cost is None or cost < best_cost:
+                best_cost = cost
                 best_child = child
 
         return best_child
-    
-    def delete(self, hospital):
-        if self.is_leaf:
-            # If it's a leaf node, try to remove the hospital directly.
-            if hospital in self.children:
-                self.children.remove(hospital)
-                self.adjust_bounding_box()
-                return True  # Hospital removed successfully
-            return False  # Hospital not found
-
-        # If it's an internal node, recursively try to delete from child nodes.
-        for child in self.children:
-            # Check if the hospital's coordinates fall within the child's bounding box.
-            if self.is_within_bounding_box(hospital, child.bounding_box):
-                if child.delete(hospital):
-                    # If the child has fewer than the minimum allowed children after deletion,
-                    # it may need to be merged or adjusted.
-                    if len(child.children) < 2:  # Example threshold, may vary based on your implementation.
-                        self.children.remove(child)  # Remove the child node.
-                        self.adjust_bounding_box()
-                    return True  # Hospital deleted successfully
-
-        return False  # Hospital not found
 
 # Helper function to determine if a hospital's coordinates are within a given bounding box.
     def is_within_bounding_box(self, hospital, bounding_box):
@@ -167,50 +517,654 @@ class RTreeNode:
         max_lat, max_lon = bounding_box[1]
         return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
 
+    # Helper function to determine if this node's bounding box overlaps a given bounding box.
+    def overlaps_bounding_box(self, bounding_box):
+        if self.bounding_box is None:
+            return False
+        (min_lat, min_lon), (max_lat, max_lon) = self.bounding_box
+        (other_min_lat, other_min_lon), (other_max_lat, other_max_lon) = bounding_box
+        return (min_lat <= other_max_lat and other_min_lat <= max_lat and
+                min_lon <= other_max_lon and other_min_lon <= max_lon)
+
+
+
+
+# Interface every spatial engine offers HospitalProject (see RTree below and GridIndex in p12).
+# Hospitals are dicts with at least 'latitude', 'longitude' and 'rating', stored and removed by object
+# identity. An engine must provide insert_hospital, delete_hospital, search_nearest, search_window,
+# all_hospitals, __len__ and __contains__ (abstract, so an incomplete engine cannot be instantiated);
+# the other operations have generic versions built on those, which an engine overrides when it can do
+# better. Queries record the number of index nodes or cells they examined in `last_query_node_visits` and
+# add it to `total_node_visits`, and report node visits and leaf scans to p15.STATS while it is enabled.
+class SpatialIndex(ABC):
+    def __init__(self):
+        self.last_query_node_visits = 0
+        self.total_node_visits = 0
+
+    # Stores a hospital.
+    @abstractmethod
+    def insert_hospital(self, hospital):
+        raise NotImplementedError
+
+    # Removes a hospital (the same object that was inserted); returns False if it is not stored.
+    @abstractmethod
+    def delete_hospital(self, hospital):
+        raise NotImplementedError
+
+    # Returns at most `max_results` hospitals (all of them when `max_results` is None), nearest first,
+    # optionally limited to `distance_range` km. With `return_distances=True` each result is a
+    # (distance_km, hospital) pair instead.
+    @abstractmethod
+    def search_nearest(self, user_location, max_results=3, distance_range=None, return_distances=False):
+        raise NotImplementedError
 
+    # Returns every hospital inside the rectangle spanned by the given corners.
+    @abstractmethod
+    def search_window(self, min_lat, min_lon, max_lat, max_lon):
+        raise NotImplementedError
+
+    # Returns a list of every stored hospital.
+    @abstractmethod
+    def all_hospitals(self):
+        raise NotImplementedError
+
+    # Number of hospitals stored.
+    @abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+    # Whether this exact hospital object is stored.
+    @abstractmethod
+    def __contains__(self, hospital):
+        raise NotImplementedError
+
+    # Stores a batch of hospitals.
+    def insert_hospitals(self, hospitals):
+        for hospital in hospitals:
+            self.insert_hospital(hospital)
+
+    # Brings the index up to date after a stored hospital's coordinates or rating changed in place.
+    def refresh_hospital(self, hospital):
+        if not self.delete_hospital(hospital):
+            return False
+        self.insert_hospital(hospital)
+        return True
+
+    # Marks the start and end of a run of updates, for engines that can defer maintenance until the end.
+    def begin_batch(self):
+        pass
+
+    def end_batch(self):
+        pass
+
+    # Returns up to `k` hospitals within `distance_range` km, best rating first and nearer first among
+    # equal ratings. With `include_ties=True`, hospitals tied with the k-th rating are returned too.
+    # `return_distances=True` yields (distance_km, hospital) pairs.
+    def search_top_rated(self, user_location, distance_range, k=1, include_ties=False, return_distances=False):
+        found = self.search_nearest(user_location, None, distance_range, return_distances=True)
+        found.sort(key=lambda result: (-result[1]['rating'], result[0]))
+        if include_ties and k > 0 and len(found) > k:
+            kth_rating = found[k - 1][1]['rating']
+            results = [result for result in found if result[1]['rating'] >= kth_rating]
+        else:
+            results = found[:k]
+        if return_distances:
+            return results
+        return [hospital for _, hospital in results]
+
+    # Answers nearest-hospital queries for many locations, returning one list of (distance_km, hospital)
+    # pairs per location in input order.
+    def search_nearest_batch(self, locations, max_results=3, distance_range=None):
+        return [self.search_nearest(location, max_results, distance_range, return_distances=True) for location in locations]
+
+    # Counts the points of `demand_tree` (an RTree over demand points) within `radius` km of every
+    # hospital and finds the points with no hospital that close, with one radius query per point.
+    # Returns ([(hospital, count), ...] for every hospital, [uncovered point, ...]).
+    def coverage_join(self, demand_tree, radius):
+        counts = {}
+        uncovered = []
+        for point in demand_tree.all_hospitals():
+            found = self.search_nearest((point['latitude'], point['longitude']), None, radius)
+            if not found:
+                uncovered.append(point)
+            for hospital in found:
+                counts[id(hospital)] = counts.get(id(hospital), 0) + 1
+        return [(hospital, counts.get(id(hospital), 0)) for hospital in self.all_hospitals()], uncovered
+
+    # Records the number of nodes expanded by the query that just finished, `leaves` of them leaves.
+    def _record_node_visits(self, visits, leaves=0):
+        self.last_query_node_visits = visits
+        self.total_node_visits += visits
+        if STATS.enabled:
+            STATS.count("nodes_visited", visits)
+            STATS.count("leaves_scanned", leaves)
+
+    # Resets the cumulative node-visit counter, e.g. between two benchmark runs.
+    def reset_node_visits(self):
+        self.last_query_node_visits = 0
+        self.total_node_visits = 0
 
 
 # R-Tree class, manages the overall structure and operations of the R-Tree.
-class RTree:
+class RTree(SpatialIndex):
     # Initializes the R-Tree with a root node.
-    def __init__(self):
+    # - `max_entries`: Maximum number of children per internal node (the fanout).
+    # - `min_entries`: Minimum number of children a non-root node keeps; defaults to half of `max_entries`.
+    # - `max_leaf_entries`, `min_leaf_entries`: The same limits for the hospitals of a leaf; the minimum
+    #   defaults to half of the maximum.
+    # Every query records how many nodes it expanded in `last_query_node_visits` (and adds it to
+    # `total_node_visits`), which helps to pick a fanout that suits the data density.
+    # `leaf_of` maps each stored hospital (by object identity) to the leaf holding it, so deletes go
+    # straight to the right leaf instead of searching the tree.
+    # Between begin_batch() and end_batch(), `_dirty_leaves` collects the leaves whose summaries need repair.
+    def __init__(self, max_entries=MAX_NODE_CHILDREN, min_entries=None, max_leaf_entries=MAX_LEAF_HOSPITALS, min_leaf_entries=None):
+        if min_entries is None:
+            min_entries = max_entries // 2
+        if min_leaf_entries is None:
+            min_leaf_entries = max_leaf_entries // 2
+        if max_entries < 2 or not 1 <= min_entries <= max_entries // 2:
+            raise ValueError("R-Tree fanout needs max_entries >= 2 and 1 <= min_entries <= max_entries // 2")
+        if max_leaf_entries < 2 or not 1 <= min_leaf_entries <= max_leaf_entries // 2:
+            raise ValueError("R-Tree leaves need max_leaf_entries >= 2 and 1 <= min_leaf_entries <= max_leaf_entries // 2")
+        self.max_entries = max_entries
+        self.min_entries = min_entries
+        self.max_leaf_entries = max_leaf_entries
+        self.min_leaf_entries = min_leaf_entries
         self.root = RTreeNode(is_leaf=True)  # Start with a leaf node as the root.
+        super().__init__()
+        self.leaf_of = {}
+        self._dirty_leaves = None
 
     # Inserts a hospital into the R-Tree.
+    @instrumented("rtree.insert")
     def insert_hospital(self, hospital):
-        new_node = self.root.insert(hospital)  # Inserts the hospital into the root.
+        new_node = self.root.insert(hospital, self.max_entries, self.min_entries, self.leaf_of,
+                                    self.max_leaf_entries, self.min_leaf_entries)  # Inserts the hospital into the root.
         if new_node:  # If the root split, create a new root.
             new_root = RTreeNode(is_leaf=False)
-            new_root.children = [self.root, new_node]  # The old root and new node become children of the new root.
+            new_root.set_children([self.root, new_node])  # The old root and new node become children of the new root.
             new_root.adjust_bounding_box()  # Adjust the bounding box for the new root.
             self.root = new_root
-    
-    # Searches for the nearest hospitals within a given distance range.
-    def search_nearest(self, user_location, max_results=3, distance_range=None):
-        nearest_hospitals = []
-        # Start the search from the root node.
-        self._nearest_search(self.root, user_location, nearest_hospitals, max_results, distance_range)
-        # Sort the hospitals by distance and return the nearest ones.
-        return sorted(nearest_hospitals, key=lambda h: calculate_distance(user_location, (h['latitude'], h['longitude'])))
-
-    # Recursively searches for hospitals in the tree that are within the distance range.
-    def _nearest_search(self, node, user_location, nearest_hospitals, max_results, distance_range):
-        # If the node is a leaf, check distances of all hospitals directly.
-        if node.is_leaf:
-            for hospital in node.children:
-                dist = calculate_distance(user_location, (hospital['latitude'], hospital['longitude']))
-                # If within the specified distance, add the hospital to the results.
-                if distance_range is None or dist <= distance_range:
-                    nearest_hospitals.append(hospital)
+
+    # Number of hospitals stored in the tree.
+    def __len__(self):
+        return len(self.leaf_of)
+
+    # Whether this exact hospital object is stored in the tree.
+    def __contains__(self, hospital):
+        return id(hospital) in self.leaf_of
+
+    # Builds the tree in one pass from a batch of hospitals using Sort-Tile-Recursive packing.
+    # Hospitals already in the tree are packed together with the new ones. Nodes are filled to capacity
+    # apart from the ends of the packing slices, which never drop below the minimum fill, and no bounding
+    # box is recomputed more than once.
+    def bulk_load(self, hospitals):
+        entries = self.all_hospitals()
+        entries.extend(hospitals)
+        self.leaf_of = {}
+        if self._dirty_leaves is not None:
+            self._dirty_leaves = {}  # The rebuilt tree has no stale summaries.
+        if not entries:
+            self.root = RTreeNode(is_leaf=True)
+            return
+
+        # Pack the hospitals into leaves, then keep packing each level into parents until one node remains.
+        level = []
+        for group in _sort_tile_recursive(entries, lambda h: (h['latitude'], h['longitude']), self.max_leaf_entries, self.min_leaf_entries):
+            leaf = RTreeNode(is_leaf=True)
+            leaf.set_hospitals(group, self.leaf_of)
+            leaf.adjust_bounding_box()
+            level.append(leaf)
+        while len(level) > 1:
+            parents = []
+            for group in _sort_tile_recursive(level, _bounding_box_center, self.max_entries, self.min_entries):
+                parent = RTreeNode(is_leaf=False)
+                parent.set_children(group)
+                parent.adjust_bounding_box()
+                parents.append(parent)
+            level = parents
+        self.root = level[0]
+
+    # Adds a batch of hospitals without rebuilding the whole tree for every batch.
+    # An empty tree, or one no larger than the batch, is simply repacked with bulk_load. Otherwise the
+    # batch is packed into leaves with Sort-Tile-Recursive and each full leaf is grafted in whole just
+    # above the leaf level; hospitals of leaves below the minimum fill are inserted one by one.
+    def insert_hospitals(self, hospitals):
+        hospitals = list(hospitals)
+        if not hospitals:
+            return
+        if len(hospitals) >= len(self):
+            self.bulk_load(hospitals)
+            return
+        for group in _sort_tile_recursive(hospitals, lambda h: (h['latitude'], h['longitude']), self.max_leaf_entries, self.min_leaf_entries):
+            if self.root.is_leaf or len(group) < self.min_leaf_entries:
+                for hospital in group:
+                    self.insert_hospital(hospital)
+                continue
+            leaf = RTreeNode(is_leaf=True)
+            leaf.set_hospitals(group, self.leaf_of)
+            leaf.adjust_bounding_box()
+            self._graft_leaf(leaf)
+
+    # Hangs a packed leaf under the node just above the leaf level that needs the least enlargement,
+    # splitting overflowing nodes on the way back up like a normal insert.
+    def _graft_leaf(self, leaf):
+        box = leaf.bounding_box
+        node = self.root
+        while not node.children[0].is_leaf:
+            node = min(node.children, key=lambda child: (_box_enlargement(child.bounding_box, box), _box_area(child.bounding_box)))
+        node.children.append(leaf)
+        leaf.parent = node
+        while node is not None:
+            if len(node.children) > self.max_entries:
+                sibling = node.split(self.min_entries)
+                if node.parent is None:
+                    new_root = RTreeNode(is_leaf=False)
+                    new_root.set_children([node, sibling])
+                    new_root.adjust_bounding_box()
+                    self.root = new_root
+                    break
+                node.parent.children.append(sibling)
+                sibling.parent = node.parent
+            else:
+                # The halves of any split below lie inside the old box plus the leaf's box.
+                node.bounding_box = _box_union(node.bounding_box, box)
+                node.max_rating = max(node.max_rating, leaf.max_rating)
+            node = node.parent
+
+    # Returns a list of every hospital stored in the tree.
+    def all_hospitals(self):
+        return _subtree_hospitals(self.root)
+
+    # Searches for the nearest hospitals, optionally limited to a distance range.
+    # Returns at most `max_results` hospitals (all of them when `max_results` is None), ordered by distance.
+    # With `return_distances=True` each result is a (distance_km, hospital) pair instead.
+    def search_nearest(self, user_location, max_results=3, distance_range=None, return_distances=False):
+        if max_results is None and distance_range is not None:
+            # Pure radius query: no need to order the traversal, only to skip subtrees out of range.
+            results = self._range_search(user_location, distance_range)
+        else:
+            results = self._nearest_search(user_location, max_results, distance_range)
+        if return_distances:
+            return results
+        return [hospital for _, hospital in results]
+
+    # Best-first k-nearest neighbour search.
+    # A single priority queue holds tree nodes, keyed on the minimum distance from the user to their
+    # bounding box, and hospitals, keyed on their actual distance. A node's key is never larger than the
+    # distance of anything stored below it, so every hospital popped from the queue is the next nearest
+    # one and the search can stop as soon as `max_results` hospitals have been confirmed.
+    # The distances of the `max_results` nearest hospitals queued so far are kept as well: nothing
+    # farther than the largest of them can make the results, so it is never queued.
+    @instrumented("rtree.nearest")
+    def _nearest_search(self, user_location, max_results, distance_range):
+        results = []
+        visits = leaves = 0
+        # The counter breaks ties between equal distances so the heap never compares nodes or hospitals.
+        counter = itertools.count()
+        queue = []
+        bound = math.inf if distance_range is None else distance_range
+        candidates = []  # Max-heap (negated) of the distances of the `max_results` nearest hospitals queued
+        if self.root.bounding_box is not None and (max_results is None or max_results > 0):
+            queue.append((min_distance_to_bounding_box(user_location, self.root.bounding_box), next(counter), self.root, None))
+        while queue:
+            dist, _, node, hospital = heapq.heappop(queue)
+            # Everything still queued is at least this far away.
+            if dist > bound:
+                break
+
+            if node is None:
+                # A hospital reached the front of the queue: its distance is final.
+                results.append((dist, hospital))
+                if len(results) == max_results:
+                    break
+            elif node.is_leaf:
+                visits += 1
+                leaves += 1
+                distances = calculate_distances(user_location, node.latitudes, node.longitudes)
+                for hospital, hospital_dist in zip(node.children, distances):
+                    if hospital_dist > bound:
+                        continue
+                    heapq.heappush(queue, (hospital_dist, next(counter), None, hospital))
+                    if max_results is not None:
+                        if len(candidates) < max_results:
+                            heapq.heappush(candidates, -hospital_dist)
+                        elif hospital_dist < -candidates[0]:
+                            heapq.heapreplace(candidates, -hospital_dist)
+                        if len(candidates) == max_results:
+                            bound = min(bound, -candidates[0])
+            else:
+                visits += 1
+                for child in node.children:
+                    child_dist = min_distance_to_bounding_box(user_location, child.bounding_box)
+                    # Subtrees that cannot hold anything within range never enter the queue.
+                    if child_dist <= bound:
+                        heapq.heappush(queue, (child_dist, next(counter), child, None))
+        self._record_node_visits(visits, leaves)
+        return results
+
+    # Answers nearest-hospital queries for many locations at once, returning one list of
+    # (distance_km, hospital) pairs per location in input order (the same results as search_nearest).
+    # Locations are taken in Sort-Tile-Recursive order so that neighbours come close together. Each location
+    # not answered yet is searched normally and becomes a seed: of the next `group_size` locations, those
+    # within half its result distance share its traversal. Great-circle distance obeys the triangle
+    # inequality, so one range search around the seed finds every hospital any of them can need, and each
+    # of them only ranks those candidates instead of walking the tree again.
+    def search_nearest_batch(self, locations, max_results=3, distance_range=None, group_size=NEAREST_BATCH_GROUP_SIZE):
+        locations = list(locations)
+        if not locations:
+            return []
+        if max_results == 0:
+            return [[] for _ in locations]
+        results = [None] * len(locations)
+        order = [i for tile in _sort_tile_recursive(range(len(locations)), locations.__getitem__, group_size) for i in tile]
+        for position, seed in enumerate(order):
+            if results[seed] is not None:
+                continue
+            seed_location = locations[seed]
+            results[seed] = seed_results = self.search_nearest(seed_location, max_results, distance_range, return_distances=True)
+
+            # Neighbours within `reach` of the seed have all their results within `bound` of it.
+            kth_distance = seed_results[-1][0] if max_results is not None and len(seed_results) == max_results else math.inf
+            reach = min(kth_distance, math.inf if distance_range is None else distance_range) / 2
+            window = [i for i in order[position + 1:position + 1 + group_size] if results[i] is None]
+            if not window:
+                continue
+            gaps = calculate_distances(seed_location, array('d', [locations[i][0] for i in window]),
+                                       array('d', [locations[i][1] for i in window]))
+            members = [i for i, gap in zip(window, gaps) if gap <= reach]
+            if not members:
+                continue
+            spread = max(gap for gap in gaps if gap <= reach)
+            bound = min(kth_distance + 2 * spread, math.inf if distance_range is None else distance_range + spread)
+
+            # A hair of slack so rounding in the distances can never drop a true result.
+            candidates = self._range_search(seed_location, bound * (1 + 1e-9) + 1e-9)
+            hospitals = [hospital for _, hospital in candidates]
+            candidate_latitudes = array('d', [hospital['latitude'] for hospital in hospitals])
+            candidate_longitudes = array('d', [hospital['longitude'] for hospital in hospitals])
+            for i in members:
+                distances = calculate_distances(locations[i], candidate_latitudes, candidate_longitudes)
+                ranked = [(dist, hospital) for dist, hospital in zip(distances, hospitals)
+                          if distance_range is None or dist <= distance_range]
+                if max_results is None:
+                    ranked.sort(key=lambda result: result[0])
+                    results[i] = ranked
+                else:
+                    results[i] = heapq.nsmallest(max_results, ranked, key=lambda result: result[0])
+        return results
+
+    # Spatial join for coverage planning against `demand_tree`, an RTree over demand points (e.g. population
+    # centroids): counts the points within `radius` km of every hospital and finds the points with no
+    # hospital within `radius` km. Both trees are walked together, one pair of nodes at a time: pairs whose
+    # boxes are farther apart than the radius are dropped, pairs that lie entirely within it are settled
+    # without computing a single distance, and only leaf pairs in between compare individual points.
+    # Returns ([(hospital, count), ...] for every hospital, [uncovered point, ...]).
+    def coverage_join(self, demand_tree, radius):
+        counts = {}  # id(hospital) -> number of demand points within the radius
+        covered_points = set()  # ids of demand points known to be covered
+        covered_nodes = set()  # demand nodes whose every point is covered
+        point_counts = {}  # demand node -> number of points below it
+        visits = 0
+        stack = []
+        if self.root.bounding_box is not None and demand_tree.root.bounding_box is not None:
+            stack.append((self.root, demand_tree.root))
+        while stack:
+            hospital_node, demand_node = stack.pop()
+            visits += 1
+            lower, upper = bounding_box_distance_bounds(hospital_node.bounding_box, demand_node.bounding_box)
+            if lower > radius:
+                continue
+            if upper <= radius:
+                # Every hospital here reaches every point there.
+                if demand_node not in point_counts:
+                    point_counts[demand_node] = len(_subtree_hospitals(demand_node))
+                for hospital in _subtree_hospitals(hospital_node):
+                    counts[id(hospital)] = counts.get(id(hospital), 0) + point_counts[demand_node]
+                covered_nodes.add(demand_node)
+            elif hospital_node.is_leaf and demand_node.is_leaf:
+                for hospital, lat, lon in zip(hospital_node.children, hospital_node.latitudes, hospital_node.longitudes):
+                    distances = calculate_distances((lat, lon), demand_node.latitudes, demand_node.longitudes)
+                    within = 0
+                    for point, dist in zip(demand_node.children, distances):
+                        if dist <= radius:
+                            within += 1
+                            covered_points.add(id(point))
+                    if within:
+                        counts[id(hospital)] = counts.get(id(hospital), 0) + within
+            elif demand_node.is_leaf or (not hospital_node.is_leaf and
+                                         _box_area(hospital_node.bounding_box) >= _box_area(demand_node.bounding_box)):
+                # Open up the larger box of the pair.
+                stack.extend((child, demand_node) for child in hospital_node.children)
+            else:
+                stack.extend((hospital_node, child) for child in demand_node.children)
+        self._record_node_visits(visits)
+
+        uncovered = []
+        stack = [demand_tree.root]
+        while stack:
+            node = stack.pop()
+            if node in covered_nodes:
+                continue
+            if node.is_leaf:
+                uncovered.extend(point for point in node.children if id(point) not in covered_points)
+            else:
+                stack.extend(node.children)
+        return [(hospital, counts.get(id(hospital), 0)) for hospital in self.all_hospitals()], uncovered
+
+    # Collects every hospital within `distance_range` km, nearest first.
+    # Children whose bounding box is entirely farther away than the range are never visited.
+    def _range_search(self, user_location, distance_range):
+        results = []
+        visits = leaves = 0
+        stack = []
+        if self.root.bounding_box is not None and min_distance_to_bounding_box(user_location, self.root.bounding_box) <= distance_range:
+            stack.append(self.root)
+        while stack:
+            node = stack.pop()
+            visits += 1
+            if node.is_leaf:
+                leaves += 1
+                distances = calculate_distances(user_location, node.latitudes, node.longitudes)
+                results.extend((dist, hospital) for dist, hospital in zip(distances, node.children) if dist <= distance_range)
+            else:
+                for child in node.children:
+                    if min_distance_to_bounding_box(user_location, child.bounding_box) <= distance_range:
+                        stack.append(child)
+        self._record_node_visits(visits, leaves)
+        # Only the hospitals in range get sorted.
+        results.sort(key=lambda result: result[0])
+        return results
+
+    # Returns every hospital inside the rectangle spanned by the given corners (e.g. a map viewport).
+    # Only nodes whose bounding box overlaps the rectangle are descended into.
+    def search_window(self, min_lat, min_lon, max_lat, max_lon):
+        window = ((min_lat, min_lon), (max_lat, max_lon))
+        results = []
+        visits = leaves = 0
+        stack = [self.root] if self.root.overlaps_bounding_box(window) else []
+        while stack:
+            node = stack.pop()
+            visits += 1
+            if node.is_leaf:
+                leaves += 1
+                # Test the coordinate arrays rather than looking up every hospital's fields.
+                results.extend(hospital for hospital, lat, lon in zip(node.children, node.latitudes, node.longitudes)
+                               if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon)
+            else:
+                stack.extend(child for child in node.children if child.overlaps_bounding_box(window))
+        self._record_node_visits(visits, leaves)
+        return results
+
+    # Branch-and-bound search for the best-rated hospitals within `distance_range` km.
+    # Subtrees are visited best `max_rating` first (nearest first among equal ratings), subtrees out of range
+    # are skipped, and the search stops as soon as no remaining subtree can beat the k-th best hospital so far.
+    # Returns up to `k` hospitals, best rating first and nearer first among equal ratings. With
+    # `include_ties=True`, hospitals tied with the k-th rating are returned too (so k=1 gives every
+    # hospital sharing the top rating). `return_distances=True` yields (distance_km, hospital) pairs.
+    def search_top_rated(self, user_location, distance_range, k=1, include_ties=False, return_distances=False):
+        found = []  # (rating, distance, hospital) for every in-range hospital that could still make the cut
+        # Min-heap with the (rating, -distance) keys of the k best hospitals so far; its head is the one to beat.
+        top_keys = []
+        visits = leaves = 0
+        counter = itertools.count()
+        # Subtrees ordered best first: (-max_rating, min_distance, counter, node).
+        queue = []
+        if k > 0 and self.root.bounding_box is not None:
+            root_dist = min_distance_to_bounding_box(user_location, self.root.bounding_box)
+            if root_dist <= distance_range:
+                queue.append((-self.root.max_rating, root_dist, next(counter), self.root))
+
+        # Whether something with this rating at this distance could still make it into the results.
+        def can_qualify(rating, dist):
+            if len(top_keys) < k:
+                return True
+            if include_ties:
+                return rating >= top_keys[0][0]
+            return (rating, -dist) > top_keys[0]
+
+        while queue:
+            negative_rating, node_dist, _, node = heapq.heappop(queue)
+            # The queue is ordered the same way, so if this subtree cannot qualify neither can any other.
+            if not can_qualify(-negative_rating, node_dist):
+                break
+
+            visits += 1
+            if node.is_leaf:
+                leaves += 1
+                distances = calculate_distances(user_location, node.latitudes, node.longitudes)
+                for hospital, rating, dist in zip(node.children, node.ratings, distances):
+                    if dist > distance_range or not can_qualify(rating, dist):
+                        continue
+                    found.append((rating, dist, hospital))
+                    if len(top_keys) < k:
+                        heapq.heappush(top_keys, (rating, -dist))
+                    elif (rating, -dist) > top_keys[0]:
+                        heapq.heapreplace(top_keys, (rating, -dist))
+            else:
+                for child in node.children:
+                    child_dist = min_distance_to_bounding_box(user_location, child.bounding_box)
+                    if child_dist <= distance_range and can_qualify(child.max_rating, child_dist):
+                        heapq.heappush(queue, (-child.max_rating, child_dist, next(counter), child))
+        self._record_node_visits(visits, leaves)
+
+        found.sort(key=lambda result: (-result[0], result[1]))
+        if include_ties and len(top_keys) == k:
+            results = [(dist, hospital) for rating, dist, hospital in found if rating >= top_keys[0][0]]
         else:
-            # If it's an internal node, recursively search each child node.
-            for child in node.children:
-                self._nearest_search(child, user_location, nearest_hospitals, max_results, distance_range)
+            results = [(dist, hospital) for rating, dist, hospital in found[:k]]
+        if return_distances:
+            return results
+        return [hospital for _, hospital in results]
+
+    @instrumented("rtree.delete")
     def delete_hospital(self, hospital):
-        """ Delete a hospital from the R-Tree. """
-        if self.root.delete(hospital):
-            if not self.root.children and not self.root.is_leaf:
-                # If the root becomes empty, reset to a new leaf node.
-                self.root = RTreeNode(is_leaf=True)
-            return True  # Hospital deleted successfully
-        return False  # Hospital not found
\ No newline at end of file
+        """ Delete a hospital (the same object that was inserted) from the R-Tree. """
+        leaf = self.leaf_of.pop(id(hospital), None)
+        if leaf is None:
+            return False  # Hospital not found
+        index = next(i for i, child in enumerate(leaf.children) if child is hospital)
+        leaf.remove_hospital_at(index)
+        self._repair_leaf(leaf)
+        return True  # Hospital deleted successfully
+
+    # Brings the tree up to date after a stored hospital's coordinates or rating changed in place.
+    # A hospital that still lies inside its leaf's box stays where it is and only the summaries above
+    # it are refreshed; one that moved out is taken out of its leaf and inserted again from the root.
+    def refresh_hospital(self, hospital):
+        leaf = self.leaf_of.get(id(hospital))
+        if leaf is None:
+            return False
+        index = next(i for i, child in enumerate(leaf.children) if child is hospital)
+        if leaf.is_within_bounding_box(hospital, leaf.bounding_box):
+            leaf.latitudes[index] = hospital['latitude']
+            leaf.longitudes[index] = hospital['longitude']
+            leaf.ratings[index] = hospital['rating']
+            if self._dirty_leaves is not None:
+                # A higher rating must be visible to queries at once; lower ones wait for end_batch().
+                node = leaf
+                while node is not None and hospital['rating'] > node.max_rating:
+                    node.max_rating = hospital['rating']
+                    node = node.parent
+            self._repair_leaf(leaf)
+        else:
+            del self.leaf_of[id(hospital)]
+            leaf.remove_hospital_at(index)
+            self._repair_leaf(leaf)
+            self.insert_hospital(hospital)
+        return True
+
+    # Starts a batch: deletes and in-place updates leave the affected leaves' bounding boxes and max
+    # ratings as they are (still valid upper bounds for every query) and end_batch() repairs them all at once.
+    def begin_batch(self):
+        self._dirty_leaves = {}  # Used as an insertion-ordered set
+
+    # Ends a batch, repairing every dirty node once, level by level from the leaves up.
+    def end_batch(self):
+        dirty, self._dirty_leaves = self._dirty_leaves, None
+        orphans = []
+        # All leaves are at the same depth, so each round holds the nodes of a single level.
+        while dirty:
+            parents = {}
+            for node in dirty:
+                if node.parent is None:
+                    node.adjust_bounding_box()  # The root
+                elif len(node.children) < self._min_children(node):
+                    node.parent.children.remove(node)
+                    parents[node.parent] = None
+                    node.parent = None
+                    orphans.extend(_subtree_hospitals(node))
+                else:
+                    # No early stop here: a split during the batch may already have tightened this
+                    # node while its ancestors still hold the stale summary.
+                    node.adjust_bounding_box()
+                    parents[node.parent] = None
+            dirty = parents
+        self._shrink_and_reinsert(orphans)
+
+    # Fewest children a non-root node may keep before it is dissolved.
+    def _min_children(self, node):
+        return self.min_leaf_entries if node.is_leaf else self.min_entries
+
+    # Repairs the tree above a leaf that lost a hospital or had one change in place,
+    # or only marks the leaf when a batch is open.
+    def _repair_leaf(self, leaf):
+        if self._dirty_leaves is None:
+            self._condense(leaf)
+        else:
+            self._dirty_leaves[leaf] = None
+
+    # Repairs the tree upwards from a leaf that just lost hospitals.
+    # Underfull nodes are detached and their hospitals reinserted; the others get their bounding box
+    # and max rating recomputed, stopping early once a node's summary no longer changes.
+    def _condense(self, node):
+        orphans = []
+        while node.parent is not None:
+            parent = node.parent
+            if len(node.children) < self._min_children(node):
+                # An underfull node is dissolved; its remaining hospitals get reinserted below.
+                parent.children.remove(node)
+                node.parent = None
+                orphans.extend(_subtree_hospitals(node))
+            else:
+                summary = (node.bounding_box, node.max_rating)
+                node.adjust_bounding_box()
+                if (node.bounding_box, node.max_rating) == summary:
+                    break  # Nothing above this node can have changed either.
+            node = parent
+        else:
+            node.adjust_bounding_box()
+        self._shrink_and_reinsert(orphans)
+
+    # Final step of a repair: drops redundant root levels and reinserts hospitals of dissolved nodes.
+    def _shrink_and_reinsert(self, orphans):
+        # Shorten the tree while the root is an internal node with a single child.
+        while not self.root.is_leaf and len(self.root.children) == 1:
+            self.root = self.root.children[0]
+            self.root.parent = None
+        if not self.root.is_leaf and not self.root.children:
+            # If the root becomes empty, reset to a new leaf node.
+            self.root = RTreeNode(is_leaf=True)
+        # Hospitals from dissolved underfull nodes go back in through the normal insert path.
+        for orphan in orphans:
+            self.insert_hospital(orphan)
\ No newline at end of file
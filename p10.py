@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+from array import array
+
+from p1 import _sort_tile_recursive
+
+# Number of locations handed to a worker at a time.
+BATCH_TASK_SIZE = 4096
+# Below this many locations the work is done in the calling process; starting workers would cost more.
+MIN_PARALLEL_LOCATIONS = 2 * BATCH_TASK_SIZE
+
+# The project a forked worker answers queries against, set by _start_worker in the worker itself.
+# It reaches the worker through fork (copy-on-write), so the indexes are never pickled or rebuilt,
+# and the parent process never stores it in a global that concurrent calls could overwrite.
+_worker_project = None
+
+
+def _start_worker(project):
+    global _worker_project
+    _worker_project = project
+
+
+def _answer_task(task, project=None):
+    """Answer one task of (task number, latitudes, longitudes, k, radius) against the project.
+
+    In a worker the project is the one the pool started it with.
+    """
+    if project is None:
+        project = _worker_project
+    number, latitudes, longitudes, k, radius = task
+    ids, distances = array('q', [-1]) * (len(latitudes) * k), array('d', [float('inf')]) * (len(latitudes) * k)
+    locations = list(zip(latitudes, longitudes))
+    for row, results in enumerate(project.search_nearest_batch(locations, k, radius)):
+        for column, (distance, hospital) in enumerate(results):
+            ids[row * k + column] = hospital['id']
+            distances[row * k + column] = distance
+    return number, ids, distances
+
+
+def parallel_batch_nearest(project, locations, k=3, radius=None, workers=None):
+    """Find the k nearest hospitals (within `radius` km, if given) of every location.
+
+    Returns two flat arrays with k slots per location, in input order: hospital ids (array 'q') and
+    distances in km (array 'd'). Slots without a hospital hold id -1 and distance inf.
+    Large batches are cut into spatially coherent tasks and spread over `workers` processes
+    (default: one per CPU), which share the project's indexes through fork.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    latitudes = array('d', (location[0] for location in locations))
+    longitudes = array('d', (location[1] for location in locations))
+    count = len(latitudes)
+    ids, distances = array('q', [-1]) * (count * k), array('d', [float('inf')]) * (count * k)
+    if not count:
+        return ids, distances
+
+    # Tasks of neighbouring locations, so each worker's queries touch the same part of the tree.
+    tiles = _sort_tile_recursive(range(count), lambda i: (latitudes[i], longitudes[i]), BATCH_TASK_SIZE)
+    tasks = [(number, array('d', (latitudes[i] for i in tile)), array('d', (longitudes[i] for i in tile)), k, radius)
+             for number, tile in enumerate(tiles)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers > 1 and count >= MIN_PARALLEL_LOCATIONS and 'fork' in multiprocessing.get_all_start_methods():
+        # With fork the initializer's arguments are inherited by the workers rather than pickled.
+        with multiprocessing.get_context('fork').Pool(workers, initializer=_start_worker, initargs=(project,)) as pool:
+            answers = list(pool.imap_unordered(_answer_task, tasks))
+    else:
+        answers = (_answer_task(task, project) for task in tasks)
+    for number, task_ids, task_distances in answers:
+        for row, i in enumerate(tiles[number]):
+            ids[i * k:(i + 1) * k] = task_ids[row * k:(row + 1) * k]
+            distances[i * k:(i + 1) * k] = task_distances[row * k:(row + 1) * k]
+    return ids, distances
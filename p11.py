@@ -0,0 +1,212 @@
+import math
+import time
+from collections import OrderedDict
+
+from p1 import bounding_box_distance_bounds
+
+# Size in degrees of the grid cells QueryCache files its entries under, so an invalidation only
+# checks the entries near a change (about 11 km north to south).
+INDEX_CELL_DEGREES = 0.1
+# Entries whose region of influence covers more index cells than this are checked on every invalidation.
+MAX_INDEX_CELLS = 64
+EARTH_RADIUS_KM = 6371
+
+# Characters of the geohash alphabet, each standing for 5 bits.
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+_GEOHASH_BITS = {char: index for index, char in enumerate(_GEOHASH_ALPHABET)}
+
+
+def geohash_encode(lat, lon, precision=7):
+    """Return the geohash of a location: `precision` characters, interleaving longitude and latitude bits."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        # Even bits halve the longitude range, odd bits the latitude range.
+        value, interval = (lon, lon_range) if even else (lat, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return the cell of a geohash as a bounding box ((min_lat, min_lon), (max_lat, max_lon))."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _GEOHASH_BITS[char]
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return ((lat_range[0], lon_range[0]), (lat_range[1], lon_range[1]))
+
+
+# A cached answer with what is needed to expire or invalidate it: the bounding box of its geohash cell,
+# how far beyond that cell a change to the hospitals could alter the answer, and the index cells it is
+# filed under (None when it is checked on every invalidation).
+class _CacheEntry:
+    __slots__ = ('result', 'cell_box', 'reach', 'expires', 'index_cells')
+
+    def __init__(self, result, cell_box, reach, expires, index_cells):
+        self.result = result
+        self.cell_box = cell_box
+        self.reach = reach
+        self.expires = expires
+        self.index_cells = index_cells
+
+
+def _index_rows_and_columns(min_lat, max_lat, min_lon, max_lon):
+    """Rows and columns of the INDEX_CELL_DEGREES cells overlapping a box; longitudes may run past +-180."""
+    rows = range(int((max(min_lat, -90.0) + 90) // INDEX_CELL_DEGREES), int((min(max_lat, 90.0) + 90) // INDEX_CELL_DEGREES) + 1)
+    columns = range(int((min_lon + 180) // INDEX_CELL_DEGREES), int((max_lon + 180) // INDEX_CELL_DEGREES) + 1)
+    return rows, columns
+
+
+def _index_cells(box):
+    """Keys of the index cells overlapping a bounding box."""
+    (min_lat, min_lon), (max_lat, max_lon) = box
+    rows, columns = _index_rows_and_columns(min_lat, max_lat, min_lon, max_lon)
+    column_count = round(360 / INDEX_CELL_DEGREES)
+    return [(row, column % column_count) for row in rows for column in columns]
+
+
+def _reach_cells(box, reach):
+    """Keys of the index cells holding every location within `reach` km of a bounding box, or None when
+    that region is too large to file (an infinite reach, a pole within reach, or over MAX_INDEX_CELLS cells)."""
+    if reach == math.inf:
+        return None
+    (min_lat, min_lon), (max_lat, max_lon) = box
+    # A little slack so rounding never leaves out a cell on the edge of the region.
+    span = math.degrees(reach / EARTH_RADIUS_KM) + 1e-9
+    min_lat, max_lat = min_lat - span, max_lat + span
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if min_lat <= -90 or max_lat >= 90 or span >= 90 or math.sin(math.radians(span)) >= cos_lat:
+        return None
+    # Widest longitude gap from a point of the box to a location `reach` away.
+    lon_span = math.degrees(math.asin(math.sin(math.radians(span)) / cos_lat)) + 1e-9
+    rows, columns = _index_rows_and_columns(min_lat, max_lat, min_lon - lon_span, max_lon + lon_span)
+    if len(rows) * len(columns) > MAX_INDEX_CELLS:
+        return None
+    return _index_cells(((min_lat, min_lon - lon_span), (max_lat, max_lon + lon_span)))
+
+
+class QueryCache:
+    """LRU cache with a time-to-live for location queries, keyed on (query type, geohash cell, k, radius).
+
+    Locations in the same geohash cell share one answer, so `precision` sets how far apart two locations
+    may be and still get the same results (precision 7 cells are about 150 m across). When hospitals are
+    added, moved or removed, only entries whose search region overlaps the changed location's cell are
+    evicted. Entries are filed under the cells of a coarse grid that their search region covers, so an
+    invalidation only checks the entries filed near the change. `hits` and `misses` count lookups.
+    """
+
+    def __init__(self, max_entries=4096, ttl=60.0, precision=7, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.precision = precision
+        self.clock = clock
+        self.entries = OrderedDict()  # Least recently used first
+        self.by_cell = {}  # index cell -> set of keys of the entries filed under it
+        self.unfiled = set()  # keys of the entries checked on every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind, location, k=None, radius=None):
+        """Return the cache key of a query at a location."""
+        return (kind, geohash_encode(location[0], location[1], self.precision), k, radius)
+
+    def get(self, key):
+        """Return the cached answer for a key, or None if it is missing or has expired."""
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires <= self.clock():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.result
+
+    def put(self, key, result, reach):
+        """Cache an answer. `reach` (km, may be inf) is how far from the query location a change to the
+        hospitals could alter it, e.g. the distance of the k-th nearest hospital or the search radius."""
+        if key in self.entries:
+            self._remove(key)
+        cell_box = geohash_bounds(key[1])
+        entry = self.entries[key] = _CacheEntry(result, cell_box, reach, self.clock() + self.ttl, _reach_cells(cell_box, reach))
+        if entry.index_cells is None:
+            self.unfiled.add(key)
+        else:
+            for cell in entry.index_cells:
+                self.by_cell.setdefault(cell, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        if entry.index_cells is None:
+            self.unfiled.discard(key)
+            return
+        for cell in entry.index_cells:
+            keys = self.by_cell[cell]
+            keys.discard(key)
+            if not keys:
+                del self.by_cell[cell]
+
+    def invalidate(self, locations):
+        """Evict every entry whose search region overlaps the cell of any of the given (lat, lon) locations.
+
+        Returns the number of entries evicted.
+        """
+        cells = {geohash_encode(lat, lon, self.precision) for lat, lon in locations}
+        if not cells or not self.entries:
+            return 0
+        if len(cells) > len(self.entries):
+            # A change this widespread touches most entries anyway; dropping them all is cheaper than checking.
+            evicted = len(self.entries)
+            self.clear()
+            return evicted
+        stale = set()
+        for cell in cells:
+            cell_box = geohash_bounds(cell)
+            candidates = set(self.unfiled)
+            for index_cell in _index_cells(cell_box):
+                candidates.update(self.by_cell.get(index_cell, ()))
+            for key in candidates - stale:
+                entry = self.entries[key]
+                if entry.reach == math.inf or bounding_box_distance_bounds(entry.cell_box, cell_box)[0] <= entry.reach:
+                    stale.add(key)
+        for key in stale:
+            self._remove(key)
+        return len(stale)
+
+    def clear(self):
+        """Drop every entry (the hit and miss counters are kept)."""
+        self.entries.clear()
+        self.by_cell.clear()
+        self.unfiled.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Return the number of entries, hits and misses, and the hit rate."""
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
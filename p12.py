@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import math
+from array import array
+
+from p1 import SpatialIndex, calculate_distances, min_distance_to_bounding_box
+
+# Default cell size of GridIndex in degrees (about 1.1 km north to south).
+DEFAULT_CELL_DEGREES = 0.01
+EARTH_RADIUS_KM = 6371
+
+
+# The hospitals of one grid cell, with their coordinates kept in flat arrays like an R-Tree leaf.
+class _GridCell:
+    __slots__ = ('hospitals', 'latitudes', 'longitudes')
+
+    def __init__(self):
+        self.hospitals = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+
+    def append(self, hospital):
+        self.hospitals.append(hospital)
+        self.latitudes.append(hospital['latitude'])
+        self.longitudes.append(hospital['longitude'])
+
+    def index(self, hospital):
+        return next(i for i, stored in enumerate(self.hospitals) if stored is hospital)
+
+    def remove_at(self, index):
+        del self.hospitals[index]
+        del self.latitudes[index]
+        del self.longitudes[index]
+
+
+class GridIndex(SpatialIndex):
+    """Spatial engine that hashes hospitals into a uniform grid of latitude/longitude cells.
+
+    Only occupied cells are stored, in a dict keyed by (row, column), so inserts, deletes and moves are
+    O(1) and cost no rebalancing. Nearest-neighbour queries walk rings of cells outwards from the user's
+    cell and radius and window queries look at the cells the region covers, which makes the grid a good
+    fit for dense, evenly spread data and high update rates. `cell_degrees` is rounded so that the cells
+    tile the globe exactly; pick it close to the typical search radius.
+    """
+
+    def __init__(self, cell_degrees=DEFAULT_CELL_DEGREES):
+        super().__init__()
+        if not 0 < cell_degrees <= 90:
+            raise ValueError("cell_degrees must be in (0, 90]")
+        self.rows = round(180 / cell_degrees)
+        self.columns = round(360 / cell_degrees)
+        self.cell_height = 180 / self.rows
+        self.cell_width = 360 / self.columns
+        self.cells = {}  # (row, column) -> _GridCell, occupied cells only
+        self.cell_of = {}  # id(hospital) -> (row, column)
+
+    def _cell_key(self, lat, lon):
+        row = min(max(int((lat + 90) // self.cell_height), 0), self.rows - 1)
+        column = int(((lon + 180) % 360) // self.cell_width) % self.columns
+        return row, column
+
+    def _cell_box(self, key):
+        row, column = key
+        min_lat, min_lon = row * self.cell_height - 90, column * self.cell_width - 180
+        return ((min_lat, min_lon), (min_lat + self.cell_height, min_lon + self.cell_width))
+
+    # Chebyshev distance in cells between two keys, with columns wrapping around the antimeridian.
+    def _ring_of(self, key, centre):
+        column_gap = abs(key[1] - centre[1])
+        return max(abs(key[0] - centre[0]), min(column_gap, self.columns - column_gap))
+
+    def insert_hospital(self, hospital):
+        key = self._cell_key(hospital['latitude'], hospital['longitude'])
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = _GridCell()
+        cell.append(hospital)
+        self.cell_of[id(hospital)] = key
+
+    def delete_hospital(self, hospital):
+        key = self.cell_of.pop(id(hospital), None)
+        if key is None:
+            return False
+        cell = self.cells[key]
+        cell.remove_at(cell.index(hospital))
+        if not cell.hospitals:
+            del self.cells[key]
+        return True
+
+    # A hospital that stays in its cell only has its coordinates updated; one that left it moves cells.
+    def refresh_hospital(self, hospital):
+        key = self.cell_of.get(id(hospital))
+        if key is None:
+            return False
+        if self._cell_key(hospital['latitude'], hospital['longitude']) != key:
+            return super().refresh_hospital(hospital)
+        cell = self.cells[key]
+        index = cell.index(hospital)
+        cell.latitudes[index] = hospital['latitude']
+        cell.longitudes[index] = hospital['longitude']
+        return True
+
+    def __len__(self):
+        return len(self.cell_of)
+
+    def __contains__(self, hospital):
+        return id(hospital) in self.cell_of
+
+    def all_hospitals(self):
+        return [hospital for cell in self.cells.values() for hospital in cell.hospitals]
+
+    def search_nearest(self, user_location, max_results=3, distance_range=None, return_distances=False):
+        if max_results is None:
+            if distance_range is None:
+                results = self._scan(user_location, self.cells.values())
+            else:
+                results = self._range_search(user_location, distance_range)
+        else:
+            results = self._nearest_search(user_location, max_results, distance_range)
+        if return_distances:
+            return results
+        return [hospital for _, hospital in results]
+
+    # Every (distance, hospital) pair of the given cells, nearest first.
+    def _scan(self, user_location, cells, distance_range=math.inf):
+        results = []
+        visits = 0
+        for cell in cells:
+            visits += 1
+            distances = calculate_distances(user_location, cell.latitudes, cell.longitudes)
+            results.extend((dist, hospital) for dist, hospital in zip(distances, cell.hospitals) if dist <= distance_range)
+        self._record_node_visits(visits, visits)
+        results.sort(key=lambda result: result[0])
+        return results
+
+    # Smallest distance (km) from a location to anything outside the block of cells within `ring` rings
+    # of its own cell: the nearer of the block's northern and southern edges and its bounding meridians.
+    def _ring_exit_distance(self, user_location, centre, ring):
+        lat, lon = user_location[0], (user_location[1] + 180) % 360 - 180
+        row, column = centre
+        north = (row + ring + 1) * self.cell_height - 90
+        south = (row - ring) * self.cell_height - 90
+        exits = [math.inf if north >= 90 else math.radians(north - lat),
+                 math.inf if south <= -90 else math.radians(lat - south)]
+        if 2 * ring + 1 < self.columns:
+            east = (column + ring + 1) * self.cell_width - 180
+            west = (column - ring) * self.cell_width - 180
+            gap = math.radians(min(east - lon, lon - west, 90))
+            # Great-circle distance from the location to the nearest point of a meridian `gap` away.
+            exits.append(math.asin(math.cos(math.radians(lat)) * math.sin(gap)))
+        return EARTH_RADIUS_KM * max(min(exits), 0.0)
+
+    # The occupied cells exactly `ring` rings away from the centre cell.
+    def _ring_cells(self, centre, ring):
+        row, column = centre
+        if ring == 0:
+            keys = [centre]
+        else:
+            keys = set()
+            for r in range(max(row - ring, 0), min(row + ring, self.rows - 1) + 1):
+                step = 1 if abs(r - row) == ring else 2 * ring
+                for c in range(column - ring, column + ring + 1, step):
+                    keys.add((r, c % self.columns))
+            keys = [key for key in keys if self._ring_of(key, centre) == ring]
+        return [self.cells[key] for key in keys if key in self.cells]
+
+    # k-nearest neighbour search over rings of cells around the user's cell.
+    # A ring is only opened while its exit distance bound could still beat the k-th result. Once the rings
+    # walked so far span more cells than are occupied, the rest of the grid is scanned directly instead.
+    def _nearest_search(self, user_location, max_results, distance_range):
+        if max_results <= 0 or not self.cells:
+            self._record_node_visits(0)
+            return []
+        limit = math.inf if distance_range is None else distance_range
+        centre = self._cell_key(*user_location)
+        best = []  # Max-heap of (-distance, -order, hospital): the current k-th result is at the top.
+        counter = itertools.count()
+        visits = 0
+        ring = 0
+        spanned = 0  # Cells covered by the rings walked so far, occupied or not
+        max_ring = max(self.rows, self.columns // 2 + 1)
+        while ring <= max_ring:
+            if ring > 0:
+                bound = self._ring_exit_distance(user_location, centre, ring - 1)
+                if bound > limit or (len(best) == max_results and bound > -best[0][0]):
+                    break
+            spanned += max(8 * ring, 1)
+            scan_rest = spanned > len(self.cells)
+            if scan_rest:
+                cells = [cell for key, cell in self.cells.items() if self._ring_of(key, centre) >= ring]
+            else:
+                cells = self._ring_cells(centre, ring)
+            for cell in cells:
+                visits += 1
+                distances = calculate_distances(user_location, cell.latitudes, cell.longitudes)
+                for dist, hospital in zip(distances, cell.hospitals):
+                    if dist > limit:
+                        continue
+                    if len(best) < max_results:
+                        heapq.heappush(best, (-dist, -next(counter), hospital))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, -next(counter), hospital))
+            if scan_rest:
+                break  # Every remaining cell has been scanned.
+            ring += 1
+        self._record_node_visits(visits, visits)
+        best.sort(reverse=True)
+        return [(-negative_dist, hospital) for negative_dist, _, hospital in best]
+
+    # Keys of the cells overlapping a latitude range and a (non-wrapping unless `all_columns`) longitude range,
+    # or None when that block has more cells than are occupied and the occupied ones should be filtered instead.
+    def _block_keys(self, min_lat, max_lat, min_lon, max_lon, all_columns=False):
+        first_row = self._cell_key(max(min_lat, -90), 0)[0]
+        last_row = self._cell_key(min(max_lat, 90), 0)[0]
+        if all_columns:
+            columns = range(self.columns)
+        else:
+            first_column = int((min_lon + 180) // self.cell_width)
+            last_column = min(int((max_lon + 180) // self.cell_width), first_column + self.columns - 1)
+            columns = range(first_column, last_column + 1)
+        if (last_row - first_row + 1) * len(columns) > len(self.cells):
+            return None
+        return [(row, column % self.columns) for row in range(first_row, last_row + 1) for column in columns]
+
+    # Radius search over the cells that can overlap the circle around the user.
+    def _range_search(self, user_location, distance_range):
+        lat, lon = user_location
+        span = math.degrees(distance_range / EARTH_RADIUS_KM)
+        cos_lat = math.cos(math.radians(lat))
+        if lat + span >= 90 or lat - span <= -90 or span >= 90 or math.sin(math.radians(span)) >= cos_lat:
+            keys = self._block_keys(lat - span, lat + span, 0, 0, all_columns=True)  # The circle reaches all longitudes.
+        else:
+            # Widest longitude gap of a spherical cap of this radius.
+            lon_span = math.degrees(math.asin(math.sin(math.radians(span)) / cos_lat))
+            keys = self._block_keys(lat - span, lat + span, lon - lon_span, lon + lon_span)
+        if keys is None:
+            cells = [cell for key, cell in self.cells.items()
+                     if min_distance_to_bounding_box(user_location, self._cell_box(key)) <= distance_range]
+        else:
+            cells = [self.cells[key] for key in set(keys) if key in self.cells]
+        return self._scan(user_location, cells, distance_range)
+
+    def search_window(self, min_lat, min_lon, max_lat, max_lon):
+        keys = self._block_keys(min_lat, max_lat, min_lon, max_lon)
+        if keys is None:
+            cells = self.cells.values()
+        else:
+            cells = [self.cells[key] for key in set(keys) if key in self.cells]
+        results = []
+        visits = 0
+        for cell in cells:
+            visits += 1
+            results.extend(hospital for hospital, lat, lon in zip(cell.hospitals, cell.latitudes, cell.longitudes)
+                           if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon)
+        self._record_node_visits(visits, visits)
+        return results
@@ -0,0 +1,361 @@
+import heapq
+import json
+import os
+
+from p1 import min_distance_to_bounding_box
+from p4 import HospitalProject
+from p5 import SearchHistory
+from p9 import DEFAULT_CHUNK_SIZE, chunked, normalise_fields, stream_hospitals
+from p10 import parallel_batch_nearest
+
+# Default shard tile size in degrees (about 220 km north to south).
+DEFAULT_TILE_DEGREES = 2.0
+
+
+class ShardedHospitalProject:
+    """Hospitals partitioned by latitude/longitude tile into independent HospitalProject shards.
+
+    Each shard holds the hospitals of one tile and is created on first use by `make_shard()` (default:
+    an empty HospitalProject), so shards can use any spatial engine or cache. Location queries go only
+    to the shards whose tile could hold a result, nearest tiles first, and the per-shard results are
+    merged by distance or rating. Ids are assigned here and are unique across shards.
+
+    All shards live in this process and are queried one after another: sharding keeps each index
+    small and lets a query skip distant tiles, but it does not spread memory or work over machines.
+    Shards are only used through HospitalProject's mutation methods and its plain query interface
+    (search_nearest, search_window, search_name, ...), which is what a remote shard would have to offer.
+    """
+
+    def __init__(self, tile_degrees=DEFAULT_TILE_DEGREES, make_shard=HospitalProject):
+        if not 0 < tile_degrees <= 90:
+            raise ValueError("tile_degrees must be in (0, 90]")
+        # Tiles are rounded to cover the globe exactly.
+        self.rows = round(180 / tile_degrees)
+        self.columns = round(360 / tile_degrees)
+        self.tile_height = 180 / self.rows
+        self.tile_width = 360 / self.columns
+        self.make_shard = make_shard
+        self.shards = {}  # (row, column) -> shard project
+        self.tile_of = {}  # hospital id -> (row, column)
+        self.next_id = 1
+        self.search_history = SearchHistory(lookup=self.get_hospital)
+        self._batch_shards = None  # Shards in the current batch, by id(), while apply_batch() runs
+
+    def _tile_key(self, lat, lon):
+        row = min(max(int((lat + 90) // self.tile_height), 0), self.rows - 1)
+        column = int(((lon + 180) % 360) // self.tile_width) % self.columns
+        return row, column
+
+    def _tile_box(self, key):
+        row, column = key
+        min_lat, min_lon = row * self.tile_height - 90, column * self.tile_width - 180
+        return ((min_lat, min_lon), (min_lat + self.tile_height, min_lon + self.tile_width))
+
+    def _shards_near(self, user_location, distance_range=None):
+        # (distance to tile, shard) for every shard whose tile is within range, nearest first
+        near = []
+        for key, shard in self.shards.items():
+            dist = min_distance_to_bounding_box(user_location, self._tile_box(key))
+            if distance_range is None or dist <= distance_range:
+                near.append((dist, key, shard))
+        near.sort(key=lambda entry: entry[:2])
+        return [(dist, shard) for dist, _, shard in near]
+
+    def __len__(self):
+        return len(self.tile_of)
+
+    @property
+    def hospitals(self):
+        # All hospital records, shard by shard
+        return [record for shard in self.shards.values() for record in shard.hospitals]
+
+    def _claim_id(self, hospital, pending=()):
+        # A copy of the hospital carrying an id that is unique across all shards (and the `pending` ids)
+        hospital = dict(hospital)
+        if hospital.get('id') is None:
+            hospital['id'] = self.next_id
+        elif hospital['id'] in self.tile_of or hospital['id'] in pending:
+            raise ValueError(f"Hospital id {hospital['id']} is already in use")
+        self.next_id = max(self.next_id, hospital['id'] + 1)
+        return hospital
+
+    def _shard_at(self, key):
+        # The shard of a tile, created if needed; inside apply_batch() it joins the batch
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = self.shards[key] = self.make_shard()
+        if self._batch_shards is not None and id(shard) not in self._batch_shards:
+            shard.begin_batch()
+            self._batch_shards[id(shard)] = shard
+        return shard
+
+    def _drop_if_empty(self, key):
+        # Drop an empty shard so queries no longer visit it
+        if not len(self.shards[key]):
+            del self.shards[key]
+
+    def add_hospital(self, hospital):
+        # Store the hospital in the shard of its tile and return its record
+        hospital = self._claim_id(hospital)
+        key = self._tile_key(hospital['latitude'], hospital['longitude'])
+        record = self._shard_at(key).add_hospital(hospital)
+        self.tile_of[record.id] = key
+        return record
+
+    def add_hospitals(self, hospitals):
+        # Add a batch of hospitals; each shard gets its share as one batch, so it can bulk load it
+        by_tile = {}
+        pending = set()
+        for hospital in hospitals:
+            hospital = self._claim_id(hospital, pending)
+            pending.add(hospital['id'])
+            by_tile.setdefault(self._tile_key(hospital['latitude'], hospital['longitude']), []).append(hospital)
+        records = []
+        for key, group in by_tile.items():
+            for record in self._shard_at(key).add_hospitals(group):
+                self.tile_of[record.id] = key
+                records.append(record)
+        return records
+
+    def load_hospitals(self, path, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, skip_invalid=False, rejected=None):
+        # Stream hospitals from a CSV or JSONL file into the shards; see HospitalProject.load_hospitals
+        added = 0
+        for chunk in chunked(stream_hospitals(path, file_format, skip_invalid, rejected), chunk_size):
+            added += len(self.add_hospitals(chunk))
+        return added
+
+    def get_hospital(self, hospital_id):
+        # The record with this id, or None
+        key = self.tile_of.get(hospital_id)
+        return None if key is None else self.shards[key].get_hospital(hospital_id)
+
+    def delete_hospital_by_id(self, hospital_id):
+        # Remove a hospital from its shard; shards left empty are dropped so queries no longer visit them
+        key = self.tile_of.pop(hospital_id, None)
+        if key is None:
+            return None
+        record = self._shard_at(key).delete_hospital_by_id(hospital_id)
+        self._drop_if_empty(key)
+        return record
+
+    def update_hospital(self, hospital_id, **fields):
+        # Change fields of a stored hospital and return its record (None if there is no such id).
+        # The fields are validated first (see p9.normalise_fields). A hospital moved into another tile is
+        # added to the new tile's shard under the same id before it leaves the old one, so a failure
+        # leaves it where it was.
+        fields = normalise_fields(fields)
+        key = self.tile_of.get(hospital_id)
+        if key is None:
+            return None
+        shard = self._shard_at(key)
+        record = shard.get_hospital(hospital_id)
+        lat, lon = fields.get('latitude', record.latitude), fields.get('longitude', record.longitude)
+        new_key = self._tile_key(lat, lon)
+        if new_key == key:
+            return shard.update_hospital(hospital_id, **fields)
+        moved = record.to_dict()
+        moved.update(fields)
+        try:
+            moved_record = self._shard_at(new_key).add_hospital(moved)
+        except Exception:
+            self._drop_if_empty(new_key)
+            raise
+        shard.delete_hospital_by_id(hospital_id)
+        self._drop_if_empty(key)
+        self.tile_of[hospital_id] = new_key
+        return moved_record
+
+    def apply_batch(self, mutations):
+        # Apply a list of mutations as HospitalProject.apply_batch does and return their results in order.
+        # Every shard a mutation reaches defers its index repairs until the whole batch is done.
+        self._batch_shards = {}
+        results = []
+        try:
+            for mutation in mutations:
+                operation = mutation[0]
+                if operation == "add":
+                    results.append(self.add_hospital(mutation[1]))
+                elif operation == "update":
+                    results.append(self.update_hospital(mutation[1], **mutation[2]))
+                elif operation == "delete":
+                    results.append(self.delete_hospital_by_id(mutation[1]))
+                else:
+                    raise ValueError(f"Unknown batch operation: {operation!r}")
+        finally:
+            shards, self._batch_shards = self._batch_shards, None
+            for shard in shards.values():
+                shard.end_batch()
+        return results
+
+    def save_snapshot(self, path):
+        # Write every shard's snapshot (see HospitalProject.save_snapshot) into the directory `path`,
+        # with a manifest of the tiles and the next free id
+        os.makedirs(path, exist_ok=True)
+        tiles = []
+        for (row, column), shard in self.shards.items():
+            name = f'shard-{row}-{column}.snap'
+            shard.save_snapshot(os.path.join(path, name))
+            tiles.append([row, column, name])
+        manifest = {"rows": self.rows, "columns": self.columns, "next_id": self.next_id, "tiles": tiles}
+        with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+
+    @classmethod
+    def load_snapshot(cls, path):
+        # Open a directory written by save_snapshot(). Each shard is memory-mapped as a read-only
+        # HospitalProject; only the id -> tile map is rebuilt, with one pass over the records.
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as file:
+            manifest = json.load(file)
+        project = cls(180 / manifest["rows"])
+        project.next_id = manifest["next_id"]
+        for row, column, name in manifest["tiles"]:
+            shard = HospitalProject.load_snapshot(os.path.join(path, name))
+            project.shards[row, column] = shard
+            for record in shard.hospitals:
+                project.tile_of[record.id] = (row, column)
+        return project
+
+    # The plain query interface of HospitalProject (no display, search history or cache), answered by
+    # merging the shards' answers; the p14 service and p10 batch queries use it.
+
+    def search_nearest(self, user_location, max_results=3, distance_range=None):
+        # (distance_km, record) pairs, nearest first. Shards are asked nearest tile first, and only while
+        # their tile is closer than the k-th result so far.
+        merged = []
+        if max_results == 0:
+            return merged
+        for tile_dist, shard in self._shards_near(user_location, distance_range):
+            if max_results is not None and len(merged) >= max_results and tile_dist > merged[-1][0]:
+                break
+            merged.extend(shard.search_nearest(user_location, max_results, distance_range))
+            merged.sort(key=lambda result: result[0])
+            if max_results is not None:
+                del merged[max_results:]
+        return merged
+
+    def search_nearest_batch(self, locations, k=3, distance_range=None):
+        # search_nearest() for many locations at once, one result list per location
+        return [self.search_nearest(location, k, distance_range) for location in locations]
+
+    def search_top_rated(self, user_location, distance_range, k=1, include_ties=False):
+        # (distance_km, record) pairs: each nearby shard's top k (with ties), merged best rating first and
+        # nearer first among equal ratings
+        found = []
+        for _, shard in self._shards_near(user_location, distance_range):
+            found.extend(shard.search_top_rated(user_location, distance_range, k, include_ties))
+        found.sort(key=lambda result: (-result[1]['rating'], result[0]))
+        if include_ties and k > 0 and len(found) > k:
+            kth_rating = found[k - 1][1]['rating']
+            return [result for result in found if result[1]['rating'] >= kth_rating]
+        return found[:k]
+
+    def search_window(self, min_lat, min_lon, max_lat, max_lon):
+        # Hospitals inside a latitude/longitude rectangle, from the shards whose tile overlaps it
+        results = []
+        for key, shard in self.shards.items():
+            (tile_min_lat, tile_min_lon), (tile_max_lat, tile_max_lon) = self._tile_box(key)
+            if tile_min_lat <= max_lat and min_lat <= tile_max_lat and tile_min_lon <= max_lon and min_lon <= tile_max_lon:
+                results.extend(shard.search_window(min_lat, min_lon, max_lat, max_lon))
+        return results
+
+    def _best_rated(self, hospitals, limit):
+        # Merge per-shard matches best rated first, keeping the `limit` best if a limit is given
+        if limit is None:
+            return sorted(hospitals, key=lambda hospital: -hospital['rating'])
+        return heapq.nsmallest(limit, hospitals, key=lambda hospital: -hospital['rating'])
+
+    def search_name(self, partial_name, limit=None):
+        # Name prefix matches from every shard, best rated first
+        return self._best_rated([hospital for shard in self.shards.values()
+                                 for hospital in shard.search_name(partial_name, limit)], limit)
+
+    def fuzzy_search_name(self, name, max_edits=2, limit=None):
+        # Names within max_edits typos of the text, from every shard, best rated first
+        return self._best_rated([hospital for shard in self.shards.values()
+                                 for hospital in shard.fuzzy_search_name(name, max_edits, limit)], limit)
+
+    def autocomplete_name(self, prefix, limit=5):
+        # Best-rated names starting with the prefix: each shard's top `limit`, merged
+        return self._best_rated([hospital for shard in self.shards.values()
+                                 for hospital in shard.autocomplete_name(prefix, limit)], limit)
+
+    def search_city(self, city_name, limit=None):
+        # Hospitals whose address mentions the city, from every shard, best rated first
+        return self._best_rated([hospital for shard in self.shards.values()
+                                 for hospital in shard.search_city(city_name, limit)], limit)
+
+    def find_nearest_hospitals(self, user_location, max_results=3, session=None):
+        nearest = [hospital for _, hospital in self.search_nearest(user_location, max_results)]
+        self.search_history.record("nearest", (user_location, max_results), nearest, session=session)
+        return nearest
+
+    def find_nearest_hospitals_within_range(self, user_location, range_km, max_results=None, session=None):
+        # Hospitals within range_km, nearest first, from the shards whose tile reaches into the range
+        in_range = [hospital for _, hospital in self.search_nearest(user_location, max_results, range_km)]
+        self.search_history.record("range", (user_location, range_km), in_range, session=session)
+        return in_range
+
+    def batch_nearest(self, locations, k=3, radius=None, workers=None):
+        # The k nearest hospitals of many locations as two flat arrays; see p10.parallel_batch_nearest
+        return parallel_batch_nearest(self, locations, k, radius, workers)
+
+    def coverage_analysis(self, demand_locations, radius_km):
+        # See HospitalProject.coverage_analysis. Each shard is given only the demand points within
+        # radius_km of its tile; a point is uncovered if no shard covers it.
+        counts = {}
+        covered = [False] * len(demand_locations)
+        for key, shard in self.shards.items():
+            tile_box = self._tile_box(key)
+            near = [index for index, location in enumerate(demand_locations)
+                    if min_distance_to_bounding_box(location, tile_box) <= radius_km]
+            shard_counts, shard_uncovered = shard.coverage_analysis([demand_locations[index] for index in near], radius_km)
+            counts.update(shard_counts)
+            # The uncovered points come back in the order they were given, so they can be matched up in one pass.
+            uncovered = iter(shard_uncovered)
+            next_uncovered = next(uncovered, None)
+            for index in near:
+                if next_uncovered is not None and tuple(demand_locations[index]) == tuple(next_uncovered):
+                    next_uncovered = next(uncovered, None)
+                else:
+                    covered[index] = True
+        return counts, [tuple(location) for location, is_covered in zip(demand_locations, covered) if not is_covered]
+
+    def find_hospitals_in_window(self, min_lat, min_lon, max_lat, max_lon, session=None):
+        results = self.search_window(min_lat, min_lon, max_lat, max_lon)
+        self.search_history.record("window", (min_lat, min_lon, max_lat, max_lon), results, session=session)
+        return results
+
+    def best_hospitals_within_range(self, user_location, distance_range=1, session=None):
+        # Every hospital sharing the highest rating in range, across all shards that reach into it
+        best_hospitals = [hospital for _, hospital in self.search_top_rated(user_location, distance_range, 1, True)]
+        if not best_hospitals:
+            return "No hospitals found within the specified distance range."
+        self.search_history.record("best", (user_location, distance_range), best_hospitals, session=session)
+        return best_hospitals
+
+    def top_rated_hospitals_within_range(self, user_location, distance_range, k=3, session=None):
+        # The k best-rated hospitals within the given distance range, best first
+        top_rated = [hospital for _, hospital in self.search_top_rated(user_location, distance_range, k)]
+        self.search_history.record("top_rated", (user_location, distance_range, k), top_rated, session=session)
+        return top_rated
+
+    def find_hospital_by_hospitalname(self, partial_name, max_edits=2, session=None):
+        # Name matches from every shard, best rated first; typo-tolerant only if no shard has a prefix match
+        matched = self.search_name(partial_name)
+        if not matched:
+            matched = self.fuzzy_search_name(partial_name, max_edits)
+        self.search_history.record("name", (partial_name,), matched, session=session)
+        return matched
+
+    def autocomplete_hospital_name(self, prefix, limit=5):
+        return self.autocomplete_name(prefix, limit)
+
+    def find_hospital_by_city(self, city_name, session=None):
+        # Hospitals whose address mentions the city, from every shard, sorted by rating in decreasing order
+        matched = self.search_city(city_name)
+        self.search_history.record("city", (city_name,), matched, session=session)
+        return matched
+
+    def shard_sizes(self):
+        # Number of hospitals per shard tile, keyed by the tile's ((min_lat, min_lon), (max_lat, max_lon))
+        return {self._tile_box(key): len(shard) for key, shard in self.shards.items()}
@@ -0,0 +1,392 @@
+import asyncio
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from urllib.parse import parse_qs, urlsplit
+
+from p4 import HospitalProject
+from p9 import normalise_fields, normalise_hospital
+from p15 import STATS
+
+# Largest request body accepted, in bytes.
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# Most results one query returns, and the largest `k` accepted.
+MAX_RESULTS = 1000
+# Largest `max_edits` accepted by /name; the fuzzy search's cost grows steeply with it.
+MAX_EDITS = 3
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+            500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    """An error answered with an HTTP status code and a JSON {"error": message} body."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _record(hospital, distance=None):
+    record = hospital.to_dict() if hasattr(hospital, 'to_dict') else dict(hospital)
+    if distance is not None:
+        record['distance_km'] = distance
+    return record
+
+
+def _number(params, name, default=None, convert=float):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise HTTPError(400, f"missing parameter: {name}")
+        return default
+    try:
+        value = convert(values[0])
+    except ValueError:
+        raise HTTPError(400, f"{name} is not a valid number: {values[0]!r}") from None
+    if not math.isfinite(value):
+        raise HTTPError(400, f"{name} is not a finite number: {values[0]!r}")
+    return value
+
+
+def _location(params):
+    lat, lon = _number(params, 'lat'), _number(params, 'lon')
+    if not -90.0 <= lat <= 90.0:
+        raise HTTPError(400, f"lat must be between -90 and 90, got {lat}")
+    if not -180.0 <= lon <= 180.0:
+        raise HTTPError(400, f"lon must be between -180 and 180, got {lon}")
+    return lat, lon
+
+
+def _radius(params, default=None):
+    radius = _number(params, 'radius', default)
+    if radius < 0:
+        raise HTTPError(400, f"radius must not be negative, got {radius}")
+    return radius
+
+
+def _bounded(params, name, default, low, high):
+    value = _number(params, name, default, int)
+    if not low <= value <= high:
+        raise HTTPError(400, f"{name} must be between {low} and {high}")
+    return value
+
+
+def _text(params, name):
+    values = params.get(name)
+    if not values or not values[0].strip():
+        raise HTTPError(400, f"missing parameter: {name}")
+    return values[0]
+
+
+def _hospital_id(value):
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"hospital id is not an integer: {value!r}")
+    return value
+
+
+def validate_mutation(mutation):
+    """Check one decoded mutation and return it normalised as HospitalProject.apply_batch expects it.
+
+    Adds are normalised with p9.normalise_hospital and update fields with p9.normalise_fields.
+    Raises ValueError for a malformed mutation.
+    """
+    if not isinstance(mutation, (list, tuple)) or not mutation:
+        raise ValueError("a mutation must be a non-empty list")
+    operation, arguments = mutation[0], mutation[1:]
+    shapes = {"add": 1, "update": 2, "delete": 1}
+    if operation not in shapes:
+        raise ValueError(f"unknown operation: {operation!r}")
+    if len(arguments) != shapes[operation]:
+        raise ValueError(f"{operation} takes {shapes[operation]} argument(s), got {len(arguments)}")
+    if operation == "add":
+        return ("add", normalise_hospital(arguments[0]))
+    if operation == "delete":
+        return ("delete", _hospital_id(arguments[0]))
+    if not isinstance(arguments[1], dict):
+        raise ValueError("update fields must be an object")
+    return ("update", _hospital_id(arguments[0]), normalise_fields(arguments[1]))
+
+
+def _remove_snapshot(path):
+    # Delete a snapshot file, or the directory of a sharded project's snapshot, ignoring errors
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class QueryService:
+    """Asyncio JSON-over-HTTP query service over a HospitalProject or a p13.ShardedHospitalProject.
+
+    Queries run against an immutable version of the indexes: a snapshot (p8) written from the project
+    and memory-mapped back in. Mutations are applied to the project by a background writer, which
+    then writes a new version and swaps it in with a single assignment. So readers never wait
+    for a writer and never see a half-applied batch. Mutations arriving while a version is being built
+    are applied together, so bulk updates cost one rebuild per round rather than one per request.
+
+    GET endpoints (answers are {"version": n, "results": [...]}):
+        /nearest?lat=&lon=&k=3             k nearest hospitals, with distance_km
+        /range?lat=&lon=&radius=[&k=]      hospitals within radius km, nearest first
+        /best?lat=&lon=&radius=1           hospitals sharing the top rating within radius km
+        /name?q=[&max_edits=2]             name prefix search, best rated first, typo-tolerant if nothing matches
+        /city?q=                           hospitals whose address mentions the city, best rated first
+        /health                            current version and hospital count
+        /stats                             instrumentation counters and latencies (see p15; off unless enabled)
+        /metrics                           the same in the Prometheus text format
+    Every query returns at most MAX_RESULTS results; `k` above that or `max_edits` above MAX_EDITS gets a
+    400, as does a lat, lon or radius that is not a finite number, a lat outside [-90, 90], a lon outside
+    [-180, 180] or a negative radius. Queries run in the event loop's default executor, so a slow one does
+    not hold up the others.
+    POST /mutations takes a JSON list of mutations as accepted by HospitalProject.apply_batch
+    (["add", {...}], ["update", id, {...}], ["delete", id]) and answers once they are visible to queries.
+    Every mutation is validated (see validate_mutation) before any is applied, and a malformed one gets
+    the request a 400 with nothing applied. If one fails against the data, e.g. an add reusing an id,
+    the request gets a 400 and the mutations before it stay applied. If a new version cannot be built,
+    the round's mutations are rolled back and its requests fail.
+    """
+
+    def __init__(self, project, snapshot_dir=None):
+        # `project` becomes the writer's private copy: after this only the service may change it.
+        self.project = project
+        self.snapshot_dir = snapshot_dir if snapshot_dir is not None else tempfile.mkdtemp(prefix='geohealth-')
+        self.version = 0
+        self.current = None  # The published, read-only project
+        self._published = (0, None)  # (version, project), swapped in one assignment for queries to read
+        self._current_path = None
+        self._pending = []  # (mutations, future) waiting for the writer
+        self._writer = None
+        self._publish(*self._build_version())
+
+    def _build_version(self):
+        # Write the project out as the next version and map it back in read-only (runs off the event loop)
+        version = self.version + 1
+        path = os.path.join(self.snapshot_dir, f'index-{version}.snap')
+        try:
+            self.project.save_snapshot(path)
+            return version, path, type(self.project).load_snapshot(path)
+        except BaseException:
+            _remove_snapshot(path)
+            raise
+
+    def _publish(self, version, path, snapshot):
+        old_path = self._current_path
+        self._published = (version, snapshot)
+        self.version, self.current, self._current_path = version, snapshot, path
+        if old_path is not None:
+            # Queries still running on the old version in executor threads keep reading it through their
+            # mapping: removing the file only drops its name, and its pages stay valid until the last
+            # mapping of it goes away.
+            _remove_snapshot(old_path)
+
+    async def apply(self, mutations):
+        """Apply a list of mutations and return their results once a version containing them is published.
+
+        Raises ValueError, with nothing applied, if any mutation is malformed.
+        """
+        checked = []
+        for position, mutation in enumerate(mutations):
+            try:
+                checked.append(validate_mutation(mutation))
+            except ValueError as error:
+                raise ValueError(f"mutation {position}: {error}") from None
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((checked, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write_pending())
+        return await future
+
+    def _apply_round(self, batches):
+        # Apply each request's mutations in turn, so one bad request does not fail the others. If the
+        # new version cannot be built, the project is put back as it was so that it still matches the
+        # published version.
+        saved, next_id = self._save_touched(batches)
+        outcomes = []
+        for mutations in batches:
+            try:
+                outcomes.append((True, self.project.apply_batch(mutations)))
+            except Exception as error:
+                outcomes.append((False, error))
+        try:
+            return outcomes, self._build_version()
+        except BaseException:
+            self._rollback(saved, next_id)
+            raise
+
+    def _save_touched(self, batches):
+        # The records (as dicts, None if absent) the round's mutations may change, and the store's next id
+        saved = {}
+        for mutations in batches:
+            for mutation in mutations:
+                hospital_id = mutation[1].get('id') if mutation[0] == "add" else mutation[1]
+                if hospital_id is not None and hospital_id not in saved:
+                    record = self.project.get_hospital(hospital_id)
+                    saved[hospital_id] = None if record is None else record.to_dict()
+        return saved, self.project.next_id
+
+    def _rollback(self, saved, next_id):
+        # Undo a round: drop the records it added with fresh ids and restore every record it touched
+        undo = [("delete", record.id) for record in self.project.hospitals
+                if record.id >= next_id and record.id not in saved]
+        for hospital_id, before in saved.items():
+            record = self.project.get_hospital(hospital_id)
+            if before is None:
+                if record is not None:
+                    undo.append(("delete", hospital_id))
+            elif record is None:
+                undo.append(("add", before))
+            elif record.to_dict() != before:
+                undo.append(("update", hospital_id, {field: value for field, value in before.items() if field != 'id'}))
+        self.project.apply_batch(undo)
+        self.project.next_id = next_id
+
+    async def _write_pending(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            round_, self._pending = self._pending, []
+            try:
+                outcomes, built = await loop.run_in_executor(None, self._apply_round, [mutations for mutations, _ in round_])
+            except Exception as error:
+                for _, future in round_:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self._publish(*built)
+            for (_, future), (ok, result) in zip(round_, outcomes):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+    def query(self, path, params):
+        """Answer one GET endpoint from the current version; returns the JSON-ready response body
+        (plain text for /metrics). Safe to call from any thread."""
+        version, project = self._published  # One version for the whole query, even if a new one is swapped in
+        if path == '/health':
+            return {"version": version, "hospitals": len(project)}
+        if path == '/stats':
+            return STATS.stats()
+        if path == '/metrics':
+            return STATS.prometheus_text()
+        if path in ('/nearest', '/range', '/best'):
+            location = _location(params)
+            if path == '/nearest':
+                k = _bounded(params, 'k', 3, 0, MAX_RESULTS)
+                found = project.search_nearest(location, k)
+            elif path == '/range':
+                k = _bounded(params, 'k', MAX_RESULTS, 0, MAX_RESULTS)
+                found = project.search_nearest(location, k, _radius(params))
+            else:
+                found = project.search_top_rated(location, _radius(params, 1.0), k=1, include_ties=True)[:MAX_RESULTS]
+            results = [_record(hospital, dist) for dist, hospital in found]
+        elif path == '/name':
+            text = _text(params, 'q')
+            max_edits = _bounded(params, 'max_edits', 2, 0, MAX_EDITS)
+            found = project.search_name(text, limit=MAX_RESULTS)
+            if not found:
+                found = project.fuzzy_search_name(text, max_edits=max_edits, limit=MAX_RESULTS)
+            results = [_record(hospital) for hospital in found]
+        elif path == '/city':
+            results = [_record(hospital) for hospital in project.search_city(_text(params, 'q'), limit=MAX_RESULTS)]
+        else:
+            raise HTTPError(404, f"no such endpoint: {path}")
+        return {"version": version, "results": results}
+
+    async def _respond(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/mutations':
+            if method != 'POST':
+                raise HTTPError(405, "use POST for /mutations")
+            try:
+                mutations = json.loads(body or b'null')
+            except ValueError as error:
+                raise HTTPError(400, f"body is not valid JSON: {error}") from None
+            if not isinstance(mutations, list):
+                raise HTTPError(400, "body must be a JSON list of mutations")
+            try:
+                results = await self.apply(mutations)
+            except (ValueError, TypeError, KeyError, IndexError) as error:
+                raise HTTPError(400, f"mutation failed: {error}") from None
+            return {"version": self.version, "results": [None if record is None else _record(record) for record in results]}
+        if method != 'GET':
+            raise HTTPError(405, f"use GET for {url.path}")
+        return await asyncio.get_running_loop().run_in_executor(None, self.query, url.path, parse_qs(url.query))
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    parts = request_line.decode('latin-1').split()
+                    if len(parts) != 3:
+                        raise HTTPError(400, "malformed request line")
+                    method, target, _ = parts
+                    length = int(headers.get('content-length') or 0)
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise HTTPError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b''
+                    status, answer = 200, await self._respond(method, target, body)
+                except HTTPError as error:
+                    status, answer = error.status, {"error": str(error)}
+                except ValueError as error:
+                    status, answer, keep_alive = 400, {"error": str(error)}, False
+                except Exception as error:
+                    status, answer = 500, {"error": f"{type(error).__name__}: {error}"}
+                if isinstance(answer, str):
+                    payload, content_type = answer.encode('utf-8'), 'text/plain; version=0.0.4'
+                else:
+                    payload, content_type = json.dumps(answer).encode('utf-8'), 'application/json'
+                writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                             f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Start listening and return the asyncio server."""
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def run_service(project, host='127.0.0.1', port=8080, snapshot_dir=None):
+    """Serve a project over HTTP until interrupted."""
+    async def main():
+        server = await QueryService(project, snapshot_dir).start(host, port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    # python p14.py [hospitals.csv|.jsonl] [port]
+    service_project = HospitalProject()
+    if len(sys.argv) > 1:
+        service_project.load_hospitals(sys.argv[1])
+    else:
+        from p4 import hospitals
+        service_project.add_hospitals(hospitals)
+    run_service(service_project, port=int(sys.argv[2]) if len(sys.argv) > 2 else 8080)
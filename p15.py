@@ -0,0 +1,134 @@
+import functools
+import math
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets, as in a Prometheus histogram.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, math.inf)
+
+# What each counter measures, for the stats API and the # HELP lines of the text dump.
+COUNTERS = {
+    "nodes_visited": "Spatial index nodes (or grid cells) expanded by queries",
+    "leaves_scanned": "Spatial index leaves (or grid cells) whose hospitals were compared with the query",
+    "distance_evaluations": "Haversine distances computed",
+    "results_materialised": "Hospitals returned by HospitalProject queries",
+    "trie_nodes_collected": "Trie nodes walked to collect every hospital below a prefix",
+}
+
+
+# Latency distribution of one operation: a count per bucket plus the total count and time.
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (an estimate, like Prometheus' histogram_quantile)."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+
+class Instrumentation:
+    """Counters and per-operation latency histograms for the hot paths; off until enable() is called.
+
+    The instrumented code checks `enabled` once per call and skips everything else when it is False,
+    so it can stay in production builds. Updates are not locked: with several threads the numbers are
+    close but may miss a few increments.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Zero every counter and drop every histogram."""
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, operation, seconds):
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            histogram = self.histograms[operation] = _Histogram()
+        histogram.observe(seconds)
+
+    def stats(self):
+        """Return the counters and, per operation, its call count, total and mean time and p50/p99 estimates."""
+        latency = {}
+        for operation, histogram in sorted(self.histograms.items()):
+            latency[operation] = {
+                "count": histogram.count,
+                "total_s": histogram.total,
+                "mean_s": histogram.total / histogram.count if histogram.count else 0.0,
+                "p50_s": histogram.quantile(0.50),
+                "p99_s": histogram.quantile(0.99),
+            }
+        return {"enabled": self.enabled, "counters": dict(self.counters), "latency": latency}
+
+    def prometheus_text(self, prefix="geohealth"):
+        """Return the counters and histograms in the Prometheus text exposition format."""
+        lines = []
+        for name, value in self.counters.items():
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        metric = f"{prefix}_operation_seconds"
+        lines.append(f"# HELP {metric} Latency of instrumented operations")
+        lines.append(f"# TYPE {metric} histogram")
+        for operation, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'{metric}_bucket{{operation="{operation}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{operation="{operation}"}} {histogram.total!r}')
+            lines.append(f'{metric}_count{{operation="{operation}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide instrumentation every module reports to.
+STATS = Instrumentation()
+
+
+def instrumented(operation, count_results=False):
+    """Decorator recording a function's latency under `operation` while STATS is enabled.
+    With `count_results=True` the length of a list result is added to results_materialised."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not STATS.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                STATS.observe(operation, time.perf_counter() - start)
+            if count_results and isinstance(result, list):
+                STATS.count("results_materialised", len(result))
+            return result
+        return wrapper
+    return decorate
@@ -1,21 +1,105 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+
+from p15 import STATS
+
+# Number of best-rated hospitals each TrieNode caches for its subtree by default.
+TOP_K_CACHE_SIZE = 10
+
+
+# Sort key that ranks hospitals by rating, highest first.
+def _by_rating(hospital):
+    return -hospital['rating']
+
+
+# Extends a Levenshtein distance row by one character of a trie key: row[i] becomes the edit distance
+# between the first i characters of the query and the key up to and including `char`.
+def _next_edit_row(previous_row, query, char):
+    row = [previous_row[0] + 1]
+    for i in range(1, len(query) + 1):
+        row.append(min(row[i - 1] + 1,  # insertion
+                       previous_row[i] + 1,  # deletion
+                       previous_row[i - 1] + (query[i - 1] != char)))  # substitution or match
+    return row
+
+
+# Orders fuzzy matches by edit distance, then by rating (highest first), and applies the limit.
+def _rank_fuzzy_matches(matches, limit):
+    matches.sort(key=lambda match: (match[0], -match[1]['rating']))
+    return [hospital for _, hospital in matches[:limit]]
+
+
+# Shared upkeep of the per-node top-k caches for Trie and RadixTrie.
+# Subclasses provide `_path(key)` (the nodes along a lowercased key, root first, as far as it exists)
+# and `_rebuild_top(node)`, and set `_stale_keys` to None in their constructor.
+class _TopCacheMaintenance:
+    def refresh_rating(self, key, hospital):
+        """Re-rank a hospital in the top-k caches along its key after its rating changed in place."""
+        key = key.lower()
+        if self._stale_keys is not None:
+            self._stale_keys.add(key)  # Repaired once, at the end of the batch
+            return
+        # Children before parents, so every rebuild starts from up-to-date child caches.
+        for node in reversed(self._path(key)):
+            top = node.top
+            if any(h is hospital for h in top) or len(top) < self.top_k or hospital['rating'] > top[-1]['rating']:
+                self._rebuild_top(node)
+
+    def insert_many(self, items):
+        """Insert (key, hospital) pairs, repairing the top-k caches once for all of them."""
+        if self._stale_keys is not None:
+            for key, hospital in items:
+                self.insert(key, hospital)  # Already inside a batch
+            return
+        self.begin_batch()
+        try:
+            for key, hospital in items:
+                self.insert(key, hospital)
+        finally:
+            self.end_batch()
+
+    def begin_batch(self):
+        """Defer top-k cache upkeep for inserts, deletes and rating changes until end_batch()."""
+        self._stale_keys = set()
+
+    def end_batch(self):
+        """Repair every cache touched during the batch, each node once and deepest first."""
+        stale_keys, self._stale_keys = self._stale_keys, None
+        depth_of = {}
+        for key in stale_keys or ():
+            for depth, node in enumerate(self._path(key)):
+                depth_of[node] = depth
+        for node in sorted(depth_of, key=depth_of.get, reverse=True):
+            self._rebuild_top(node)
+
+
 # Trie Node class for searching by name/address with partial matches
 class TrieNode:
     def __init__(self):
         # Initialize each node with a dictionary of children and a list of hospitals.
         # 'children' stores references to child nodes based on characters.
         # 'hospitals' stores the list of hospitals that end at this node.
+        # 'top' caches the best-rated hospitals anywhere below this node, highest rating first.
         self.children = {}
         self.hospitals = []
+        self.top = []
 
-class Trie:
-    def __init__(self):
+class Trie(_TopCacheMaintenance):
+    def __init__(self, top_k=TOP_K_CACHE_SIZE):
         # Initialize the Trie with a root node, which is an empty TrieNode.
+        # Every node keeps its `top_k` best-rated hospitals so ranked autocomplete never walks a subtree.
         self.root = TrieNode()
+        self.top_k = top_k
+        self._stale_keys = None  # Keys whose caches need repair at the end of a batch
 
     def insert(self, key, hospital):
         """Insert a hospital into the Trie based on the key (name or address)."""
+        if self._stale_keys is not None:
+            self._stale_keys.add(key.lower())  # Its caches are filled in once, at the end of the batch
         # Start from the root node for each insertion.
         node = self.root
+        self._offer_top(node, hospital)
         # Traverse through each character in the key (converted to lowercase for case insensitivity).
         for char in key.lower():
             # If the character is not already a child of the current node, add a new TrieNode.
@@ -23,69 +107,600 @@ class Trie:
                 node.children[char] = TrieNode()
             # Move to the child node corresponding to the character.
             node = node.children[char]
+            # Every node on the path gains the hospital in its subtree, so it may enter that node's cache.
+            self._offer_top(node, hospital)
         # After traversing all characters, add the hospital to the node's hospital list.
         node.hospitals.append(hospital)
 
-    def search(self, partial_key):
-        """Search for hospitals based on a partial key (name or address)."""
-        # Start from the root node for each search.
+    def _offer_top(self, node, hospital):
+        """Add a hospital to a node's top-k cache if it rates high enough (deferred during a batch)."""
+        if self._stale_keys is not None:
+            return
+        if len(node.top) < self.top_k or hospital['rating'] > node.top[-1]['rating']:
+            insort(node.top, hospital, key=_by_rating)
+            del node.top[self.top_k:]
+
+    def _find_node(self, prefix):
+        """Return the node reached by following the prefix, or None if no key starts with it."""
         node = self.root
-        # Traverse through each character in the partial key (converted to lowercase for case insensitivity).
-        for char in partial_key.lower():
-            # If the character is not found among the current node's children, return an empty list (no matches).
+        for char in prefix.lower():
             if char not in node.children:
-                return []  # No matches found
-            # Move to the child node corresponding to the character.
+                return None
             node = node.children[char]
-        # Collect all hospitals from the last matched node and its descendants.
-        return self._collect_all_hospitals(node)
+        return node
+
+    def search(self, partial_key, limit=None):
+        """Search for hospitals based on a partial key (name or address).
+
+        With a limit, only the `limit` best-rated matches are returned, highest rating first.
+        """
+        return self.autocomplete(partial_key, limit)
+
+    def starts_with(self, prefix):
+        """Checks if there is any word in the Trie that starts with the given prefix."""
+        return self._find_node(prefix) is not None
+
+    def autocomplete(self, prefix, limit=None):
+        """Returns hospitals in the Trie that start with the given prefix.
+
+        Without a limit every match is returned. With a limit the `limit` best-rated matches are
+        returned, highest rating first; up to `top_k` they come straight from the node's cache.
+        """
+        node = self._find_node(prefix)
+        if node is None:
+            return []  # No matches found
+        if limit is None:
+            return self._collect_all_hospitals(node)
+        if limit <= self.top_k:
+            return node.top[:limit]
+        # More results than the cache holds: fall back to ranking the whole subtree.
+        return heapq.nsmallest(limit, self._collect_all_hospitals(node), key=_by_rating)
+
+    def fuzzy_search(self, query, max_edits=2, limit=None):
+        """Return hospitals whose full key is within `max_edits` edits (Levenshtein distance) of the query.
+
+        The trie is walked once, carrying one row of the edit distance table per node; a branch is
+        abandoned as soon as every entry of its row exceeds the budget. Matches come closest first,
+        then highest rated, and at most `limit` of them are returned.
+        """
+        query = query.lower()
+        first_row = list(range(len(query) + 1))
+        matches = []
+        if first_row[-1] <= max_edits:
+            matches.extend((first_row[-1], hospital) for hospital in self.root.hospitals)
+
+        stack = [(child_node, char, first_row) for char, child_node in self.root.children.items()]
+        while stack:
+            node, char, previous_row = stack.pop()
+            row = _next_edit_row(previous_row, query, char)
+            if row[-1] <= max_edits:
+                matches.extend((row[-1], hospital) for hospital in node.hospitals)
+            # No extension of this key can get back under the budget once the whole row is over it.
+            if min(row) <= max_edits:
+                stack.extend((child_node, child_char, row) for child_char, child_node in node.children.items())
+        return _rank_fuzzy_matches(matches, limit)
+
+    def delete(self, key, hospital=None):
+        """Remove a hospital stored under the key (every hospital under it if none is given).
+
+        Nodes left without hospitals or children are pruned, and the top-k caches along the
+        path are refreshed. Returns True if anything was removed.
+        """
+        # Remember the path so it can be repaired from the bottom up.
+        key = key.lower()
+        path = [self.root]
+        for char in key:
+            node = path[-1].children.get(char)
+            if node is None:
+                return False  # Key not found
+            path.append(node)
+
+        node = path[-1]
+        if hospital is None:
+            removed = node.hospitals
+            node.hospitals = []
+        else:
+            # Matched by identity: two hospitals with equal fields are still different entries.
+            index = next((i for i, h in enumerate(node.hospitals) if h is hospital), None)
+            removed = [node.hospitals.pop(index)] if index is not None else []
+        if not removed:
+            return False  # Hospital not found under this key
+
+        removed_ids = {id(h) for h in removed}
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth > 0 and not node.hospitals and not node.children:
+                # Prune the now empty node from its parent.
+                del path[depth - 1].children[key[depth - 1]]
+            elif self._stale_keys is not None:
+                # Inside a batch the caches are repaired once, at the end.
+                self._stale_keys.add(key)
+                break
+            elif any(id(h) in removed_ids for h in node.top):
+                self._rebuild_top(node)
+        return True
+
+    def _path(self, key):
+        """Return the nodes along a lowercased key, root first, as far as the key exists."""
+        path = [self.root]
+        for char in key:
+            node = path[-1].children.get(char)
+            if node is None:
+                break
+            path.append(node)
+        return path
+
+    def _rebuild_top(self, node):
+        """Recompute a node's top-k cache from its own hospitals and its children's caches."""
+        candidates = list(node.hospitals)
+        for child_node in node.children.values():
+            candidates.extend(child_node.top)
+        node.top = heapq.nsmallest(self.top_k, candidates, key=_by_rating)
 
     def _collect_all_hospitals(self, node):
         """Collect all hospitals from the current node and its children."""
+        if STATS.enabled:
+            STATS.count("trie_nodes_collected")
         # Start with the hospitals at the current node.
         hospitals = list(node.hospitals)
         # Recursively collect hospitals from each child node.
         for child_node in node.children.values():
             hospitals.extend(self._collect_all_hospitals(child_node))
         # Return the aggregated list of hospitals.
-    def starts_with(self, prefix):
-        """Checks if there is any word in the Trie that starts with the given prefix."""
+        return hospitals
+
+
+# Radix Trie Node class: a path-compressed TrieNode.
+# A node is reached through an edge labelled `source[start:end]`. The label is kept as offsets into the
+# lowercased key that created it, so edges share that string instead of holding copies of their own.
+# `children` (keyed on the first character of each child's edge) and `hospitals` stay None until used,
+# and `__slots__` drops the per-node attribute dict; together that is most of the memory of a TrieNode.
+class RadixTrieNode:
+    __slots__ = ('source', 'start', 'end', 'children', 'hospitals', 'top')
+
+    def __init__(self, source='', start=0, end=0):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.children = None
+        self.hospitals = None
+        self.top = []
+
+    def label(self):
+        """Return the edge label leading to this node."""
+        return self.source[self.start:self.end]
+
+
+class RadixTrie(_TopCacheMaintenance):
+    """Path-compressed Trie with the same insert/search/starts_with/autocomplete/delete API as Trie.
+
+    Chains of single-child nodes collapse into one edge, so a long address costs a handful of
+    nodes instead of one node per character.
+    """
+
+    def __init__(self, top_k=TOP_K_CACHE_SIZE):
+        # Initialize the Radix Trie with an empty root node and the size of the per-node top-k cache.
+        self.root = RadixTrieNode()
+        self.top_k = top_k
+        self._stale_keys = None  # Keys whose caches need repair at the end of a batch
+
+    def insert(self, key, hospital):
+        """Insert a hospital into the Radix Trie based on the key (name or address)."""
+        key = key.lower()
+        if self._stale_keys is not None:
+            self._stale_keys.add(key)  # Its caches are filled in once, at the end of the batch
         node = self.root
-        for char in prefix.lower():
-            if char not in node.children:
-                return False  # No matches found
-            node = node.children[char]
-        return True  # Prefix found
+        self._offer_top(node, hospital)
+        i = 0
+        while i < len(key):
+            child = node.children.get(key[i]) if node.children else None
+            if child is None:
+                # No edge starts with this character: the rest of the key becomes a single new edge.
+                child = RadixTrieNode(key, i, len(key))
+                if node.children is None:
+                    node.children = {}
+                node.children[key[i]] = child
+                node = child
+                self._offer_top(node, hospital)
+                break
+
+            # Follow the edge for as long as it agrees with the key.
+            source, start, edge_length = child.source, child.start, child.end - child.start
+            matched = 1
+            while matched < edge_length and i + matched < len(key) and key[i + matched] == source[start + matched]:
+                matched += 1
+            if matched < edge_length:
+                # The key leaves the edge halfway: split it so the shared part gets its own node.
+                middle = RadixTrieNode(source, start, start + matched)
+                middle.children = {source[start + matched]: child}
+                middle.top = list(child.top)
+                child.start = start + matched
+                node.children[key[i]] = middle
+                child = middle
+            node = child
+            i += matched
+            self._offer_top(node, hospital)
 
-    def autocomplete(self, prefix):
-        """Returns all hospitals in the Trie that start with the given prefix."""
+        # After consuming the whole key, add the hospital to the node's hospital list.
+        if node.hospitals is None:
+            node.hospitals = []
+        node.hospitals.append(hospital)
+
+    def insert_many(self, items):
+        """Insert (key, hospital) pairs, repairing the top-k caches once for all of them.
+
+        An empty trie is built straight from the sorted keys instead: every node is created once with
+        its final edge and its cache is filled from its children's, with no edge splits or cache inserts.
+        """
+        root = self.root
+        if root.children or root.hospitals or self._stale_keys is not None:
+            super().insert_many(items)
+            return
+        # A stable sort keeps hospitals with the same key in insertion order, as insert() would.
+        items = sorted(((key.lower(), hospital) for key, hospital in items), key=lambda item: item[0])
+        self._build(root, items, 0, len(items), 0)
+
+    def _build(self, node, items, lo, hi, depth):
+        """Build the subtree of a node from sorted items[lo:hi], whose keys all start with its depth characters."""
+        # Keys that end at this node sort before the longer keys that continue below it.
+        i = lo
+        while i < hi and len(items[i][0]) == depth:
+            i += 1
+        if i > lo:
+            node.hospitals = [hospital for _, hospital in items[lo:i]]
+        while i < hi:
+            # The run of keys that continue with the same character shares one child edge, which covers
+            # the longest prefix common to that run (that of its first and last keys, since they are sorted).
+            first = items[i][0]
+            j = i + 1
+            while j < hi and items[j][0][depth] == first[depth]:
+                j += 1
+            last = items[j - 1][0]
+            end = depth + 1
+            while end < len(first) and end < len(last) and first[end] == last[end]:
+                end += 1
+            child = RadixTrieNode(first, depth, end)
+            if node.children is None:
+                node.children = {}
+            node.children[first[depth]] = child
+            self._build(child, items, i, j, end)
+            i = j
+        self._rebuild_top(node)
+
+    def _offer_top(self, node, hospital):
+        """Add a hospital to a node's top-k cache if it rates high enough (deferred during a batch)."""
+        if self._stale_keys is not None:
+            return
+        if len(node.top) < self.top_k or hospital['rating'] > node.top[-1]['rating']:
+            insort(node.top, hospital, key=_by_rating)
+            del node.top[self.top_k:]
+
+    def _find_node(self, prefix):
+        """Return the highest node whose keys all start with the prefix, or None if there is none."""
+        prefix = prefix.lower()
         node = self.root
-        for char in prefix.lower():
-            if char not in node.children:
-                return []  # No matches found
-            node = node.children[char]
-        return self._collect_all_hospitals(node)
-    
-    def delete(self, key):
-        # Recursive helper function to delete a key
-        def delete_recursive(node, key, depth):
-            if depth == len(key):
-                if '$' in node:
-                    del node['$']  # Remove the end-of-word marker
-                    return len(node) == 0  # If the node is empty, return True to indicate that it should be removed
-                return False
-
-            char = key[depth]
-            if char in node:
-                can_delete = delete_recursive(node[char], key, depth + 1)
-                if can_delete:
-                    del node[char]
-                    return len(node) == 0
+        i = 0
+        while i < len(prefix):
+            child = node.children.get(prefix[i]) if node.children else None
+            if child is None:
+                return None
+            # The prefix may end in the middle of an edge; every key below that edge still matches.
+            matched = min(child.end - child.start, len(prefix) - i)
+            if not child.source.startswith(prefix[i:i + matched], child.start):
+                return None
+            node = child
+            i += matched
+        return node
+
+    def search(self, partial_key, limit=None):
+        """Search for hospitals based on a partial key (name or address).
+
+        With a limit, only the `limit` best-rated matches are returned, highest rating first.
+        """
+        return self.autocomplete(partial_key, limit)
+
+    def starts_with(self, prefix):
+        """Checks if there is any word in the Radix Trie that starts with the given prefix."""
+        return self._find_node(prefix) is not None
+
+    def autocomplete(self, prefix, limit=None):
+        """Returns hospitals in the Radix Trie that start with the given prefix.
+
+        Without a limit every match is returned. With a limit the `limit` best-rated matches are
+        returned, highest rating first; up to `top_k` they come straight from the node's cache.
+        """
+        node = self._find_node(prefix)
+        if node is None:
+            return []  # No matches found
+        if limit is None:
+            return self._collect_all_hospitals(node)
+        if limit <= self.top_k:
+            return node.top[:limit]
+        # More results than the cache holds: fall back to ranking the whole subtree.
+        return heapq.nsmallest(limit, self._collect_all_hospitals(node), key=_by_rating)
+
+    def fuzzy_search(self, query, max_edits=2, limit=None):
+        """Return hospitals whose full key is within `max_edits` edits (Levenshtein distance) of the query.
+
+        Works like Trie.fuzzy_search, advancing the edit distance row one character at a time along
+        each edge and abandoning the edge as soon as the whole row exceeds the budget.
+        """
+        query = query.lower()
+        first_row = list(range(len(query) + 1))
+        matches = []
+        if first_row[-1] <= max_edits and self.root.hospitals:
+            matches.extend((first_row[-1], hospital) for hospital in self.root.hospitals)
+
+        stack = [(child_node, first_row) for child_node in (self.root.children or {}).values()]
+        while stack:
+            node, row = stack.pop()
+            for position in range(node.start, node.end):
+                row = _next_edit_row(row, query, node.source[position])
+                if min(row) > max_edits:
+                    break
+            else:
+                if row[-1] <= max_edits and node.hospitals:
+                    matches.extend((row[-1], hospital) for hospital in node.hospitals)
+                if node.children:
+                    stack.extend((child_node, row) for child_node in node.children.values())
+        return _rank_fuzzy_matches(matches, limit)
+
+    def delete(self, key, hospital=None):
+        """Remove a hospital stored under the key (every hospital under it if none is given).
+
+        Empty nodes are pruned, nodes left with a single child are merged back into one edge,
+        and the top-k caches along the path are refreshed. Returns True if anything was removed.
+        """
+        # Follow the key edge by edge, remembering the path so it can be repaired from the bottom up.
+        key = key.lower()
+        path = [self.root]
+        i = 0
+        while i < len(key):
+            node = path[-1]
+            child = node.children.get(key[i]) if node.children else None
+            if child is None:
+                return False  # Key not found
+            edge_length = child.end - child.start
+            if not key.startswith(child.source[child.start:child.end], i):
+                return False  # Key ends inside an edge or diverges from it
+            path.append(child)
+            i += edge_length
+
+        node = path[-1]
+        if not node.hospitals:
             return False
+        if hospital is None:
+            removed = node.hospitals
+            node.hospitals = None
+        else:
+            # Matched by identity: two hospitals with equal fields are still different entries.
+            index = next((i for i, h in enumerate(node.hospitals) if h is hospital), None)
+            if index is None:
+                return False  # Hospital not found under this key
+            removed = [node.hospitals.pop(index)]
+            if not node.hospitals:
+                node.hospitals = None
+
+        removed_ids = {id(h) for h in removed}
+        for depth in range(len(path) - 1, 0, -1):
+            node, parent = path[depth], path[depth - 1]
+            first_char = node.source[node.start]
+            if node.hospitals is None and not node.children:
+                # Prune the now empty node from its parent.
+                del parent.children[first_char]
+                if not parent.children:
+                    parent.children = None
+            elif node.hospitals is None and len(node.children) == 1:
+                # A bare node with one child is just a bend in an edge: fold the child into it.
+                (child,) = node.children.values()
+                child.source = node.label() + child.label()
+                child.start, child.end = 0, len(child.source)
+                parent.children[first_char] = child
+            elif self._stale_keys is None and any(id(h) in removed_ids for h in node.top):
+                self._rebuild_top(node)
+        if self._stale_keys is not None:
+            # Inside a batch the caches are repaired once, at the end.
+            self._stale_keys.add(key)
+        elif any(id(h) in removed_ids for h in self.root.top):
+            self._rebuild_top(self.root)
+        return True
+
+    def _path(self, key):
+        """Return the nodes whose edges a lowercased key passes through completely, root first."""
+        path = [self.root]
+        i = 0
+        while i < len(key):
+            node = path[-1]
+            child = node.children.get(key[i]) if node.children else None
+            if child is None or not key.startswith(child.source[child.start:child.end], i):
+                break
+            path.append(child)
+            i += child.end - child.start
+        return path
+
+    def _rebuild_top(self, node):
+        """Recompute a node's top-k cache from its own hospitals and its children's caches."""
+        candidates = list(node.hospitals or ())
+        for child_node in (node.children or {}).values():
+            candidates.extend(child_node.top)
+        node.top = heapq.nsmallest(self.top_k, candidates, key=_by_rating)
 
     def _collect_all_hospitals(self, node):
         """Collect all hospitals from the current node and its children."""
-        hospitals = list(node.hospitals)
-        for child_node in node.children.values():
-            hospitals.extend(self._collect_all_hospitals(child_node))
+        hospitals = list(node.hospitals or ())
+        stack = list((node.children or {}).values())
+        collected = 1
+        while stack:
+            node = stack.pop()
+            collected += 1
+            if node.hospitals:
+                hospitals.extend(node.hospitals)
+            if node.children:
+                stack.extend(node.children.values())
+        if STATS.enabled:
+            STATS.count("trie_nodes_collected", collected)
         return hospitals
+
+
+# Words of an address (street words, city, state, house number) in normalised form.
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens; apostrophes are dropped so "Peter's" becomes "peters"."""
+    return _TOKEN_PATTERN.findall(text.lower().replace("'", ""))
+
+
+# Posting list of one token: the hospitals whose text contains it, kept sorted by rating (highest first),
+# plus the set of their ids for constant-time membership tests during intersections.
+class PostingList:
+    __slots__ = ('hospitals', 'members')
+
+    def __init__(self):
+        self.hospitals = []
+        self.members = set()
+
+
+class InvertedIndex:
+    """Inverted index from normalised tokens (e.g. of addresses) to rating-ordered posting lists.
+
+    A query is answered by walking the shortest posting list of its tokens and checking membership in
+    the others, so the work depends on how many hospitals match rather than on the size of the dataset.
+    """
+
+    def __init__(self):
+        # Map each token to its posting list, and each indexed hospital (by id) to its token sequence.
+        self.postings = {}
+        self.tokens_of = {}
+        self._stale_tokens = None  # Tokens whose posting lists need re-sorting at the end of a batch
+
+    def add(self, text, hospital):
+        """Index a hospital under every token of the text."""
+        tokens = tuple(tokenize(text))
+        self.tokens_of[id(hospital)] = tokens
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = PostingList()
+            if self._stale_tokens is not None:
+                posting.hospitals.append(hospital)  # Sorted once, at the end of the batch
+                self._stale_tokens.add(token)
+            else:
+                insort(posting.hospitals, hospital, key=_by_rating)
+            posting.members.add(id(hospital))
+
+    def remove(self, hospital):
+        """Remove a hospital from every posting list. Returns True if it was indexed."""
+        tokens = self.tokens_of.pop(id(hospital), None)
+        if tokens is None:
+            return False
+        for token in set(tokens):
+            posting = self.postings[token]
+            posting.members.discard(id(hospital))
+            if self._stale_tokens is not None:
+                self._stale_tokens.add(token)  # Dropped from the list at the end of the batch
+                continue
+            del posting.hospitals[self._position(posting, hospital, hospital['rating'])]
+            if not posting.hospitals:
+                del self.postings[token]
+        return True
+
+    def update_rating(self, hospital, old_rating):
+        """Move a hospital to its new place in its posting lists after its rating changed in place."""
+        tokens = self.tokens_of.get(id(hospital))
+        if tokens is None:
+            return False
+        for token in set(tokens):
+            posting = self.postings[token]
+            if self._stale_tokens is not None:
+                self._stale_tokens.add(token)  # Re-sorted at the end of the batch
+                continue
+            del posting.hospitals[self._position(posting, hospital, old_rating)]
+            insort(posting.hospitals, hospital, key=_by_rating)
+        return True
+
+    def _position(self, posting, hospital, rating):
+        """Find a hospital in a posting list, given the rating it is sorted under."""
+        # Jump to the hospitals with the same rating, then find this exact one among them.
+        # The hospital itself is keyed on `rating`, which keeps the list sorted after an in-place change.
+        index = bisect_left(posting.hospitals, -rating, key=lambda h: -rating if h is hospital else -h['rating'])
+        while posting.hospitals[index] is not hospital:
+            index += 1
+        return index
+
+    def add_many(self, items):
+        """Index (text, hospital) pairs, sorting each posting list once for all of them."""
+        if self._stale_tokens is not None:
+            for text, hospital in items:
+                self.add(text, hospital)  # Already inside a batch
+            return
+        self.begin_batch()
+        try:
+            for text, hospital in items:
+                self.add(text, hospital)
+        finally:
+            self.end_batch()
+
+    def begin_batch(self):
+        """Defer posting list ordering and clean-up until end_batch()."""
+        self._stale_tokens = set()
+
+    def end_batch(self):
+        """Rebuild every posting list touched during the batch: drop removed hospitals, re-sort by rating."""
+        stale_tokens, self._stale_tokens = self._stale_tokens, None
+        for token in stale_tokens or ():
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            seen = set()
+            hospitals = []
+            for hospital in posting.hospitals:
+                if id(hospital) in posting.members and id(hospital) not in seen:
+                    seen.add(id(hospital))
+                    hospitals.append(hospital)
+            if hospitals:
+                posting.hospitals = sorted(hospitals, key=_by_rating)
+            else:
+                del self.postings[token]
+
+    def search(self, query, limit=None):
+        """Return hospitals whose text contains the query's words as a phrase, highest rating first.
+
+        "new york" matches "123 Main St, New York, NY" but not "1 York Ave, New Haven, CT".
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        postings = []
+        for token in set(query_tokens):
+            posting = self.postings.get(token)
+            if posting is None:
+                return []  # Some word occurs nowhere
+            postings.append(posting)
+
+        # Walk the shortest list (already in rating order) and intersect with the others.
+        postings.sort(key=lambda posting: len(posting.hospitals))
+        shortest, others = postings[0], postings[1:]
+        matches = []
+        seen = set() if self._stale_tokens is not None else None
+        for hospital in shortest.hospitals:
+            if seen is not None:
+                # Mid-batch a list may still hold removed hospitals, and hospitals re-added under it twice,
+                # until end_batch() cleans it up.
+                if id(hospital) not in shortest.members or id(hospital) in seen:
+                    continue
+                seen.add(id(hospital))
+            if all(id(hospital) in posting.members for posting in others) and self._contains_phrase(hospital, query_tokens):
+                matches.append(hospital)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def _contains_phrase(self, hospital, query_tokens):
+        """Check that the query tokens appear consecutively in the hospital's indexed text."""
+        if len(query_tokens) == 1:
+            return True
+        tokens = self.tokens_of[id(hospital)]
+        width = len(query_tokens)
+        query_tokens = tuple(query_tokens)
+        return any(tokens[i:i + width] == query_tokens for i in range(len(tokens) - width + 1))
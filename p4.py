@@ -1,54 +1,308 @@
+import math
+
 from p1 import *
-from p2 import *
 from p3 import *
 from p5 import *
+from p7 import *
+from p8 import *
+from p9 import *
+from p10 import *
+from p11 import *
+from p12 import *
+from p15 import *
 
-# Hospital Project class integrating R-Tree, Trie, and Heap
+# Hospital Project class integrating the record store, spatial index, Tries and address index
 class HospitalProject:
-    def __init__(self):
-        self.rtree = RTree()
-        self.trie_name = Trie()
-        self.trie_address = Trie()
-        self.hospitals = []
-        self.search_history = SearchHistory()
+    def __init__(self, cache=None, spatial_index=None):
+        # Every index holds references to the records owned by `store`, which is keyed on hospital id.
+        # `cache` is an optional QueryCache (p11) that answers repeated location queries without searching.
+        # `spatial_index` is the engine behind the location queries: any empty SpatialIndex (p1), such as
+        # a GridIndex (p12) for dense, frequently updated data. The default is an RTree.
+        # After p15.STATS.enable(), the query methods record their latency and result counts there.
+        # Query methods take `session=` to record the search in that search history session rather than
+        # the current one (see SearchHistory.use_session).
+        self.store = HospitalStore()
+        self.spatial_index = spatial_index if spatial_index is not None else RTree()
+        self.trie_name = RadixTrie()
+        self.trie_address = RadixTrie()
+        self.address_index = InvertedIndex()
+        self.search_history = SearchHistory(lookup=self.store.get)
+        self.cache = cache
+        self._batch_locations = None  # Changed locations collected while apply_batch() runs
+
+    @property
+    def rtree(self):
+        # The spatial index under its old name, kept for callers written before engines were pluggable
+        return self.spatial_index
+
+    @property
+    def hospitals(self):
+        # All hospital records, oldest first
+        return list(self.store)
 
     def add_hospital(self, hospital):
-        self.rtree.insert_hospital(hospital)
-        self.trie_name.insert(hospital['name'], hospital)
-        self.trie_address.insert(hospital['address'], hospital)
-        self.hospitals.append(hospital)
+        # Store the hospital as a record with its own id, index it, and return the record
+        record = self.store.add(hospital)
+        self.spatial_index.insert_hospital(record)
+        self._index_text(record)
+        self._invalidate_cache([(record.latitude, record.longitude)])
+        return record
 
-    def delete_hospital(self, hospital_name):
-    # Find the hospital by name and remove it from all data structures
-        hospital_to_delete = next((h for h in self.hospitals if h['name'] == hospital_name), None)
-        if hospital_to_delete:
-            self.hospitals.remove(hospital_to_delete)
-            self.rtree.delete_hospital(hospital_to_delete)
-            self.trie_name.delete(hospital_name,hospital_to_delete)  # Call the delete method with the correct parameter
+    def add_hospitals(self, hospitals):
+        # Add a batch of hospitals at once; the R-Tree takes them in packed leaves (a single bulk load
+        # when it is empty) instead of being grown one insert at a time. The whole batch is stored or none
+        # of it: an id clash anywhere in it raises ValueError before any record is stored or indexed.
+        records = self.store.add_all(hospitals)
+        self.spatial_index.insert_hospitals(records)
+        self._index_texts(records)
+        self._invalidate_cache([(record.latitude, record.longitude) for record in records])
+        return records
+
+    def load_hospitals(self, path, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, skip_invalid=False, rejected=None):
+        # Stream hospitals from a CSV or JSONL file (optionally gzipped) into the project and return how many
+        # were added. Rows are validated and normalised one at a time and indexed `chunk_size` at a time,
+        # so only one chunk of raw rows is held in memory however large the file is.
+        # See p9.stream_hospitals for `skip_invalid` and `rejected`.
+        added = 0
+        for chunk in chunked(stream_hospitals(path, file_format, skip_invalid, rejected), chunk_size):
+            added += len(self.add_hospitals(chunk))
+        return added
+
+    def _index_text(self, record):
+        # Add a record to the name and address indexes
+        self.trie_name.insert(record.name, record)
+        self.trie_address.insert(record.address, record)
+        self.address_index.add(record.address, record)
+
+    def _index_texts(self, records):
+        # Add a batch of records to the name and address indexes. Each index sorts its posting lists and
+        # fills its top-k caches once for the whole batch; an empty trie is built from the sorted keys.
+        self.trie_name.insert_many([(record.name, record) for record in records])
+        self.trie_address.insert_many([(record.address, record) for record in records])
+        self.address_index.add_many([(record.address, record) for record in records])
+
+    def save_snapshot(self, path):
+        # Write the records and every index to one binary file that load_snapshot() can map straight back in
+        write_snapshot(path, self.store, self.spatial_index, self.trie_name, self.trie_address, self.address_index)
+
+    @classmethod
+    def load_snapshot(cls, path, cache=None):
+        # Open a snapshot written by save_snapshot(). Nothing is rebuilt: the file is memory-mapped and every
+        # search runs directly on its packed arrays, so startup takes milliseconds whatever the size and
+        # processes opening the same file share its pages. The loaded project is read-only.
+        project = cls.__new__(cls)
+        project.store, project.spatial_index, project.trie_name, project.trie_address, project.address_index = open_snapshot(path)
+        project.search_history = SearchHistory(lookup=project.store.get)
+        project.cache = cache
+        project._batch_locations = None
+        return project
+
+    def get_hospital(self, hospital_id):
+        # The record with this id, or None
+        return self.store.get(hospital_id)
+
+    def delete_hospital_by_id(self, hospital_id):
+        # Remove a hospital from the store and every index. Each step is O(1) or O(log n):
+        # the store and R-Tree locate the record by hash, the tries walk only its key.
+        record = self.store.remove(hospital_id)
+        if record is None:
+            return None
+        self.spatial_index.delete_hospital(record)
+        self.trie_name.delete(record.name, record)
+        self.trie_address.delete(record.address, record)
+        self.address_index.remove(record)
+        self._invalidate_cache([(record.latitude, record.longitude)])
+        return record
+
+    def delete_hospitals(self, hospital_ids):
+        # Remove many hospitals (e.g. closed facilities) and return the records that were found
+        deleted = []
+        for hospital_id in hospital_ids:
+            record = self.delete_hospital_by_id(hospital_id)
+            if record is not None:
+                deleted.append(record)
+        return deleted
+
+    def update_hospital(self, hospital_id, **fields):
+        # Change fields of a stored hospital in place and return its record (None if there is no such id).
+        # Only the indexes whose keys changed are touched: a new rating re-ranks the record where it
+        # already sits, and a new location re-files it in the R-Tree only if it left its leaf's box.
+        # The fields are validated and normalised (see p9.normalise_fields) before any index is touched,
+        # so a bad value raises ValueError and leaves the record as it was.
+        fields = normalise_fields(fields)
+        record = self.store.get(hospital_id)
+        if record is None:
+            return None
+        changed = {field: value for field, value in fields.items() if record[field] != value}
+        if not changed:
+            return record
+
+        old_rating = record.rating
+        old_location = (record.latitude, record.longitude)
+        if 'name' in changed:
+            self.trie_name.delete(record.name, record)
+        if 'address' in changed:
+            self.trie_address.delete(record.address, record)
+            self.address_index.remove(record)
+        self.store.update(record, changed)
+
+        if 'name' in changed:
+            self.trie_name.insert(record.name, record)
+        elif 'rating' in changed:
+            self.trie_name.refresh_rating(record.name, record)
+        if 'address' in changed:
+            self.trie_address.insert(record.address, record)
+            self.address_index.add(record.address, record)
+        elif 'rating' in changed:
+            self.trie_address.refresh_rating(record.address, record)
+            self.address_index.update_rating(record, old_rating)
+        if changed.keys() & {'latitude', 'longitude', 'rating'}:
+            self.spatial_index.refresh_hospital(record)
+            self._invalidate_cache([old_location, (record.latitude, record.longitude)])
+        return record
+
+    def _invalidate_cache(self, locations):
+        # Evict the cached answers that a hospital change at these (lat, lon) locations could affect.
+        # Inside apply_batch() the locations are collected and the cache is invalidated once at the end.
+        if self.cache is None:
+            return
+        if self._batch_locations is not None:
+            self._batch_locations.extend(locations)
+        else:
+            self.cache.invalidate(locations)
+
+    def _cached_query(self, kind, user_location, k, radius, search):
+        # Answer a location query from the cache if there is one. `search` runs the query and returns the
+        # results plus how far from the location a hospital change could alter them (see QueryCache.put).
+        if self.cache is None:
+            return search()[0]
+        key = self.cache.key(kind, user_location, k, radius)
+        results = self.cache.get(key)
+        if results is None:
+            results, reach = search()
+            self.cache.put(key, results, reach)
+        return list(results)
+
+    def begin_batch(self):
+        # Start a run of mutations whose index repairs (R-Tree boxes, trie top-k caches, posting list
+        # order) and cache invalidation are deferred to end_batch() and done once per touched node
+        # instead of once per mutation. Queries in between may see stale rankings.
+        for index in (self.spatial_index, self.trie_name, self.trie_address, self.address_index):
+            index.begin_batch()
+        self._batch_locations = []
+
+    def end_batch(self):
+        # Finish a run started by begin_batch(), repairing every index and invalidating the cache once
+        for index in (self.spatial_index, self.trie_name, self.trie_address, self.address_index):
+            index.end_batch()
+        locations, self._batch_locations = self._batch_locations, None
+        self._invalidate_cache(locations)
+
+    def apply_batch(self, mutations):
+        # Apply a list of mutations in one go, between begin_batch() and end_batch(), and return their
+        # results in order:
+        #   ("add", hospital)              -> the new record
+        #   ("update", hospital_id, fields) -> the updated record, or None
+        #   ("delete", hospital_id)        -> the deleted record, or None
+        self.begin_batch()
+        results = []
+        try:
+            for mutation in mutations:
+                operation = mutation[0]
+                if operation == "add":
+                    results.append(self.add_hospital(mutation[1]))
+                elif operation == "update":
+                    results.append(self.update_hospital(mutation[1], **mutation[2]))
+                elif operation == "delete":
+                    results.append(self.delete_hospital_by_id(mutation[1]))
+                else:
+                    raise ValueError(f"Unknown batch operation: {operation!r}")
+        finally:
+            self.end_batch()
+        return results
 
-            self.search_history.push_search(f"Deleted hospital: {hospital_name}")
+    # Plain queries for code that merges the answers of several projects, such as the shards of
+    # p13.ShardedHospitalProject or the p14 service: they do not print, record search history or use
+    # the cache. Location queries return (distance_km, record) pairs.
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def next_id(self):
+        # The id the next hospital added without one will get
+        return self.store.next_id
+
+    @next_id.setter
+    def next_id(self, value):
+        self.store.next_id = value
+
+    def search_nearest(self, user_location, max_results=3, distance_range=None):
+        # At most max_results hospitals (all when None), optionally within distance_range km, nearest first
+        return self.spatial_index.search_nearest(user_location, max_results, distance_range, return_distances=True)
+
+    def search_nearest_batch(self, locations, k=3, distance_range=None):
+        # search_nearest() for many locations at once, one result list per location
+        return self.spatial_index.search_nearest_batch(locations, k, distance_range)
+
+    def search_top_rated(self, user_location, distance_range, k=1, include_ties=False):
+        # Up to k hospitals within distance_range km, best rated first; see SpatialIndex.search_top_rated
+        return self.spatial_index.search_top_rated(user_location, distance_range, k, include_ties, return_distances=True)
+
+    def search_window(self, min_lat, min_lon, max_lat, max_lon):
+        # Every hospital inside a latitude/longitude rectangle
+        return self.spatial_index.search_window(min_lat, min_lon, max_lat, max_lon)
+
+    def search_name(self, partial_name, limit=None):
+        # Hospitals whose name starts with the text; with a limit, the `limit` best rated
+        return self.trie_name.search(partial_name, limit=limit)
+
+    def fuzzy_search_name(self, name, max_edits=2, limit=None):
+        # Hospitals whose full name is within max_edits typos of the text
+        return self.trie_name.fuzzy_search(name, max_edits=max_edits, limit=limit)
+
+    def autocomplete_name(self, prefix, limit=5):
+        # The `limit` best-rated hospitals whose name starts with the prefix
+        return self.trie_name.autocomplete(prefix, limit=limit)
+
+    def search_city(self, city_name, limit=None):
+        # Hospitals whose address mentions the city, best rated first
+        return self.address_index.search(city_name, limit=limit)
+
+    def delete_hospital(self, hospital_name, session=None):
+    # Find the hospital by name and remove it from all data structures
+        same_name = self.store.find_by_name(hospital_name)
+        if same_name:
+            self.delete_hospital_by_id(same_name[0].id)
+            self.search_history.record("delete", (hospital_name,), session=session)
             print(f"Hospital '{hospital_name}' has been deleted.")
         else:
             print(f"No hospital found with the name '{hospital_name}'.")
 
-    def find_hospital_by_hospitalname(self, partial_name):
+    @instrumented("find_hospital_by_hospitalname", count_results=True)
+    def find_hospital_by_hospitalname(self, partial_name, max_edits=2, session=None):
         matched_hospitals = self.trie_name.search(partial_name)
+        if not matched_hospitals:
+            # Nothing starts with the text as typed: fall back to names within a few typos of it
+            matched_hospitals = self.trie_name.fuzzy_search(partial_name, max_edits=max_edits)
         self.display_hospitals(matched_hospitals)
-        self.search_history.push_search(f"Search by name {partial_name} - Hospitals with {partial_name} in them : {matched_hospitals[0]['name']}")  # Record search
+        self.search_history.record("name", (partial_name,), matched_hospitals, session=session)  # Record search
         return matched_hospitals
     
-    def find_hospital_by_city(self, city_name):
+    @instrumented("autocomplete_hospital_name", count_results=True)
+    def autocomplete_hospital_name(self, prefix, limit=5):
+        # Best-rated hospitals whose name starts with the prefix, e.g. for suggestions while typing
+        return self.trie_name.autocomplete(prefix, limit=limit)
+
+    @instrumented("find_hospital_by_city", count_results=True)
+    def find_hospital_by_city(self, city_name, session=None):
         """Find hospitals in the specified city, sorted by rating in decreasing order."""
-        # Filter hospitals by city name and sort by rating
-        matched_hospitals = [hospital for hospital in self.hospitals if hospital['address'].lower().find(city_name.lower()) != -1]
-        matched_hospitals.sort(key=lambda h: h['rating'], reverse=True)
+        # The address index keeps its posting lists sorted by rating, so no scan or sort is needed
+        matched_hospitals = self.address_index.search(city_name)
 
         self.display_hospitals(matched_hospitals)  # Display matched hospitals
-        # Record the search in the search history stack
-        if matched_hospitals:
-            self.search_history.push_search(f"Searched hospitals in {city_name}:\n {' \n '.join(h['name'] for h in matched_hospitals)}")
-        else:
-            self.search_history.push_search(f"Searched hospitals in {city_name}: No hospitals found")
+        # Record the search in the search history; the text is only built if the history is viewed
+        self.search_history.record("city", (city_name,), matched_hospitals, session=session)
         return matched_hospitals
 
     def display_hospitals(self, hospitals):
@@ -71,40 +325,77 @@ class HospitalProject:
         print(f"Longitude: {hospital['longitude']}")
         print(f"Contact: {hospital['contact']}")
 
-    def find_nearest_hospitals(self, user_location, max_results=3):
-        self.search_history.push_search(f"Nearest hospitals search at location: {user_location}, Results: {max_results}")
-        return self.rtree.search_nearest(user_location, max_results)
+    @instrumented("find_nearest_hospitals", count_results=True)
+    def find_nearest_hospitals(self, user_location, max_results=3, session=None):
+        def search():
+            results = self.spatial_index.search_nearest(user_location, max_results, return_distances=True)
+            # Only a hospital closer than the current last result can change the answer.
+            reach = results[-1][0] if len(results) == max_results else math.inf
+            return [hospital for _, hospital in results], reach
+        nearest = self._cached_query("nearest", user_location, max_results, None, search)
+        self.search_history.record("nearest", (user_location, max_results), nearest, session=session)
+        return nearest
     
-    def find_nearest_hospitals_within_range(self, user_location, range_km):
-        # Search for hospitals within the specified range
-        self.search_history.push_search(f"Hospitals within {range_km} km of location: {user_location}")
-        return self.rtree.search_nearest(user_location, max_results=3, distance_range=range_km)
+    @instrumented("find_nearest_hospitals_within_range", count_results=True)
+    def find_nearest_hospitals_within_range(self, user_location, range_km, max_results=None, session=None):
+        # Search for hospitals within the specified range, nearest first (all of them unless max_results is given)
+        in_range = self._cached_query("range", user_location, max_results, range_km, lambda: (
+            self.spatial_index.search_nearest(user_location, max_results=max_results, distance_range=range_km), range_km))
+        self.search_history.record("range", (user_location, range_km), in_range, session=session)
+        return in_range
     
-     #Method to get the best hospitals within a given distance range using MaxHeap
-    def best_hospitals_within_range(self, user_location, distance_range=1):
-    # Find all hospitals within the given distance range.
-        nearest_hospitals = self.rtree.search_nearest(user_location, distance_range=distance_range)
-        if not nearest_hospitals:
-            return "No hospitals found within the specified distance range."
+    @instrumented("batch_nearest")
+    def batch_nearest(self, locations, k=3, radius=None, workers=None):
+        # The k nearest hospitals of many locations at once (e.g. to score patient addresses), as two flat
+        # arrays of hospital ids and distances with k slots per location; see p10.parallel_batch_nearest
+        return parallel_batch_nearest(self, locations, k, radius, workers)
 
-    # Create a MaxHeap to store hospitals based on their ratings.
-        max_heap = MaxHeap()
-        for hospital in nearest_hospitals:
-            max_heap.insert(hospital)
-    
-    # Extract hospitals with the highest rating from the MaxHeap.
-        best_hospitals = []
-        if not max_heap.is_empty():
-            highest_rating = max_heap.heap[0]['rating']
-            while not max_heap.is_empty() and max_heap.heap[0]['rating'] == highest_rating:
-                best_hospitals.append(max_heap.extract_max())
-        self.search_history.push_search(f"Best Hospital in case of Emergency : {best_hospitals[0]['name']} ")
+    @instrumented("coverage_analysis")
+    def coverage_analysis(self, demand_locations, radius_km):
+        # Coverage planning: for each hospital, how many demand points (e.g. population centroids, given as
+        # (lat, lon) pairs) lie within radius_km, and which points have no hospital within radius_km.
+        # The points get an R-Tree of their own; with the default R-Tree index both trees are joined in one traversal.
+        # Returns ({hospital id: count}, [uncovered (lat, lon), ...] in input order).
+        points = [{"latitude": lat, "longitude": lon, "rating": 0.0, "index": index}
+                  for index, (lat, lon) in enumerate(demand_locations)]
+        demand_tree = RTree()
+        demand_tree.bulk_load(points)
+        counts, uncovered = self.spatial_index.coverage_join(demand_tree, radius_km)
+        uncovered.sort(key=lambda point: point["index"])
+        return ({hospital['id']: count for hospital, count in counts},
+                [(point["latitude"], point["longitude"]) for point in uncovered])
+
+    @instrumented("find_hospitals_in_window", count_results=True)
+    def find_hospitals_in_window(self, min_lat, min_lon, max_lat, max_lon, session=None):
+        # Find all hospitals inside a latitude/longitude rectangle, such as the visible map area
+        in_window = self.spatial_index.search_window(min_lat, min_lon, max_lat, max_lon)
+        self.search_history.record("window", (min_lat, min_lon, max_lat, max_lon), in_window, session=session)
+        return in_window
+
+     #Method to get the best hospitals within a given distance range
+    @instrumented("best_hospitals_within_range", count_results=True)
+    def best_hospitals_within_range(self, user_location, distance_range=1, session=None):
+    # Every hospital sharing the highest rating in range; the R-Tree skips subtrees that cannot reach it.
+        best_hospitals = self._cached_query("best", user_location, 1, distance_range, lambda: (
+            self.spatial_index.search_top_rated(user_location, distance_range, k=1, include_ties=True), distance_range))
+        if not best_hospitals:
+            return "No hospitals found within the specified distance range."
+        self.search_history.record("best", (user_location, distance_range), best_hospitals, session=session)
         return best_hospitals
+
+    @instrumented("top_rated_hospitals_within_range", count_results=True)
+    def top_rated_hospitals_within_range(self, user_location, distance_range, k=3, session=None):
+        # The k best-rated hospitals within the given distance range, best first
+        top_rated = self._cached_query("top_rated", user_location, k, distance_range, lambda: (
+            self.spatial_index.search_top_rated(user_location, distance_range, k=k), distance_range))
+        self.search_history.record("top_rated", (user_location, distance_range, k), top_rated, session=session)
+        return top_rated
     
 
-    def view_search_history(self):
+    def view_search_history(self, session=None):
+        # Print the searches of a session (default: the current one), most recent first
         print("Search History:")
-        history = self.search_history.view_history()
+        history = self.search_history.view_history(session)
         if history:
             for i in history:
                 print(i)
@@ -136,66 +427,66 @@ hospitals = [
 ]
 
 
-# Initialize the project and add hospitals
-project = HospitalProject()
-for hospital in hospitals:
-    project.add_hospital(hospital)
+if __name__ == "__main__":
+    # Initialize the project and add hospitals
+    project = HospitalProject()
+    project.add_hospitals(hospitals)
 
-project.delete_hospital("Metro")
+    project.delete_hospital("Metro")
 
-# Example usage
-user_location = (40.730610, -73.935242)
+    # Example usage
+    user_location = (40.730610, -73.935242)
 
-# Find nearest hospitals within <1 km, <2 km, <5 km
-print("\nNearest Hospitals within 1 km:")
-nearest_hospitals_1km = project.find_nearest_hospitals_within_range(user_location, 1)
-for hospital in nearest_hospitals_1km:
-    print(f"{hospital['name']} - {hospital['rating']} stars")
-print()
+    # Find nearest hospitals within <1 km, <2 km, <5 km
+    print("\nNearest Hospitals within 1 km:")
+    nearest_hospitals_1km = project.find_nearest_hospitals_within_range(user_location, 1)
+    for hospital in nearest_hospitals_1km:
+        print(f"{hospital['name']} - {hospital['rating']} stars")
+    print()
 
-print("\nNearest Hospitals within 2 km:")
-nearest_hospitals_2km = project.find_nearest_hospitals_within_range(user_location, 2)
-for hospital in nearest_hospitals_2km:
-    print(f"{hospital['name']} - {hospital['rating']} stars")
-print()
+    print("\nNearest Hospitals within 2 km:")
+    nearest_hospitals_2km = project.find_nearest_hospitals_within_range(user_location, 2)
+    for hospital in nearest_hospitals_2km:
+        print(f"{hospital['name']} - {hospital['rating']} stars")
+    print()
 
-print("\nNearest Hospitals within 5 km:")
-nearest_hospitals_5km = project.find_nearest_hospitals_within_range(user_location, 5)
-for hospital in nearest_hospitals_5km:
-    print(f"{hospital['name']} - {hospital['rating']} stars")
-print()
+    print("\nNearest Hospitals within 5 km:")
+    nearest_hospitals_5km = project.find_nearest_hospitals_within_range(user_location, 5)
+    for hospital in nearest_hospitals_5km:
+        print(f"{hospital['name']} - {hospital['rating']} stars")
+    print()
 
-print("\nSearch results for hospitals with 'City' in their name:")
-search_results = project.find_hospital_by_hospitalname("City")
+    print("\nSearch results for hospitals with 'City' in their name:")
+    search_results = project.find_hospital_by_hospitalname("City")
 
-for hospital in search_results:
-    print(f"Hospital: {hospital['name']}, Address: {hospital['address']}")
-print()
+    for hospital in search_results:
+        print(f"Hospital: {hospital['name']}, Address: {hospital['address']}")
+    print()
 
-print("\nSearch results for hospitals in New York:")
-hospitals_in_ny = project.find_hospital_by_city("New York")
-print()
+    print("\nSearch results for hospitals in New York:")
+    hospitals_in_ny = project.find_hospital_by_city("New York")
+    print()
 
-print("All Hospital details ")
-print(project.display_hospitals(hospitals))
+    print("All Hospital details ")
+    print(project.display_hospitals(hospitals))
 
-print()
-# Display the best hospitals in case of an emergency in a readable format
-print("\nBest hospitals in case of emergency:")
-best_hospitals = project.best_hospitals_within_range(user_location)
+    print()
+    # Display the best hospitals in case of an emergency in a readable format
+    print("\nBest hospitals in case of emergency:")
+    best_hospitals = project.best_hospitals_within_range(user_location)
 
-if not best_hospitals:
-    print("No hospitals found in the specified range.")
-else:
-    for hospital in best_hospitals:
-        print(f"Hospital: {hospital['name']}, Rating: {hospital['rating']}, Address: {hospital['address']}")
+    if not best_hospitals:
+        print("No hospitals found in the specified range.")
+    else:
+        for hospital in best_hospitals:
+            print(f"Hospital: {hospital['name']}, Rating: {hospital['rating']}, Address: {hospital['address']}")
 
-print()
+    print()
 
-for hospital in hospitals:
-    project.show_hospital_details(hospital)
+    for hospital in hospitals:
+        project.show_hospital_details(hospital)
 
-print()
+    print()
 
-# Display the search history in a more readable format
-project.view_search_history()
+    # Display the search history in a more readable format
+    project.view_search_history()
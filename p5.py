@@ -1,88 +1,183 @@
-class Node:
-    def __init__(self, value):
-        # Initialize a node with a value and set its next reference to None.
-        self.value = value
-        self.next = None
-
-class Stack:
-    def __init__(self):
-        # Initialize an empty stack with a 'top' pointer and a 'size' counter.
-        self.top = None
+import json
+import time
+from collections import OrderedDict
+
+# Number of searches a SearchHistory keeps per session by default; the oldest are overwritten first.
+DEFAULT_HISTORY_CAPACITY = 1000
+# Number of sessions with a history kept by default; the least recently used one is dropped first.
+DEFAULT_MAX_SESSIONS = 1024
+# Most result ids stored with one search; the total number of results is always kept.
+MAX_RECORDED_RESULTS = 20
+
+# One search as recorded: what kind of query it was, its parameters and the ids of (up to
+# MAX_RECORDED_RESULTS of) its results. The text shown in the history is only built when it is viewed.
+class SearchRecord:
+    __slots__ = ('kind', 'params', 'result_ids', 'result_count', 'time')
+
+    def __init__(self, kind, params, result_ids, result_count, time):
+        self.kind = kind
+        self.params = params
+        self.result_ids = result_ids
+        self.result_count = result_count
+        self.time = time
+
+    def to_dict(self):
+        return {"time": self.time, "kind": self.kind, "params": list(self.params),
+                "result_ids": list(self.result_ids), "result_count": self.result_count}
+
+
+def _result_names(record, lookup):
+    # Names of the recorded results as they are now; hospitals that are gone show as "#id".
+    names = []
+    for hospital_id in record.result_ids:
+        hospital = lookup(hospital_id) if lookup is not None else None
+        names.append(hospital['name'] if hospital is not None else f"#{hospital_id}")
+    return names
+
+
+def _render_city(record, lookup):
+    if not record.result_count:
+        return f"Searched hospitals in {record.params[0]}: No hospitals found"
+    text = f"Searched hospitals in {record.params[0]}:\n " + ' \n '.join(_result_names(record, lookup))
+    if record.result_count > len(record.result_ids):
+        text += f" \n ... and {record.result_count - len(record.result_ids)} more"
+    return text
+
+
+def _render_name(record, lookup):
+    name = record.params[0]
+    if not record.result_count:
+        return f"Search by name {name}: No hospitals found"
+    return f"Search by name {name} - Hospitals with {name} in them : {_result_names(record, lookup)[0]}"
+
+
+# How each kind of record is rendered, given the record and a function from hospital id to hospital.
+_RENDERERS = {
+    "text": lambda record, lookup: record.params[0],
+    "delete": lambda record, lookup: f"Deleted hospital: {record.params[0]}",
+    "nearest": lambda record, lookup: f"Nearest hospitals search at location: {record.params[0]}, Results: {record.params[1]}",
+    "range": lambda record, lookup: f"Hospitals within {record.params[1]} km of location: {record.params[0]}",
+    "window": lambda record, lookup: "Hospitals in area: ({}, {}) - ({}, {})".format(*record.params),
+    "best": lambda record, lookup: f"Best Hospital in case of Emergency : {_result_names(record, lookup)[0]} ",
+    "top_rated": lambda record, lookup: f"Top {record.params[2]} rated hospitals within {record.params[1]} km of location: {record.params[0]}",
+    "name": _render_name,
+    "city": _render_city,
+}
+
+
+# Fixed-size ring buffer of records: pushing overwrites the oldest record once it is full.
+class _Ring:
+    __slots__ = ('records', 'next', 'size')
+
+    def __init__(self, capacity):
+        self.records = [None] * capacity
+        self.next = 0
         self.size = 0
 
-    def push(self, value):
-        # Create a new node with the given value.
-        new_node = Node(value)
-        # If the stack is empty, set the new node as the top.
-        if self.size == 0:
-            self.top = new_node
-        else:
-            # Otherwise, link the new node to the current top and update the top.
-            new_node.next = self.top
-            self.top = new_node
-        # Increment the size of the stack.
-        self.size += 1
-        return True
+    def push(self, record):
+        self.records[self.next] = record
+        self.next = (self.next + 1) % len(self.records)
+        self.size = min(self.size + 1, len(self.records))
 
     def pop(self):
-        # Remove and return the value of the top node.
-        if self.size == 0:
-            return None  # Return None if the stack is empty.
-        # Store the current top node.
-        temp = self.top
-        # Move the top pointer to the next node.
-        self.top = self.top.next
-        # Disconnect the popped node from the stack.
-        temp.next = None
-        # Decrement the size of the stack.
-        self.size -= 1
-        return temp.value
-
-    def peek(self):
-        """Return the value of the top node without popping."""
-        # If the stack is empty, return None.
-        if self.size == 0:
+        if not self.size:
             return None
-        # Return the value of the top node.
-        return self.top.value
+        self.next = (self.next - 1) % len(self.records)
+        record, self.records[self.next] = self.records[self.next], None
+        self.size -= 1
+        return record
 
-    def is_empty(self):
-        # Check if the stack is empty by comparing the size to 0.
-        return self.size == 0
+    def newest_first(self):
+        capacity = len(self.records)
+        return [self.records[(self.next - 1 - i) % capacity] for i in range(self.size)]
 
-    def get_size(self):
-        # Return the number of elements in the stack.
-        return self.size
 
 class SearchHistory:
-    def __init__(self):
-        # Initialize a search history using a stack to store search details.
-        self.history_stack = Stack()
-
-    def push_search(self, search_details):
-        """Push a new search detail onto the history stack."""
-        # Add a new search detail to the history stack.
-        self.history_stack.push(search_details)
-
-    def pop_search(self):
-        """Pop the last search detail from the history stack."""
-        # Remove and return the most recent search detail from the history stack.
-        return self.history_stack.pop()
-
-    def view_history(self):
-        """View all past searches."""
-        # Collect all search details from the stack into a list.
-        history = []
-        # Start from the top of the stack.
-        current = self.history_stack.top
-        # Traverse through the stack to collect each search detail.
-        while current is not None:
-            history.append(current.value)
-            current = current.next
-        # Return the list of all past search details.
-        return history
-
-    def get_last_search(self):
-        """Get the last search (top of the stack)."""
-        # Return the most recent search detail without removing it.
-        return self.history_stack.peek()
+    """Bounded history of searches, kept as structured records and rendered as text only when viewed.
+
+    Each session (None unless use_session() picks another) keeps its last `capacity` searches in a ring
+    buffer, so recording is O(1) and memory stays bounded; at most `max_sessions` sessions are kept.
+    The methods taking `session` act on that session instead of the current one, so callers serving
+    several users at once need not switch sessions. `lookup` maps a hospital id to its record, for
+    showing result names. With `log_path`, every record is also appended to that file as a line of JSON,
+    written out as soon as it is recorded.
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_CAPACITY, lookup=None, max_sessions=DEFAULT_MAX_SESSIONS, log_path=None):
+        if capacity < 1 or max_sessions < 1:
+            raise ValueError("capacity and max_sessions must be at least 1")
+        self.capacity = capacity
+        self.lookup = lookup
+        self.max_sessions = max_sessions
+        self.session = None
+        self._rings = OrderedDict()  # session -> _Ring, least recently used first
+        # Line buffered, so each record reaches the file even if the process dies without close().
+        self._log = open(log_path, 'a', buffering=1, encoding='utf-8') if log_path is not None else None
+
+    def use_session(self, session):
+        """Record and view the searches of `session` from now on; returns the previous session."""
+        previous, self.session = self.session, session
+        return previous
+
+    def _ring(self, session, create=False):
+        ring = self._rings.get(session)
+        if ring is None:
+            if not create:
+                return None
+            ring = self._rings[session] = _Ring(self.capacity)
+            if len(self._rings) > self.max_sessions:
+                self._rings.popitem(last=False)
+        else:
+            self._rings.move_to_end(session)
+        return ring
+
+    def record(self, kind, params, results=None, session=None):
+        """Record a search of the given kind (see _RENDERERS) with its parameters tuple and result hospitals,
+        in `session` (default: the current one)."""
+        if session is None:
+            session = self.session
+        if results:
+            result_ids = tuple(hospital['id'] for hospital in results[:MAX_RECORDED_RESULTS])
+            result_count = len(results)
+        else:
+            result_ids, result_count = (), 0
+        record = SearchRecord(kind, params, result_ids, result_count, time.time())
+        self._ring(session, create=True).push(record)
+        if self._log is not None:
+            entry = record.to_dict()
+            entry["session"] = session
+            self._log.write(json.dumps(entry, default=str) + "\n")
+
+    def push_search(self, search_details, session=None):
+        """Push a new search detail (already formatted text) onto the history."""
+        self.record("text", (search_details,), session=session)
+
+    def render(self, record):
+        """Return the text of one record."""
+        return _RENDERERS[record.kind](record, self.lookup)
+
+    def records(self, session=None):
+        """Return the records of a session (default: the current one), most recent first."""
+        ring = self._ring(self.session if session is None else session)
+        return ring.newest_first() if ring is not None else []
+
+    def pop_search(self, session=None):
+        """Pop the last search of a session (default: the current one) and return its text (None if there is none)."""
+        ring = self._ring(self.session if session is None else session)
+        record = ring.pop() if ring is not None else None
+        return None if record is None else self.render(record)
+
+    def view_history(self, session=None):
+        """View all past searches of a session (default: the current one) as text, most recent first."""
+        return [self.render(record) for record in self.records(session)]
+
+    def get_last_search(self, session=None):
+        """Get the text of the last search of a session (default: the current one)."""
+        records = self.records(session)
+        return self.render(records[0]) if records else None
+
+    def close(self):
+        """Flush and close the log file, if there is one."""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
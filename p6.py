@@ -0,0 +1,318 @@
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then reported as None.
+    resource = None
+
+from p1 import np
+from p3 import Trie, RadixTrie
+from p4 import HospitalProject
+
+# Building blocks for synthetic hospital names and addresses.
+NAME_PREFIXES = ["City", "General", "St. Mary's", "St. Peter's", "Green Valley", "Northside", "Southview",
+                 "Eastside", "Westside", "Lakeside", "Harbor", "Community", "Downtown", "Metro", "Sunshine"]
+NAME_SUFFIXES = ["Hospital", "Medical Center", "Medical Clinic", "Health Center", "Children's Hospital"]
+STREETS = ["Main St", "Green Rd", "Metro Blvd", "Sunshine Ave", "General St", "Harbor Ave", "Community Blvd",
+           "Lakeside Ave", "Downtown St", "East River Rd", "Park Ave", "Broadway"]
+CITIES = [("New York", "NY"), ("Buffalo", "NY"), ("Boston", "MA"), ("Chicago", "IL"), ("Houston", "TX"),
+          ("Austin", "TX"), ("Seattle", "WA"), ("Denver", "CO"), ("Miami", "FL"), ("Phoenix", "AZ")]
+# City centres for the clustered distribution, in the order of CITIES.
+CITY_CENTRES = [(40.71, -74.01), (42.89, -78.88), (42.36, -71.06), (41.88, -87.63), (29.76, -95.37),
+                (30.27, -97.74), (47.61, -122.33), (39.74, -104.99), (25.76, -80.19), (33.45, -112.07)]
+# Spread of the clustered distribution around a city centre, in degrees (about 15 km).
+CITY_SPREAD_DEGREES = 0.15
+DISTRIBUTIONS = ("clustered", "uniform")
+
+
+def _random_location(rng, distribution):
+    """Return (latitude, longitude, index into CITIES) drawn from one of the DISTRIBUTIONS."""
+    city = rng.randrange(len(CITIES))
+    if distribution == "clustered":
+        # Hospitals bunched around city centres, as in metropolitan areas.
+        lat, lon = CITY_CENTRES[city]
+        return rng.gauss(lat, CITY_SPREAD_DEGREES), rng.gauss(lon, CITY_SPREAD_DEGREES), city
+    if distribution == "uniform":
+        # Hospitals spread evenly over the continental US, as in rural areas.
+        return rng.uniform(25.0, 49.0), rng.uniform(-124.0, -67.0), city
+    raise ValueError(f"Unknown distribution: {distribution!r}")
+
+
+def generate_hospitals(count, seed=42, distribution="uniform"):
+    """Generate `count` synthetic hospital records with realistic looking names and addresses.
+
+    The same seed and distribution ("clustered" or "uniform") always give the same hospitals.
+    """
+    rng = random.Random(seed)
+    hospitals = []
+    for i in range(count):
+        latitude, longitude, city = _random_location(rng, distribution)
+        city, state = CITIES[city]
+        hospitals.append({
+            "name": f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUFFIXES)} {i}",
+            "latitude": latitude,
+            "longitude": longitude,
+            "rating": round(rng.uniform(1.0, 5.0), 1),
+            "address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {city}, {state}",
+            "contact": f"555-{rng.randint(0, 9999):04d}",
+        })
+    return hospitals
+
+
+def _time_per_call(function, arguments, repeat):
+    """Average wall-clock time in microseconds of calling `function` once per argument."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for argument in arguments:
+            function(argument)
+    return (time.perf_counter() - start) / (repeat * len(arguments)) * 1e6
+
+
+def benchmark_tries(count=20000, seed=42, repeat=5):
+    """Compare memory and lookup speed of Trie and RadixTrie on synthetic names and addresses."""
+    hospitals = generate_hospitals(count, seed)
+    prefixes = ["c", "city", "st. p", "green valley medical", "community health center 1"]
+    results = {}
+    for trie_class in (Trie, RadixTrie):
+        # Memory held by a name trie plus an address trie, as in HospitalProject.
+        tracemalloc.start()
+        start = time.perf_counter()
+        trie_name, trie_address = trie_class(), trie_class()
+        for hospital in hospitals:
+            trie_name.insert(hospital['name'], hospital)
+            trie_address.insert(hospital['address'], hospital)
+        build_seconds = time.perf_counter() - start
+        memory_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        results[trie_class.__name__] = {
+            "build_s": build_seconds,
+            "memory_mb": memory_bytes / 2**20,
+            "starts_with_us": _time_per_call(trie_name.starts_with, prefixes, repeat),
+            "autocomplete_top5_us": _time_per_call(lambda prefix: trie_name.autocomplete(prefix, limit=5), prefixes, repeat),
+            "search_all_us": _time_per_call(trie_name.search, prefixes, repeat),
+        }
+    return results
+
+
+def print_results(title, results):
+    """Print benchmark results as a simple table."""
+    print(title)
+    columns = list(next(iter(results.values())))
+    print(f"{'':<12}" + "".join(f"{column:>22}" for column in columns))
+    for name, row in results.items():
+        print(f"{name:<12}" + "".join(f"{row[column]:>22.3f}" for column in columns))
+
+
+def _latencies(function, arguments):
+    """Wall-clock time in microseconds of each call of `function`, once per argument."""
+    timer = time.perf_counter
+    latencies = []
+    for argument in arguments:
+        start = timer()
+        function(argument)
+        latencies.append((timer() - start) * 1e6)
+    return latencies
+
+
+def _percentile(sorted_values, fraction):
+    """The value below which `fraction` of the sorted values lie (nearest rank)."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+    return {"calls": len(latencies), "mean_us": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50_us": _percentile(latencies, 0.50), "p99_us": _percentile(latencies, 0.99)}
+
+
+def _peak_memory_mb():
+    """Peak resident memory of this process so far, in MB (None where it cannot be measured).
+
+    This is a high-water mark for the whole process, so it only describes one dataset when that dataset
+    had the process to itself (see run_suite).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def benchmark_operations(count, distribution="uniform", seed=42, queries=1000, radius_km=10.0, k=5):
+    """Time every index operation of a HospitalProject holding `count` synthetic hospitals.
+
+    Returns a dict with the bulk load time, the process's peak memory, and p50/p99/mean latencies
+    (microseconds) of single inserts, deletes, kNN, radius, best-in-range, prefix autocomplete and
+    city searches, each over `queries` calls. Query locations follow the same distribution as the data.
+    """
+    hospitals = generate_hospitals(count, seed, distribution)
+    project = HospitalProject()
+    start = time.perf_counter()
+    project.add_hospitals(hospitals)
+    bulk_load_s = time.perf_counter() - start
+    del hospitals
+
+    rng = random.Random(seed + 1)
+    locations = [_random_location(rng, distribution)[:2] for _ in range(queries)]
+    # Prefixes of one to eight characters of existing names, and city names for the address index.
+    records = project.hospitals
+    prefixes = [rng.choice(records)['name'][:rng.randint(1, 8)] for _ in range(queries)]
+    cities = [rng.choice(CITIES)[0] for _ in range(queries)]
+    del records
+    extra = generate_hospitals(queries, seed + 2, distribution)
+
+    results = {"count": count, "distribution": distribution, "bulk_load_s": bulk_load_s}
+    inserted = []
+    results["insert"] = _summary(_latencies(lambda hospital: inserted.append(project.add_hospital(hospital)), extra))
+    results["delete"] = _summary(_latencies(project.delete_hospital_by_id, [record.id for record in inserted]))
+    results["knn"] = _summary(_latencies(lambda location: project.find_nearest_hospitals(location, k), locations))
+    results["radius"] = _summary(_latencies(
+        lambda location: project.find_nearest_hospitals_within_range(location, radius_km), locations))
+    results["best_in_range"] = _summary(_latencies(
+        lambda location: project.best_hospitals_within_range(location, radius_km), locations))
+    results["autocomplete"] = _summary(_latencies(project.autocomplete_hospital_name, prefixes))
+    # The project's own city search prints its matches, so the address index is timed directly.
+    results["city_search"] = _summary(_latencies(project.address_index.search, cities))
+    results["peak_memory_mb"] = _peak_memory_mb()
+    return results
+
+
+def run_suite(sizes=(10_000, 100_000), distributions=DISTRIBUTIONS, seed=42, queries=1000, isolate=True):
+    """Run benchmark_operations for every size and distribution and return a JSON-ready report.
+
+    With `isolate=True` each dataset runs in a freshly spawned process, so its peak memory is its own
+    and not the high-water mark of every dataset before it. With `isolate=False` everything runs in
+    this process and peak memory is reported as None.
+    """
+    report = {
+        "meta": {"seed": seed, "queries": queries, "python": platform.python_version(),
+                 "platform": platform.platform(), "numpy": np is not None},
+        "results": {},
+    }
+    for count in sorted(sizes):
+        for distribution in distributions:
+            arguments = (count, distribution, seed, queries)
+            if isolate:
+                with multiprocessing.get_context('spawn').Pool(1) as pool:
+                    results = pool.apply(benchmark_operations, arguments)
+            else:
+                results = benchmark_operations(*arguments)
+                results["peak_memory_mb"] = None
+            report["results"][f"{distribution}-{count}"] = results
+    return report
+
+
+def _metrics(report):
+    """Flatten a report's numbers into {"uniform-10000.knn.p99_us": value, ...}."""
+    metrics = {}
+    for dataset, results in report["results"].items():
+        for name, value in results.items():
+            if isinstance(value, dict):
+                for statistic, number in value.items():
+                    if statistic != "calls":
+                        metrics[f"{dataset}.{name}.{statistic}"] = number
+            elif isinstance(value, (int, float)) and name != "count":
+                metrics[f"{dataset}.{name}"] = value
+    return metrics
+
+
+def compare_reports(baseline, current, threshold=0.2, thresholds=None):
+    """List the metrics of `current` that regressed against `baseline`.
+
+    Every metric is a time or a memory size, so larger is worse. A metric regresses when it grew by
+    more than its threshold, as a fraction of the baseline value. `thresholds` maps metric name
+    patterns (fnmatch style, e.g. "*.p99_us") to their own threshold; the first matching pattern
+    wins and a threshold of None stops a metric from being tracked. A tracked metric that the
+    baseline measured but `current` lacks counts as a regression too, so a dropped benchmark cannot
+    pass unnoticed. Returns [(metric, baseline value, current value, relative change), ...], with a
+    current value and change of None for missing metrics.
+    """
+    thresholds = thresholds or {}
+    baseline_metrics, current_metrics = _metrics(baseline), _metrics(current)
+    regressions = []
+    for metric, old in baseline_metrics.items():
+        limit = next((value for pattern, value in thresholds.items() if fnmatch.fnmatchcase(metric, pattern)), threshold)
+        if limit is None or old is None:
+            continue
+        new = current_metrics.get(metric)
+        if new is None:
+            regressions.append((metric, old, None, None))
+            continue
+        if old <= 0:
+            continue
+        change = (new - old) / old
+        if change > limit:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+def _print_report(report):
+    for dataset, results in report["results"].items():
+        peak = results["peak_memory_mb"]
+        print(f"{dataset}: bulk load {results['bulk_load_s']:.2f} s, peak memory "
+              f"{'n/a' if peak is None else f'{peak:.0f} MB'}")
+        for name, value in results.items():
+            if isinstance(value, dict):
+                print(f"  {name:<14} p50 {value['p50_us']:>10.1f} us   p99 {value['p99_us']:>10.1f} us")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GeoHealth benchmarks")
+    commands = parser.add_subparsers(dest="command")
+    run = commands.add_parser("run", help="time every index operation on synthetic datasets")
+    run.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                     help="dataset sizes, e.g. 10000 100000 1000000 5000000")
+    run.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--queries", type=int, default=1000, help="calls timed per operation")
+    run.add_argument("--output", help="write the JSON report here")
+    compare = commands.add_parser("compare", help="fail if a report regressed against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.2,
+                         help="allowed relative growth of a metric (default 0.2, i.e. 20%%)")
+    compare.add_argument("--thresholds", help='JSON file of per-metric thresholds, e.g. {"*.p99_us": 0.5}')
+    commands.add_parser("tries", help="compare Trie and RadixTrie memory and speed")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_suite(args.sizes, args.distributions, args.seed, args.queries)
+        _print_report(report)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(report, file, indent=2)
+        return 0
+    if args.command == "compare":
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        thresholds = None
+        if args.thresholds:
+            with open(args.thresholds) as file:
+                thresholds = json.load(file)
+        regressions = compare_reports(baseline, current, args.threshold, thresholds)
+        for metric, old, new, change in regressions:
+            if new is None:
+                print(f"REGRESSION {metric}: {old:.3f} -> missing from {args.current}")
+            else:
+                print(f"REGRESSION {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+        print(f"{len(regressions)} regression(s)")
+        return 1 if regressions else 0
+    print_results("Trie vs RadixTrie (20,000 hospitals, name + address tries)", benchmark_tries())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# Fields every hospital record carries besides its id.
+HOSPITAL_FIELDS = ('name', 'latitude', 'longitude', 'rating', 'address', 'contact')
+
+
+# Hospital record class: one compact object per hospital, shared by every index.
+# `__slots__` keeps a record to a fixed set of fields with no per-object dict. Records also answer
+# dict-style lookups (hospital['name']), so code written against plain hospital dicts keeps working.
+class Hospital:
+    __slots__ = ('id',) + HOSPITAL_FIELDS
+
+    def __init__(self, hospital_id, name, latitude, longitude, rating, address, contact=''):
+        self.id = hospital_id
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.rating = rating
+        self.address = address
+        self.contact = contact
+
+    def __getitem__(self, field):
+        if field != 'id' and field not in HOSPITAL_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __contains__(self, field):
+        return field == 'id' or field in HOSPITAL_FIELDS
+
+    def get(self, field, default=None):
+        """Return a field's value, or the default for unknown fields (like dict.get)."""
+        return self[field] if field in self else default
+
+    def keys(self):
+        """Return the field names, id first (like dict.keys)."""
+        return ('id',) + HOSPITAL_FIELDS
+
+    def to_dict(self):
+        """Return the record as a plain dict."""
+        return {field: getattr(self, field) for field in self.keys()}
+
+    def __repr__(self):
+        return f"Hospital(id={self.id}, name={self.name!r}, rating={self.rating})"
+
+
+class HospitalStore:
+    """Central store of hospital records with hash indexes on id and on name.
+
+    The store assigns every record an integer id. Indexes such as the R-Tree and the tries hold
+    references to the same records, and lookups and removals here are O(1).
+    """
+
+    def __init__(self):
+        # 'records' maps id -> Hospital; 'by_name' maps a lowercased name -> {id: Hospital}
+        # (names are not unique, e.g. two branches of "City Hospital").
+        self.records = {}
+        self.by_name = {}
+        self.next_id = 1
+
+    def add(self, hospital):
+        """Create a record from a hospital mapping and return it.
+
+        The mapping's own 'id' is kept if it has one; otherwise the next free id is assigned.
+        """
+        return self.add_all([hospital])[0]
+
+    def add_all(self, hospitals):
+        """Create records for a batch of hospital mappings and return them, in order.
+
+        Ids are assigned and checked as add() would one mapping at a time, but every record is built
+        before any is stored: a clashing id or a missing field raises and leaves the store unchanged.
+        """
+        records = []
+        new_ids = set()
+        next_id = self.next_id
+        for hospital in hospitals:
+            hospital_id = hospital.get('id')
+            if hospital_id is None:
+                hospital_id = next_id
+            elif hospital_id in self.records or hospital_id in new_ids:
+                raise ValueError(f"Hospital id {hospital_id} is already in use")
+            next_id = max(next_id, hospital_id + 1)
+            new_ids.add(hospital_id)
+            records.append(Hospital(hospital_id, hospital['name'], hospital['latitude'], hospital['longitude'],
+                                    hospital['rating'], hospital['address'], hospital.get('contact', '')))
+
+        self.next_id = next_id
+        for record in records:
+            self.records[record.id] = record
+            self.by_name.setdefault(record.name.lower(), {})[record.id] = record
+        return records
+
+    def get(self, hospital_id):
+        """Return the record with the given id, or None."""
+        return self.records.get(hospital_id)
+
+    def remove(self, hospital_id):
+        """Remove and return the record with the given id, or None if there is no such record."""
+        record = self.records.pop(hospital_id, None)
+        if record is not None:
+            same_name = self.by_name[record.name.lower()]
+            del same_name[hospital_id]
+            if not same_name:
+                del self.by_name[record.name.lower()]
+        return record
+
+    def update(self, record, fields):
+        """Set new field values on a stored record, keeping the name index in step."""
+        if 'name' in fields:
+            same_name = self.by_name[record.name.lower()]
+            del same_name[record.id]
+            if not same_name:
+                del self.by_name[record.name.lower()]
+            self.by_name.setdefault(fields['name'].lower(), {})[record.id] = record
+        for field, value in fields.items():
+            setattr(record, field, value)
+        return record
+
+    def find_by_name(self, name):
+        """Return every record with exactly this name (case-insensitive), oldest first."""
+        return list(self.by_name.get(name.lower(), {}).values())
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __contains__(self, hospital_id):
+        return hospital_id in self.records
@@ -0,0 +1,481 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from p1 import RTree, RTreeNode
+from p3 import RadixTrie, InvertedIndex, tokenize
+from p7 import Hospital
+
+# Snapshot file layout (version 2; version 1 files, whose rtree.meta had no leaf capacities, are refused):
+#   header   magic, byte order (0 little / 1 big endian), format version, number of sections
+#   table    one entry per section: name, array typecode, byte offset, number of items
+#   sections flat arrays in the machine's native byte order, each starting on an 8-byte boundary
+# Every index is stored as flat arrays (nodes in breadth-first order, so the children of a node are
+# contiguous), which lets a loaded snapshot answer queries straight from the mapped file.
+SNAPSHOT_MAGIC = b'GHSNAP'
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct('<6sBxII')
+_SECTION = struct.Struct('<40ss7xQQ')
+_BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError("A loaded snapshot is read-only; add the hospitals to a new HospitalProject to change them")
+
+
+# Collects named arrays and writes them out as one snapshot file.
+class _SnapshotWriter:
+    def __init__(self):
+        self.sections = {}
+
+    def add(self, name, typecode, values):
+        self.sections[name] = values if isinstance(values, array) else array(typecode, values)
+
+    # Strings are stored as one UTF-8 blob plus the offset where each string starts (and one past the end).
+    def add_strings(self, name, strings):
+        offsets = array('q', [0])
+        text = bytearray()
+        for string in strings:
+            text += string.encode('utf-8')
+            offsets.append(len(text))
+        self.sections[name + '.offsets'] = offsets
+        self.sections[name + '.text'] = array('B', text)
+
+    # Written to a temporary file first and moved into place, so readers never see a half-written snapshot.
+    def write(self, path):
+        table = []
+        offset = _aligned(_HEADER.size + len(self.sections) * _SECTION.size)
+        for name, values in self.sections.items():
+            table.append(_SECTION.pack(name.encode('ascii'), values.typecode.encode('ascii'), offset, len(values)))
+            offset = _aligned(offset + len(values) * values.itemsize)
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(_HEADER.pack(SNAPSHOT_MAGIC, _BYTE_ORDER, SNAPSHOT_VERSION, len(self.sections)))
+            file.write(b''.join(table))
+            for values in self.sections.values():
+                file.write(b'\0' * (_aligned(file.tell()) - file.tell()))
+                values.tofile(file)
+        os.replace(temporary_path, path)
+
+
+def write_snapshot(path, store, rtree, trie_name, trie_address, address_index):
+    """Write the records and every index of a project to a snapshot file.
+
+    The spatial index is always stored as an R-Tree; any other engine is packed into one first.
+    """
+    if not isinstance(rtree, RTree):
+        packed = RTree()
+        packed.bulk_load(rtree.all_hospitals())
+        rtree = packed
+    writer = _SnapshotWriter()
+    records = list(store)
+    index_of = {id(record): index for index, record in enumerate(records)}
+
+    # Record columns, plus the record positions sorted by id and by name for lookups.
+    writer.add('records.id', 'q', (record['id'] for record in records))
+    writer.add('records.latitude', 'd', (record['latitude'] for record in records))
+    writer.add('records.longitude', 'd', (record['longitude'] for record in records))
+    writer.add('records.rating', 'd', (record['rating'] for record in records))
+    writer.add_strings('records.name', (record['name'] for record in records))
+    writer.add_strings('records.address', (record['address'] for record in records))
+    writer.add_strings('records.contact', (record['contact'] for record in records))
+    writer.add('records.by_id', 'q', sorted(range(len(records)), key=lambda index: records[index]['id']))
+    writer.add('records.by_name', 'q', sorted(range(len(records)), key=lambda index: records[index]['name'].lower()))
+
+    _pack_rtree(writer, rtree, index_of)
+    _pack_radix_trie(writer, 'trie_name', trie_name, index_of)
+    _pack_radix_trie(writer, 'trie_address', trie_address, index_of)
+    _pack_inverted_index(writer, 'address_index', address_index, records)
+    writer.write(path)
+
+
+def _pack_rtree(writer, rtree, index_of):
+    """Flatten the R-Tree: per node its kind, children span, box and max rating; leaf entries as columns."""
+    is_leaf, first, count, boxes, max_ratings = array('b'), array('q'), array('q'), array('d'), array('d')
+    entries, latitudes, longitudes, ratings = array('q'), array('d'), array('d'), array('d')
+    nodes = [rtree.root]
+    position = 0
+    while position < len(nodes):
+        node = nodes[position]
+        position += 1
+        is_leaf.append(node.is_leaf)
+        count.append(len(node.children))
+        if node.is_leaf:
+            # A leaf's span points into the entry columns.
+            first.append(len(entries))
+            entries.extend(index_of[id(hospital)] for hospital in node.children)
+            latitudes.extend(node.latitudes)
+            longitudes.extend(node.longitudes)
+            ratings.extend(node.ratings)
+        else:
+            # An internal node's span points at its children, which are queued next to each other.
+            first.append(len(nodes))
+            nodes.extend(node.children)
+        (min_lat, min_lon), (max_lat, max_lon) = node.bounding_box or ((0.0, 0.0), (0.0, 0.0))
+        boxes.extend((min_lat, min_lon, max_lat, max_lon))
+        max_ratings.append(node.max_rating)
+
+    writer.add('rtree.meta', 'q', (rtree.max_entries, rtree.min_entries, rtree.max_leaf_entries, rtree.min_leaf_entries))
+    for name, values in (('is_leaf', is_leaf), ('first', first), ('count', count), ('box', boxes),
+                         ('max_rating', max_ratings), ('entries', entries), ('latitude', latitudes),
+                         ('longitude', longitudes), ('rating', ratings)):
+        writer.add('rtree.' + name, values.typecode, values)
+
+
+def _pack_radix_trie(writer, prefix, trie, index_of):
+    """Flatten a RadixTrie: per node its edge label, children span, hospitals and top-k cache."""
+    first, count = array('q'), array('q')
+    hospital_offsets, hospitals = array('q', [0]), array('q')
+    top_offsets, top = array('q', [0]), array('q')
+    labels = []
+    nodes = [trie.root]
+    position = 0
+    while position < len(nodes):
+        node = nodes[position]
+        position += 1
+        labels.append(node.label())
+        children = list((node.children or {}).values())
+        first.append(len(nodes))
+        count.append(len(children))
+        nodes.extend(children)
+        hospitals.extend(index_of[id(hospital)] for hospital in node.hospitals or ())
+        hospital_offsets.append(len(hospitals))
+        top.extend(index_of[id(hospital)] for hospital in node.top)
+        top_offsets.append(len(top))
+
+    writer.add(prefix + '.meta', 'q', (trie.top_k,))
+    writer.add_strings(prefix + '.label', labels)
+    for name, values in (('first', first), ('count', count), ('hospitals.offsets', hospital_offsets),
+                         ('hospitals', hospitals), ('top.offsets', top_offsets), ('top', top)):
+        writer.add(f"{prefix}.{name}", values.typecode, values)
+
+
+def _pack_inverted_index(writer, prefix, index, records):
+    """Flatten an InvertedIndex: sorted tokens, each with its posting list in rating order and in record order."""
+    tokens = sorted(index.postings)
+    position_of = {id(record): position for position, record in enumerate(records)}
+    offsets, by_rating, by_record = array('q', [0]), array('q'), array('q')
+    for token in tokens:
+        positions = [position_of[id(hospital)] for hospital in index.postings[token].hospitals]
+        by_rating.extend(positions)
+        by_record.extend(sorted(positions))
+        offsets.append(len(by_rating))
+    writer.add_strings(prefix + '.tokens', tokens)
+    writer.add(prefix + '.postings.offsets', 'q', offsets)
+    writer.add(prefix + '.by_rating', 'q', by_rating)
+    writer.add(prefix + '.by_record', 'q', by_record)
+    # The token sequence of every record's indexed text, for phrase checks.
+    writer.add_strings(prefix + '.text', (' '.join(index.tokens_of.get(id(record), ())) for record in records))
+
+
+class Snapshot:
+    """A snapshot file mapped into memory, with every section exposed as a typed memoryview.
+
+    Nothing is copied or decoded up front: the OS pages the file in as queries touch it, and
+    processes that map the same file share those pages.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+        if len(buffer) < _HEADER.size:
+            raise ValueError(f"{path} is not a hospital snapshot")
+        magic, byte_order, version, section_count = _HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a hospital snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+        if byte_order != _BYTE_ORDER:
+            raise ValueError("The snapshot was written on a machine with a different byte order")
+
+        self.sections = {}
+        for number in range(section_count):
+            name, typecode, offset, length = _SECTION.unpack_from(buffer, _HEADER.size + number * _SECTION.size)
+            typecode = typecode.decode('ascii')
+            size = length * array(typecode).itemsize
+            self.sections[name.rstrip(b'\0').decode('ascii')] = buffer[offset:offset + size].cast(typecode)
+
+    def __getitem__(self, name):
+        return self.sections[name]
+
+    def string(self, name, index):
+        """Decode one string of a string section."""
+        offsets = self.sections[name + '.offsets']
+        return bytes(self.sections[name + '.text'][offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def string_count(self, name):
+        return len(self.sections[name + '.offsets']) - 1
+
+
+class MappedHospitalStore:
+    """Read-only HospitalStore over the record columns of a snapshot.
+
+    A record is only built (as a regular Hospital) the first time a lookup or query returns it,
+    and is then reused so every index hands out the same object.
+    """
+
+    add = remove = update = _read_only
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.ids = snapshot['records.id']
+        self.by_id = snapshot['records.by_id']
+        self.by_name = snapshot['records.by_name']
+        self.cache = {}
+
+    def record(self, position):
+        """Return the record stored at a position of the record columns."""
+        record = self.cache.get(position)
+        if record is None:
+            snapshot = self.snapshot
+            record = self.cache[position] = Hospital(
+                self.ids[position], snapshot.string('records.name', position),
+                snapshot['records.latitude'][position], snapshot['records.longitude'][position],
+                snapshot['records.rating'][position], snapshot.string('records.address', position),
+                snapshot.string('records.contact', position))
+        return record
+
+    def get(self, hospital_id):
+        """Return the record with the given id, or None."""
+        index = bisect_left(self.by_id, hospital_id, key=self.ids.__getitem__)
+        if index < len(self.by_id) and self.ids[self.by_id[index]] == hospital_id:
+            return self.record(self.by_id[index])
+        return None
+
+    def find_by_name(self, name):
+        """Return every record with exactly this name (case-insensitive), oldest first."""
+        name = name.lower()
+        def name_at(position):
+            return self.snapshot.string('records.name', position).lower()
+        index = bisect_left(self.by_name, name, key=name_at)
+        matches = []
+        while index < len(self.by_name) and name_at(self.by_name[index]) == name:
+            matches.append(self.record(self.by_name[index]))
+            index += 1
+        return matches
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.record(position) for position in range(len(self.ids)))
+
+    def __contains__(self, hospital_id):
+        return self.get(hospital_id) is not None
+
+
+# R-Tree node read from a snapshot. It offers the attributes the RTree queries use
+# (is_leaf, children, bounding_box, max_rating and the leaf coordinate and rating arrays),
+# reading them from the mapped arrays on access.
+class MappedRTreeNode:
+    __slots__ = ('tree', 'index')
+
+    is_within_bounding_box = RTreeNode.is_within_bounding_box
+    overlaps_bounding_box = RTreeNode.overlaps_bounding_box
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def is_leaf(self):
+        return bool(self.tree.snapshot['rtree.is_leaf'][self.index])
+
+    def _span(self):
+        snapshot = self.tree.snapshot
+        first = snapshot['rtree.first'][self.index]
+        return first, first + snapshot['rtree.count'][self.index]
+
+    @property
+    def children(self):
+        start, end = self._span()
+        if self.is_leaf:
+            record = self.tree.store.record
+            return [record(position) for position in self.tree.snapshot['rtree.entries'][start:end]]
+        return [MappedRTreeNode(self.tree, child) for child in range(start, end)]
+
+    @property
+    def bounding_box(self):
+        if not self.tree.snapshot['rtree.count'][self.index]:
+            return None
+        min_lat, min_lon, max_lat, max_lon = self.tree.snapshot['rtree.box'][4 * self.index:4 * self.index + 4]
+        return ((min_lat, min_lon), (max_lat, max_lon))
+
+    @property
+    def max_rating(self):
+        return self.tree.snapshot['rtree.max_rating'][self.index]
+
+    @property
+    def latitudes(self):
+        start, end = self._span()
+        return self.tree.snapshot['rtree.latitude'][start:end]
+
+    @property
+    def longitudes(self):
+        start, end = self._span()
+        return self.tree.snapshot['rtree.longitude'][start:end]
+
+    @property
+    def ratings(self):
+        start, end = self._span()
+        return self.tree.snapshot['rtree.rating'][start:end]
+
+
+class MappedRTree(RTree):
+    """Read-only RTree answering the usual queries straight from a snapshot's packed nodes."""
+
+    insert_hospital = delete_hospital = refresh_hospital = bulk_load = begin_batch = end_batch = _read_only
+
+    def __init__(self, snapshot, store):
+        # rtree.meta holds (max_entries, min_entries, max_leaf_entries, min_leaf_entries).
+        meta = snapshot['rtree.meta']
+        if len(meta) != 4:
+            raise ValueError(f"Corrupt snapshot: rtree.meta has {len(meta)} fields (expected 4)")
+        super().__init__(*meta)
+        self.snapshot = snapshot
+        self.store = store
+        self.root = MappedRTreeNode(self, 0)
+
+    def __len__(self):
+        return len(self.snapshot['rtree.entries'])
+
+    def __contains__(self, hospital):
+        return self.store.get(hospital['id']) is hospital
+
+    def all_hospitals(self):
+        return [self.store.record(position) for position in self.snapshot['rtree.entries']]
+
+
+# Radix Trie node read from a snapshot, with the attributes the RadixTrie queries use.
+# The label is decoded when the node is created; children, hospitals and the top-k cache on access.
+class MappedRadixTrieNode:
+    __slots__ = ('trie', 'index', 'source', '_children')
+
+    start = 0
+
+    def __init__(self, trie, index):
+        self.trie = trie
+        self.index = index
+        self.source = trie.snapshot.string(trie.prefix + '.label', index)
+        self._children = False  # Not looked up yet
+
+    @property
+    def end(self):
+        return len(self.source)
+
+    def label(self):
+        return self.source
+
+    @property
+    def children(self):
+        if self._children is False:
+            snapshot, prefix = self.trie.snapshot, self.trie.prefix
+            first, count = snapshot[prefix + '.first'][self.index], snapshot[prefix + '.count'][self.index]
+            self._children = None
+            if count:
+                children = (MappedRadixTrieNode(self.trie, child) for child in range(first, first + count))
+                self._children = {child.source[0]: child for child in children}
+        return self._children
+
+    def _records(self, name):
+        snapshot = self.trie.snapshot
+        offsets = snapshot[f"{self.trie.prefix}.{name}.offsets"]
+        positions = snapshot[f"{self.trie.prefix}.{name}"][offsets[self.index]:offsets[self.index + 1]]
+        return [self.trie.store.record(position) for position in positions]
+
+    @property
+    def hospitals(self):
+        return self._records('hospitals') or None
+
+    @property
+    def top(self):
+        return self._records('top')
+
+
+class MappedRadixTrie(RadixTrie):
+    """Read-only RadixTrie answering search, autocomplete and fuzzy search from a snapshot."""
+
+    insert = delete = refresh_rating = begin_batch = end_batch = _read_only
+
+    def __init__(self, snapshot, store, prefix):
+        self.snapshot = snapshot
+        self.store = store
+        self.prefix = prefix
+        self.top_k = snapshot[prefix + '.meta'][0]
+        self._stale_keys = None
+        self.root = MappedRadixTrieNode(self, 0)
+
+
+class MappedInvertedIndex(InvertedIndex):
+    """Read-only InvertedIndex over a snapshot's sorted token table and posting lists."""
+
+    add = remove = update_rating = begin_batch = end_batch = _read_only
+
+    def __init__(self, snapshot, store, prefix):
+        self.snapshot = snapshot
+        self.store = store
+        self.prefix = prefix
+        self.offsets = snapshot[prefix + '.postings.offsets']
+        self.by_rating = snapshot[prefix + '.by_rating']
+        self.by_record = snapshot[prefix + '.by_record']
+
+    def _posting_span(self, token):
+        """Return the (start, end) of a token's posting list, or None if the token occurs nowhere."""
+        name = self.prefix + '.tokens'
+        count = self.snapshot.string_count(name)
+        index = bisect_left(range(count), token, key=lambda position: self.snapshot.string(name, position))
+        if index < count and self.snapshot.string(name, index) == token:
+            return self.offsets[index], self.offsets[index + 1]
+        return None
+
+    def _in_posting(self, span, position):
+        start, end = span
+        index = bisect_left(self.by_record, position, start, end)
+        return index < end and self.by_record[index] == position
+
+    def search(self, query, limit=None):
+        """Return hospitals whose text contains the query's words as a phrase, highest rating first."""
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        spans = []
+        for token in set(query_tokens):
+            span = self._posting_span(token)
+            if span is None:
+                return []  # Some word occurs nowhere
+            spans.append(span)
+
+        # Walk the shortest list (already in rating order) and look the others up by record position.
+        spans.sort(key=lambda span: span[1] - span[0])
+        (start, end), others = spans[0], spans[1:]
+        width = len(query_tokens)
+        query_tokens = tuple(query_tokens)
+        matches = []
+        for position in self.by_rating[start:end]:
+            if not all(self._in_posting(span, position) for span in others):
+                continue
+            if width > 1:
+                tokens = tuple(self.snapshot.string(self.prefix + '.text', position).split())
+                if not any(tokens[i:i + width] == query_tokens for i in range(len(tokens) - width + 1)):
+                    continue
+            matches.append(self.store.record(position))
+            if len(matches) == limit:
+                break
+        return matches
+
+
+def open_snapshot(path):
+    """Map a snapshot file and return its (store, rtree, trie_name, trie_address, address_index)."""
+    snapshot = Snapshot(path)
+    store = MappedHospitalStore(snapshot)
+    return (store, MappedRTree(snapshot, store), MappedRadixTrie(snapshot, store, 'trie_name'),
+            MappedRadixTrie(snapshot, store, 'trie_address'), MappedInvertedIndex(snapshot, store, 'address_index'))
@@ -0,0 +1,151 @@
+import csv
+import gzip
+import json
+import math
+
+# Fields a hospital row must provide; 'contact' and 'id' are optional.
+REQUIRED_FIELDS = ('name', 'latitude', 'longitude', 'rating', 'address')
+# Fields an update may change; a hospital's id never changes.
+UPDATABLE_FIELDS = REQUIRED_FIELDS + ('contact',)
+# Ratings are on a 0 to 5 star scale.
+MIN_RATING, MAX_RATING = 0.0, 5.0
+# Number of hospitals validated and indexed together; this bounds the loader's working memory.
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _file_format(path):
+    """Work out the file format from the extension (a trailing .gz is allowed)."""
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of {path}; pass file_format='csv' or 'jsonl'")
+
+
+def _read_rows(path, file_format=None):
+    """Yield (line_number, row) pairs from a CSV file with a header row or a JSONL file, one row at a time.
+
+    CSV rows come as dicts, JSONL rows as their raw text. Gzip-compressed files (ending in .gz)
+    are decompressed on the fly.
+    """
+    if file_format is None:
+        file_format = _file_format(path)
+    if file_format not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported file format: {file_format!r}")
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, 1):
+                if line.strip():
+                    yield line_number, line
+
+
+def _clean_text(value):
+    """Strip the text and collapse runs of whitespace to single spaces."""
+    return ' '.join(str(value).split())
+
+
+def _parse_number(value, field):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} is not a number: {value!r}") from None
+    if not math.isfinite(number):
+        raise ValueError(f"{field} is not a finite number: {value!r}")
+    return number
+
+
+def _normalise_field(field, value):
+    """Validate one hospital field and return it normalised; raises ValueError for a bad value."""
+    if field == 'contact':
+        return _clean_text(value or '')
+    if field in ('name', 'address'):
+        return _clean_text(value)
+    number = _parse_number(value, field)
+    if field == 'latitude' and not -90.0 <= number <= 90.0:
+        raise ValueError(f"latitude out of range: {number}")
+    if field == 'longitude' and not -180.0 <= number <= 180.0:
+        number = (number + 180.0) % 360.0 - 180.0
+    if field == 'rating' and not MIN_RATING <= number <= MAX_RATING:
+        raise ValueError(f"rating out of range: {number}")
+    return number
+
+
+def _missing(fields):
+    """Names of the required fields that are absent or blank."""
+    return [field for field, value in fields.items()
+            if field in REQUIRED_FIELDS and (value is None or _clean_text(value) == '')]
+
+
+def normalise_hospital(row):
+    """Validate a raw row and return it as a hospital dict ready for HospitalProject.add_hospital().
+
+    Names, addresses and contacts are stripped and their whitespace collapsed, coordinates and ratings
+    become floats, and longitudes outside [-180, 180] are wrapped around. Raises ValueError for a bad row.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("row is not an object")
+    missing = _missing({field: row.get(field) for field in REQUIRED_FIELDS})
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    hospital = {field: _normalise_field(field, row.get(field)) for field in UPDATABLE_FIELDS}
+    if row.get('id') not in (None, ''):
+        try:
+            hospital['id'] = int(row['id'])
+        except (TypeError, ValueError):
+            raise ValueError(f"id is not an integer: {row['id']!r}") from None
+    return hospital
+
+
+def normalise_fields(fields):
+    """Validate the fields of a hospital update and return them normalised, as normalise_hospital does.
+
+    Raises ValueError for an unknown field, a missing value or a bad one.
+    """
+    unknown = set(fields) - set(UPDATABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown hospital fields: {', '.join(sorted(unknown))}")
+    missing = _missing(fields)
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    return {field: _normalise_field(field, value) for field, value in fields.items()}
+
+
+def stream_hospitals(path, file_format=None, skip_invalid=False, rejected=None):
+    """Yield validated, normalised hospital dicts from a CSV or JSONL file, one at a time.
+
+    A bad row raises ValueError naming its line. With `skip_invalid=True` bad rows are skipped instead,
+    and if a `rejected` list is given each skipped row is recorded in it as a (line_number, reason) pair.
+    """
+    for line_number, row in _read_rows(path, file_format):
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)  # A malformed line raises JSONDecodeError, a ValueError
+            hospital = normalise_hospital(row)
+        except ValueError as error:
+            if not skip_invalid:
+                raise ValueError(f"{path}, line {line_number}: {error}") from None
+            if rejected is not None:
+                rejected.append((line_number, str(error)))
+            continue
+        yield hospital
+
+
+def chunked(items, size):
+    """Yield lists of up to `size` consecutive items from any iterable, holding one list at a time."""
+    if size < 1:
+        raise ValueError("Chunk size must be at least 1")
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
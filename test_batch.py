@@ -0,0 +1,69 @@
+import random
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import p10
+from p4 import HospitalProject
+from test_indexes import _random_hospital, _random_location
+
+
+def _project(seed):
+    rng = random.Random(seed)
+    project = HospitalProject()
+    project.add_hospitals([_random_hospital(rng) for _ in range(200)])
+    return project
+
+
+def _expected(project, locations, k):
+    # The answers of search_nearest, laid out like batch_nearest's arrays
+    ids = []
+    for location in locations:
+        found = [hospital.id for _, hospital in project.search_nearest(location, k)]
+        ids.extend(found + [-1] * (k - len(found)))
+    return ids
+
+
+class BatchNearestTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(9)
+        self.locations = [_random_location(rng) for _ in range(300)]
+
+    def test_worker_pool_matches_serial(self):
+        project = _project(1)
+        with mock.patch.object(p10, "MIN_PARALLEL_LOCATIONS", 1), mock.patch.object(p10, "BATCH_TASK_SIZE", 64):
+            ids, distances = project.batch_nearest(self.locations, k=3, workers=2)
+        self.assertEqual(list(ids), _expected(project, self.locations, 3))
+        self.assertEqual(list(distances), list(project.batch_nearest(self.locations, k=3, workers=1)[1]))
+
+    def test_concurrent_calls_on_different_projects(self):
+        projects = [_project(seed) for seed in range(4)]
+        results = {}
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+
+        def run(number):
+            for _ in range(5):
+                ids, _ = projects[number].batch_nearest(self.locations, k=2, workers=1)
+                results.setdefault(number, []).append(list(ids))
+
+        threads = [threading.Thread(target=run, args=(number,)) for number in range(len(projects))]
+        # Small tasks and frequent thread switches, so the calls interleave between tasks
+        with mock.patch.object(p10, "BATCH_TASK_SIZE", 8):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        for number, project in enumerate(projects):
+            expected = _expected(project, self.locations, 2)
+            self.assertEqual(results[number], [expected] * 5)
+
+    def test_k_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            _project(1).batch_nearest(self.locations, k=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from p6 import _percentile, compare_reports, main, run_suite
+
+
+def _report(knn_p99=100.0, bulk_load_s=2.0, peak_memory_mb=50.0, **extra):
+    results = {"count": 1000, "distribution": "uniform", "bulk_load_s": bulk_load_s, "peak_memory_mb": peak_memory_mb,
+               "knn": {"calls": 10, "mean_us": 50.0, "p50_us": 40.0, "p99_us": knn_p99}}
+    results.update(extra)
+    return {"meta": {}, "results": {"uniform-1000": results}}
+
+
+class CompareReportsTest(unittest.TestCase):
+    def test_growth_beyond_threshold_regresses(self):
+        self.assertEqual(compare_reports(_report(), _report(knn_p99=119.0)), [])
+        self.assertEqual(compare_reports(_report(), _report(knn_p99=130.0)),
+                         [("uniform-1000.knn.p99_us", 100.0, 130.0, 0.3)])
+        self.assertEqual(compare_reports(_report(), _report(knn_p99=130.0), threshold=0.5), [])
+        self.assertEqual(compare_reports(_report(), _report(knn_p99=10.0, bulk_load_s=0.1)), [])
+
+    def test_per_metric_thresholds(self):
+        slower = _report(knn_p99=130.0, bulk_load_s=2.5)
+        self.assertEqual([metric for metric, *_ in compare_reports(_report(), slower, thresholds={"*.p99_us": 0.5})],
+                         ["uniform-1000.bulk_load_s"])
+        # The first matching pattern wins, and None stops a metric from being tracked.
+        self.assertEqual(compare_reports(_report(), slower, thresholds={"*.knn.*": None, "*": 1.0}), [])
+
+    def test_missing_metric_regresses(self):
+        current = _report()
+        del current["results"]["uniform-1000"]["knn"]
+        self.assertEqual(sorted(metric for metric, _, new, change in compare_reports(_report(), current)
+                                if new is None and change is None),
+                         ["uniform-1000.knn.mean_us", "uniform-1000.knn.p50_us", "uniform-1000.knn.p99_us"])
+        self.assertEqual(len(compare_reports(_report(), {"meta": {}, "results": {}})), 5)
+
+    def test_unmeasured_baseline_metric_is_skipped(self):
+        self.assertEqual(compare_reports(_report(peak_memory_mb=None), _report(peak_memory_mb=None)), [])
+        self.assertEqual(compare_reports(_report(peak_memory_mb=None), _report(peak_memory_mb=500.0)), [])
+
+    def test_compare_command_exit_status(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {}
+            for name, report in (("baseline", _report()), ("same", _report()), ("slower", _report(knn_p99=200.0))):
+                paths[name] = os.path.join(directory, name + ".json")
+                with open(paths[name], "w") as file:
+                    json.dump(report, file)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(main(["compare", paths["baseline"], paths["same"]]), 0)
+                self.assertEqual(main(["compare", paths["baseline"], paths["slower"]]), 1)
+            self.assertIn("REGRESSION uniform-1000.knn.p99_us: 100.000 -> 200.000 (+100%)", output.getvalue())
+
+
+class SuiteTest(unittest.TestCase):
+    def test_report_covers_every_operation(self):
+        report = run_suite(sizes=(300,), distributions=("clustered",), queries=20, isolate=False)
+        results = report["results"]["clustered-300"]
+        for operation in ("insert", "delete", "knn", "radius", "best_in_range", "autocomplete", "city_search"):
+            self.assertEqual(results[operation]["calls"], 20)
+            self.assertLessEqual(results[operation]["p50_us"], results[operation]["p99_us"])
+        self.assertIsNone(results["peak_memory_mb"])
+        self.assertEqual(compare_reports(report, report), [])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(_percentile(values, 0.5), 50)
+        self.assertEqual(_percentile(values, 0.99), 99)
+        self.assertEqual(_percentile([7], 0.99), 7)
+        self.assertEqual(_percentile([], 0.5), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
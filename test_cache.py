@@ -0,0 +1,113 @@
+import copy
+import math
+import random
+import unittest
+
+from p4 import HospitalProject
+from p11 import QueryCache, geohash_bounds, geohash_encode
+from test_indexes import _apply_one_by_one, _random_hospital, _random_location, _random_mutations
+
+
+def _ids(results):
+    return [hospital.id for hospital in results]
+
+
+def _answer(results):
+    # Comparable form of a query's answer: records, (distance, record) pairs or a "none found" message
+    if isinstance(results, str):
+        return results
+    return [(round(result[0], 6), result[1].id) if isinstance(result, tuple) else result.id for result in results]
+
+
+class CachedProjectTest(unittest.TestCase):
+    """A project with a QueryCache must answer exactly as one without it, however the hospitals change."""
+
+    def setUp(self):
+        self.rng = random.Random(13)
+        hospitals = [_random_hospital(self.rng) for _ in range(300)]
+        self.cache = QueryCache(ttl=math.inf)
+        self.cached = HospitalProject(cache=self.cache)
+        self.plain = HospitalProject()
+        self.cached.add_hospitals(copy.deepcopy(hospitals))
+        self.plain.add_hospitals(copy.deepcopy(hospitals))
+        self.locations = [_random_location(self.rng) for _ in range(40)]
+
+    def assertSameAnswers(self):
+        for location in self.locations:
+            self.assertEqual(_answer(self.cached.find_nearest_hospitals(location, 5)),
+                             _answer(self.plain.find_nearest_hospitals(location, 5)))
+            self.assertEqual(_answer(self.cached.find_nearest_hospitals_within_range(location, 3.0)),
+                             _answer(self.plain.find_nearest_hospitals_within_range(location, 3.0)))
+            self.assertEqual(_answer(self.cached.top_rated_hospitals_within_range(location, 10.0, 3)),
+                             _answer(self.plain.top_rated_hospitals_within_range(location, 10.0, 3)))
+            self.assertEqual(_answer(self.cached.best_hospitals_within_range(location, 2.0)),
+                             _answer(self.plain.best_hospitals_within_range(location, 2.0)))
+
+    def test_matches_uncached_project_across_mutations(self):
+        self.assertSameAnswers()
+        for round_number in range(6):
+            mutations = _random_mutations(self.rng, _ids(self.plain.hospitals), 40)
+            if round_number % 2:
+                _apply_one_by_one(self.cached, copy.deepcopy(mutations))
+                _apply_one_by_one(self.plain, copy.deepcopy(mutations))
+            else:
+                self.cached.apply_batch(copy.deepcopy(mutations))
+                self.plain.apply_batch(copy.deepcopy(mutations))
+            hits = self.cache.hits
+            self.assertSameAnswers()
+            self.assertSameAnswers()  # The second pass is answered from the cache
+            self.assertGreater(self.cache.hits, hits)
+
+    def test_change_far_away_keeps_entries(self):
+        location = (40.73, -73.93)
+        self.cached.find_nearest_hospitals_within_range(location, 1.0)
+        self.cached.add_hospital({"name": "Far Hospital", "latitude": -33.9, "longitude": 151.2, "rating": 5.0,
+                                  "address": "1 Far St, Sydney"})
+        self.assertEqual(len(self.cache), 1)
+        self.cached.add_hospital({"name": "Near Hospital", "latitude": 40.7301, "longitude": -73.9301, "rating": 5.0,
+                                  "address": "1 Near St, New York"})
+        self.assertEqual(len(self.cache), 0)
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = QueryCache(max_entries=3, ttl=10.0, clock=lambda: self.now)
+
+    def test_entries_expire(self):
+        key = self.cache.key("nearest", (40.7, -73.9), 3)
+        self.cache.put(key, ["answer"], 1.0)
+        self.now = 9.0
+        self.assertEqual(self.cache.get(key), ["answer"])
+        self.now = 10.0
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        keys = [self.cache.key("nearest", (40.0 + number, -73.9), 3) for number in range(4)]
+        for key in keys[:3]:
+            self.cache.put(key, [key], 1.0)
+        self.cache.get(keys[0])
+        self.cache.put(keys[3], [keys[3]], 1.0)
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.get(keys[0]), [keys[0]])
+
+    def test_invalidate_only_reachable_entries(self):
+        near = self.cache.key("range", (40.7, -73.9), None, 5.0)
+        everywhere = self.cache.key("nearest", (10.0, 10.0), 3)
+        self.cache.put(near, ["near"], 5.0)
+        self.cache.put(everywhere, ["everywhere"], math.inf)
+        self.assertEqual(self.cache.invalidate([(41.0, -73.9)]), 1)  # About 33 km north: only the unbounded entry
+        self.assertEqual(self.cache.invalidate([(40.72, -73.9)]), 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_geohash_cell_contains_location(self):
+        for lat, lon in ((40.7128, -74.006), (-33.8688, 151.2093), (0.0, 0.0), (89.9, 179.9)):
+            (min_lat, min_lon), (max_lat, max_lon) = geohash_bounds(geohash_encode(lat, lon, 7))
+            self.assertTrue(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon)
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from p4 import HospitalProject
+from p5 import MAX_RECORDED_RESULTS, SearchHistory
+from test_indexes import _random_hospital
+
+
+class SearchHistoryTest(unittest.TestCase):
+    def test_ring_keeps_the_latest_searches(self):
+        history = SearchHistory(capacity=3)
+        for number in range(5):
+            history.push_search(f"search {number}")
+        self.assertEqual(history.view_history(), ["search 4", "search 3", "search 2"])
+        self.assertEqual(history.pop_search(), "search 4")
+        history.push_search("search 5")
+        self.assertEqual(history.view_history(), ["search 5", "search 3", "search 2"])
+        self.assertEqual([history.pop_search() for _ in range(4)], ["search 5", "search 3", "search 2", None])
+        self.assertIsNone(history.get_last_search())
+        with self.assertRaises(ValueError):
+            SearchHistory(capacity=0)
+
+    def test_sessions_are_separate(self):
+        history = SearchHistory(max_sessions=2)
+        history.push_search("anonymous")
+        self.assertIsNone(history.use_session("alice"))
+        history.push_search("alice 1")
+        history.push_search("bob 1", session="bob")
+        self.assertEqual(history.view_history(), ["alice 1"])
+        self.assertEqual(history.get_last_search(session="bob"), "bob 1")
+        self.assertEqual(history.use_session(None), "alice")
+        # Three sessions were used with room for two: the least recently used one (None) was dropped.
+        self.assertEqual(history.view_history(), [])
+        self.assertEqual(history.view_history("alice"), ["alice 1"])
+
+    def test_results_are_rendered_when_viewed(self):
+        hospitals = {number: {"id": number, "name": f"Hospital {number}"} for number in range(1, MAX_RECORDED_RESULTS + 6)}
+        history = SearchHistory(lookup=hospitals.get)
+        history.record("city", ("Boston",), list(hospitals.values()))
+        hospitals[1]["name"] = "Renamed Hospital"
+        del hospitals[2]
+        text = history.get_last_search()
+        self.assertTrue(text.startswith("Searched hospitals in Boston:\n Renamed Hospital \n #2 \n Hospital 3"))
+        self.assertTrue(text.endswith("... and 5 more"))
+        self.assertEqual(len(history.records()[0].result_ids), MAX_RECORDED_RESULTS)
+        history.record("city", ("Nowhere",), [])
+        self.assertEqual(history.get_last_search(), "Searched hospitals in Nowhere: No hospitals found")
+
+    def test_log_gets_a_line_per_record(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history.jsonl")
+            history = SearchHistory(log_path=path)
+            history.push_search("first")
+            history.record("nearest", ((40.7, -73.9), 3), [{"id": 7}], session="alice")
+            with open(path, encoding="utf-8") as file:  # Readable before close(): each line is flushed
+                entries = [json.loads(line) for line in file]
+            history.close()
+        self.assertEqual([(entry["kind"], entry["session"]) for entry in entries], [("text", None), ("nearest", "alice")])
+        self.assertEqual(entries[1]["params"], [[40.7, -73.9], 3])
+        self.assertEqual(entries[1]["result_ids"], [7])
+
+
+class ProjectSessionTest(unittest.TestCase):
+    def test_queries_record_in_the_given_session(self):
+        project = HospitalProject()
+        project.add_hospitals([_random_hospital(random.Random(41)) for _ in range(20)])
+        project.find_nearest_hospitals((40.73, -73.93), 2, session="alice")
+        project.find_hospitals_in_window(40.0, -74.5, 41.5, -73.0)
+        self.assertEqual(project.search_history.view_history("alice"),
+                         ["Nearest hospitals search at location: (40.73, -73.93), Results: 2"])
+        self.assertEqual(project.search_history.view_history(),
+                         ["Hospitals in area: (40.0, -74.5) - (41.5, -73.0)"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+import math
+import random
+import unittest
+
+from p1 import RTree, SpatialIndex, calculate_distance
+from p4 import HospitalProject
+from p12 import GridIndex
+
+NAMES = ["City Hospital", "City Medical Center", "St. Peter's Hospital", "St. Mary's Clinic", "Green Valley Hospital",
+         "Harbor Medical Center", "Community Health Center", "Metro Clinic"]
+CITIES = ["New York", "Boston", "Newark"]
+PREFIXES = ["c", "city", "city h", "st", "st. p", "green valley hospital", "harbor", "m", "zzz"]
+
+
+def _random_location(rng):
+    # Mostly bunched around one city centre, with a few far away, so both dense and empty regions are searched
+    if rng.random() < 0.9:
+        return rng.gauss(40.73, 0.08), rng.gauss(-73.93, 0.08)
+    return rng.uniform(-60.0, 60.0), rng.uniform(-180.0, 180.0)
+
+
+def _random_hospital(rng):
+    latitude, longitude = _random_location(rng)
+    return {"name": f"{rng.choice(NAMES)} {rng.randrange(30)}", "latitude": latitude, "longitude": longitude,
+            "rating": round(rng.uniform(1.0, 5.0), 1), "address": f"{rng.randrange(1, 999)} Main St, {rng.choice(CITIES)}"}
+
+
+def _random_mutations(rng, live_ids, count):
+    # Adds, deletes (some of missing ids) and updates of ratings, names and locations, near and far
+    mutations = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.3 or not live_ids:
+            mutations.append(("add", _random_hospital(rng)))
+        elif roll < 0.5:
+            mutations.append(("delete", rng.choice(live_ids) if rng.random() < 0.9 else 10**6))
+        else:
+            fields = {}
+            if rng.random() < 0.5:
+                fields["rating"] = round(rng.uniform(1.0, 5.0), 1)
+            if rng.random() < 0.3:
+                fields["name"] = f"{rng.choice(NAMES)} {rng.randrange(30)}"
+            if rng.random() < 0.5 or not fields:
+                fields["latitude"], fields["longitude"] = _random_location(rng)
+            mutations.append(("update", rng.choice(live_ids), fields))
+    return mutations
+
+
+def _apply_one_by_one(project, mutations):
+    # The same mutations outside a batch, so every index repair happens as each one is made
+    for mutation in mutations:
+        if mutation[0] == "add":
+            project.add_hospital(mutation[1])
+        elif mutation[0] == "update":
+            project.update_hospital(mutation[1], **mutation[2])
+        else:
+            project.delete_hospital_by_id(mutation[1])
+
+
+class _IndexesMatchBruteForce:
+    """Checks every query of a project against a linear scan after several rounds of mixed apply_batch()
+    mutations and one round of unbatched ones. Subclasses set make_project() to pick the spatial engine."""
+
+    SEED = 7
+
+    def setUp(self):
+        self.rng = random.Random(self.SEED)
+        self.project = self.make_project()
+        self.project.add_hospitals([_random_hospital(self.rng) for _ in range(200)])
+        for _ in range(100):
+            self.project.add_hospital(_random_hospital(self.rng))  # Grown past the bulk load one insert at a time
+        for _ in range(4):
+            live_ids = [hospital.id for hospital in self.project.hospitals]
+            self.project.apply_batch(_random_mutations(self.rng, live_ids, 80))
+        live_ids = [hospital.id for hospital in self.project.hospitals]
+        _apply_one_by_one(self.project, _random_mutations(self.rng, live_ids, 80))
+        self.hospitals = self.project.hospitals
+        self.locations = [_random_location(self.rng) for _ in range(40)]
+
+    def _distances(self, location):
+        return sorted(((calculate_distance(location, (hospital.latitude, hospital.longitude)), hospital)
+                       for hospital in self.hospitals), key=lambda result: result[0])
+
+    def _within(self, location, radius):
+        return [(distance, hospital) for distance, hospital in self._distances(location) if distance <= radius]
+
+    def assertDistancesEqual(self, found, expected):
+        self.assertEqual([round(distance, 6) for distance in found], [round(distance, 6) for distance in expected])
+
+    def test_store_and_index_agree(self):
+        self.assertEqual(len(self.project.spatial_index), len(self.hospitals))
+        self.assertEqual({id(hospital) for hospital in self.project.spatial_index.all_hospitals()},
+                         {id(hospital) for hospital in self.hospitals})
+
+    def test_nearest(self):
+        for location in self.locations:
+            expected = self._distances(location)
+            for k in (1, 5, 40):
+                found = self.project.search_nearest(location, k)
+                self.assertDistancesEqual([distance for distance, _ in found], [distance for distance, _ in expected[:k]])
+
+    def test_range(self):
+        for location in self.locations:
+            for radius in (0.5, 5.0, 50.0):
+                found = self.project.search_nearest(location, None, radius)
+                self.assertEqual(sorted(hospital.id for _, hospital in found),
+                                 sorted(hospital.id for _, hospital in self._within(location, radius)))
+                self.assertEqual([distance for distance, _ in found], sorted(distance for distance, _ in found))
+
+    def test_top_rated(self):
+        for location in self.locations:
+            for radius, k in ((2.0, 1), (10.0, 3), (50.0, 10)):
+                expected = sorted(self._within(location, radius), key=lambda result: (-result[1].rating, result[0]))
+                found = self.project.search_top_rated(location, radius, k)
+                self.assertEqual([(hospital.rating, round(distance, 6)) for distance, hospital in found],
+                                 [(hospital.rating, round(distance, 6)) for distance, hospital in expected[:k]])
+
+    def test_window(self):
+        for location in self.locations:
+            min_lat, min_lon = location[0] - 0.05, location[1] - 0.07
+            max_lat, max_lon = location[0] + 0.05, location[1] + 0.07
+            found = self.project.search_window(min_lat, min_lon, max_lat, max_lon)
+            expected = [hospital for hospital in self.hospitals
+                        if min_lat <= hospital.latitude <= max_lat and min_lon <= hospital.longitude <= max_lon]
+            self.assertEqual(sorted(hospital.id for hospital in found), sorted(hospital.id for hospital in expected))
+
+    def test_batch_nearest(self):
+        k = 4
+        ids, distances = self.project.batch_nearest(self.locations, k=k, radius=20.0, workers=1)
+        for row, location in enumerate(self.locations):
+            expected = self._within(location, 20.0)[:k]
+            slots = range(row * k, (row + 1) * k)
+            self.assertDistancesEqual([distances[slot] for slot in slots if ids[slot] != -1],
+                                      [distance for distance, _ in expected])
+            self.assertTrue(all(distances[slot] == math.inf for slot in slots if ids[slot] == -1))
+
+    def test_coverage_join(self):
+        demand = [_random_location(self.rng) for _ in range(200)]
+        counts, uncovered = self.project.coverage_analysis(demand, 3.0)
+        expected_counts = {hospital.id: 0 for hospital in self.hospitals}
+        expected_uncovered = []
+        for point in demand:
+            near = [hospital for distance, hospital in self._within(point, 3.0)]
+            for hospital in near:
+                expected_counts[hospital.id] += 1
+            if not near:
+                expected_uncovered.append(point)
+        self.assertEqual(counts, expected_counts)
+        self.assertEqual(uncovered, expected_uncovered)
+
+    def test_name_top_k_caches(self):
+        for prefix in PREFIXES:
+            matches = [hospital for hospital in self.hospitals if hospital.name.lower().startswith(prefix)]
+            self.assertEqual(sorted(hospital.id for hospital in self.project.search_name(prefix)),
+                             sorted(hospital.id for hospital in matches))
+            best_ratings = sorted((hospital.rating for hospital in matches), reverse=True)
+            for limit in (1, 3, 10, 25):
+                self.assertEqual([hospital.rating for hospital in self.project.autocomplete_name(prefix, limit)],
+                                 best_ratings[:limit])
+
+    def test_city_search(self):
+        for city in CITIES:
+            expected = [hospital for hospital in self.hospitals if hospital.address.endswith(", " + city)]
+            found = self.project.search_city(city)
+            self.assertEqual(sorted(hospital.id for hospital in found), sorted(hospital.id for hospital in expected))
+            self.assertEqual([hospital.rating for hospital in found], sorted((hospital.rating for hospital in found), reverse=True))
+
+    def test_bad_update_leaves_record_unchanged(self):
+        record = self.hospitals[0]
+        before = dict(record)
+        for fields in ({"rating": "great"}, {"latitude": 91.0}, {"name": ""}, {"rating": 4.5, "longitude": "west"}):
+            with self.assertRaises(ValueError):
+                self.project.update_hospital(record.id, **fields)
+            self.assertEqual(dict(record), before)
+        self.assertIn(record.id, [hospital.id for hospital in self.project.search_name(record.name)])
+
+
+class RTreeSmallNodesTest(_IndexesMatchBruteForce, unittest.TestCase):
+    # Four entries per node and leaf, so the inserts and mutations split and condense nodes at every level
+    def make_project(self):
+        return HospitalProject(spatial_index=RTree(max_entries=4, max_leaf_entries=4))
+
+
+class RTreeDefaultTest(_IndexesMatchBruteForce, unittest.TestCase):
+    def make_project(self):
+        return HospitalProject()
+
+
+class GridIndexTest(_IndexesMatchBruteForce, unittest.TestCase):
+    def make_project(self):
+        return HospitalProject(spatial_index=GridIndex(cell_degrees=0.05))
+
+
+class SpatialEngineTest(unittest.TestCase):
+    def test_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            SpatialIndex()
+        with self.assertRaises(ValueError):
+            GridIndex(cell_degrees=0)
+
+    def test_grid_wraps_at_antimeridian_and_poles(self):
+        for engine in (GridIndex(cell_degrees=1.0), RTree()):
+            project = HospitalProject(spatial_index=engine)
+            east, west, pole = project.add_hospitals([
+                {"name": "East", "latitude": 0.0, "longitude": 179.99, "rating": 3.0, "address": "1 East St"},
+                {"name": "West", "latitude": 0.0, "longitude": -179.98, "rating": 4.0, "address": "1 West St"},
+                {"name": "Pole", "latitude": 89.99, "longitude": 10.0, "rating": 5.0, "address": "1 Pole St"}])
+            self.assertEqual([hospital.id for _, hospital in project.search_nearest((0.0, -179.99), 2)], [west.id, east.id])
+            self.assertEqual([hospital.id for _, hospital in project.search_nearest((89.99, -170.0), None, 10.0)], [pole.id])
+
+
+class BulkAddTest(unittest.TestCase):
+    """add_hospitals() builds the text indexes in bulk; they must come out as one-at-a-time inserts leave them."""
+
+    def setUp(self):
+        rng = random.Random(11)
+        hospitals = [_random_hospital(rng) for _ in range(400)]
+        self.bulk = HospitalProject()
+        self.bulk.add_hospitals(hospitals[:300])
+        self.bulk.add_hospitals(hospitals[300:])  # Into tries that are no longer empty
+        self.incremental = HospitalProject()
+        for hospital in hospitals:
+            self.incremental.add_hospital(hospital)
+
+    def assertSameNodes(self, bulk_node, incremental_node):
+        self.assertEqual(bulk_node.label(), incremental_node.label())
+        self.assertEqual([h.id for h in bulk_node.hospitals or ()], [h.id for h in incremental_node.hospitals or ()])
+        self.assertEqual([h.rating for h in bulk_node.top], [h.rating for h in incremental_node.top])
+        bulk_children, incremental_children = bulk_node.children or {}, incremental_node.children or {}
+        self.assertEqual(sorted(bulk_children), sorted(incremental_children))
+        for char, child in bulk_children.items():
+            self.assertSameNodes(child, incremental_children[char])
+
+    def test_tries_match(self):
+        self.assertSameNodes(self.bulk.trie_name.root, self.incremental.trie_name.root)
+        self.assertSameNodes(self.bulk.trie_address.root, self.incremental.trie_address.root)
+
+    def test_address_index_matches(self):
+        bulk_postings, incremental_postings = self.bulk.address_index.postings, self.incremental.address_index.postings
+        self.assertEqual(sorted(bulk_postings), sorted(incremental_postings))
+        for token, posting in bulk_postings.items():
+            self.assertEqual([h.id for h in posting.hospitals], [h.id for h in incremental_postings[token].hospitals])
+
+
+if __name__ == "__main__":
+    unittest.main()
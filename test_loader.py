@@ -0,0 +1,114 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from p4 import HospitalProject
+from p9 import chunked, normalise_fields, normalise_hospital
+
+HEADER = ["id", "name", "latitude", "longitude", "rating", "address", "contact"]
+GOOD_ROW = ["", "City  Hospital ", "40.7", "-73.9", "4.5", "1 Main St,  New York", ""]
+
+
+def _row(**changes):
+    row = dict(zip(HEADER, GOOD_ROW))
+    row.update(changes)
+    return row
+
+
+# Rows of the test files: (row, reason it is rejected or None). CSV lines are numbered from 2, after the header.
+ROWS = [
+    (_row(), None),
+    (_row(name="  "), "missing name"),
+    (_row(latitude="north"), "latitude is not a number"),
+    (_row(latitude="nan"), "latitude is not a finite number"),
+    (_row(latitude="91"), "latitude out of range"),
+    (_row(rating="5.5"), "rating out of range"),
+    (_row(id="seven"), "id is not an integer"),
+    (_row(id="42", longitude="190", name="Wrapped"), None),
+]
+
+
+class LoaderTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _write_csv(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, HEADER)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def test_strict_load_names_the_bad_line(self):
+        path = self._write_csv("hospitals.csv", [row for row, _ in ROWS])
+        with self.assertRaisesRegex(ValueError, r"hospitals\.csv, line 3: missing name"):
+            HospitalProject().load_hospitals(path)
+
+    def test_skip_invalid_reports_each_rejected_row(self):
+        path = self._write_csv("hospitals.csv", [row for row, _ in ROWS])
+        project = HospitalProject()
+        rejected = []
+        self.assertEqual(project.load_hospitals(path, skip_invalid=True, rejected=rejected, chunk_size=1), 2)
+        expected = [(line_number, reason) for line_number, (_, reason) in enumerate(ROWS, 2) if reason is not None]
+        self.assertEqual([line_number for line_number, _ in rejected], [line_number for line_number, _ in expected])
+        for (_, message), (_, reason) in zip(rejected, expected):
+            self.assertTrue(message.startswith(reason), message)
+        self.assertEqual(len(project), 2)
+
+    def test_rows_are_normalised(self):
+        path = self._write_csv("hospitals.csv", [row for row, reason in ROWS if reason is None])
+        project = HospitalProject()
+        project.load_hospitals(path)
+        first, wrapped = project.hospitals
+        self.assertEqual((first.name, first.address, first.rating), ("City Hospital", "1 Main St, New York", 4.5))
+        self.assertEqual(wrapped.id, 42)
+        self.assertAlmostEqual(wrapped.longitude, -170.0)
+
+    def test_chunks_load_everything(self):
+        rows = [_row(name=f"Hospital {number}", latitude=str(40 + number / 100)) for number in range(25)]
+        path = self._write_csv("hospitals.csv", rows)
+        for chunk_size in (1, 7, 25, 100):
+            project = HospitalProject()
+            self.assertEqual(project.load_hospitals(path, chunk_size=chunk_size), 25)
+            self.assertEqual([hospital.name for hospital in project.hospitals], [row["name"] for row in rows])
+            self.assertEqual(len(project.search_nearest((40.0, -73.9), None, 1000.0)), 25)
+        self.assertEqual([len(chunk) for chunk in chunked(range(25), 7)], [7, 7, 7, 4])
+        with self.assertRaises(ValueError):
+            list(chunked(range(3), 0))
+
+    def test_gzipped_jsonl(self):
+        path = os.path.join(self.directory, "hospitals.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write(json.dumps(_row()) + "\n\n")
+            file.write("{not json\n")
+            file.write("[1, 2]\n")
+            file.write(json.dumps(_row(name="Second")) + "\n")
+        project = HospitalProject()
+        rejected = []
+        self.assertEqual(project.load_hospitals(path, skip_invalid=True, rejected=rejected), 2)
+        self.assertEqual([line_number for line_number, _ in rejected], [3, 4])
+        self.assertEqual(rejected[1][1], "row is not an object")
+
+    def test_unknown_format(self):
+        path = os.path.join(self.directory, "hospitals.txt")
+        open(path, "w").close()
+        with self.assertRaisesRegex(ValueError, "Cannot tell the format"):
+            HospitalProject().load_hospitals(path)
+
+    def test_normalise_fields(self):
+        self.assertEqual(normalise_fields({"rating": "4", "name": " A  B "}), {"rating": 4.0, "name": "A B"})
+        for fields in ({"id": 3}, {"rating": "inf"}, {"name": ""}, {"latitude": -90.5}):
+            with self.assertRaises(ValueError):
+                normalise_fields(fields)
+        with self.assertRaisesRegex(ValueError, "missing latitude, longitude, rating, address"):
+            normalise_hospital({"name": "Only a name"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from p4 import HospitalProject
+from p13 import ShardedHospitalProject
+from p14 import HTTPError, QueryService, validate_mutation
+from test_indexes import _random_hospital
+
+
+def _hospitals():
+    rng = random.Random(21)
+    return [_random_hospital(rng) for _ in range(100)]
+
+
+class _ServiceTest:
+    """Checks of a QueryService; subclasses set make_project() to serve a flat or a sharded project."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        project = self.make_project()
+        project.add_hospitals(_hospitals())
+        self.service = QueryService(project, snapshot_dir=directory.name)
+
+    def query(self, path, **params):
+        return self.service.query(path, {name: [str(value)] for name, value in params.items()})
+
+    def post(self, mutations):
+        return asyncio.run(self.service._respond('POST', '/mutations', json.dumps(mutations).encode()))
+
+    def state(self):
+        return sorted((record.to_dict() for record in self.service.project.hospitals), key=lambda record: record['id'])
+
+    def assertBadRequest(self, message, path, **params):
+        with self.assertRaises(HTTPError) as raised:
+            self.query(path, **params)
+        self.assertEqual(raised.exception.status, 400)
+        self.assertIn(message, str(raised.exception))
+
+    def test_bad_numbers_get_their_own_message(self):
+        for value in ("nan", "inf", "-inf"):
+            self.assertBadRequest("lat is not a finite number", "/nearest", lat=value, lon=0)
+            self.assertBadRequest("lon is not a finite number", "/nearest", lat=0, lon=value)
+            self.assertBadRequest("radius is not a finite number", "/range", lat=0, lon=0, radius=value)
+            self.assertBadRequest("radius is not a finite number", "/best", lat=0, lon=0, radius=value)
+        self.assertBadRequest("lat is not a valid number", "/nearest", lat="north", lon=0)
+        self.assertBadRequest("missing parameter: lon", "/nearest", lat=0)
+        self.assertBadRequest("missing parameter: radius", "/range", lat=0, lon=0)
+
+    def test_out_of_range_values(self):
+        self.assertBadRequest("lat must be between -90 and 90", "/nearest", lat=90.5, lon=0)
+        self.assertBadRequest("lat must be between -90 and 90", "/nearest", lat=-91, lon=0)
+        self.assertBadRequest("lon must be between -180 and 180", "/nearest", lat=0, lon=180.5)
+        self.assertBadRequest("lon must be between -180 and 180", "/nearest", lat=0, lon=-181)
+        self.assertBadRequest("radius must not be negative", "/range", lat=0, lon=0, radius=-1)
+        self.assertBadRequest("radius must not be negative", "/best", lat=0, lon=0, radius=-0.5)
+        self.assertBadRequest("k must be between 0 and 1000", "/nearest", lat=0, lon=0, k=1001)
+        self.assertBadRequest("max_edits must be between 0 and 3", "/name", q="city", max_edits=4)
+        self.assertEqual(len(self.query("/nearest", lat=90, lon=-180, k=2)["results"]), 2)
+        self.assertEqual(self.query("/range", lat=40.73, lon=-73.93, radius=0)["results"], [])
+
+    def test_queries_answer_from_published_version(self):
+        answer = self.query("/nearest", lat=40.73, lon=-73.93, k=3)
+        expected = self.service.project.search_nearest((40.73, -73.93), 3)
+        self.assertEqual(answer["version"], 1)
+        self.assertEqual([result["id"] for result in answer["results"]], [hospital.id for _, hospital in expected])
+        self.assertEqual(self.query("/health"), {"version": 1, "hospitals": 100})
+
+    def test_mutations_are_published(self):
+        answer = self.post([["add", dict(_random_hospital(random.Random(1)), name="Brand New Hospital")],
+                            ["update", 1, {"rating": 0.5}], ["delete", 2]])
+        self.assertEqual(answer["version"], 2)
+        self.assertEqual(answer["results"][2]["id"], 2)
+        self.assertEqual(self.query("/health"), {"version": 2, "hospitals": 100})
+        self.assertEqual([result["name"] for result in self.query("/name", q="brand new")["results"]], ["Brand New Hospital"])
+
+    def test_malformed_mutation_applies_nothing(self):
+        before = self.state()
+        for mutations in ([["update", 1, {"rating": 1.0}], ["update", 3, {"rating": 9.0}]],
+                          [["delete", 4], ["delete", 1.5]],
+                          [["delete", 4], ["add", {"name": "No location"}]],
+                          [["delete", 4], ["rename", 4]]):
+            with self.assertRaises(HTTPError) as raised:
+                self.post(mutations)
+            self.assertEqual(raised.exception.status, 400)
+            self.assertIn("mutation 1:", str(raised.exception))
+        self.assertEqual(self.state(), before)
+        self.assertEqual(self.service.version, 1)
+
+    def test_failed_build_rolls_back_the_round(self):
+        before, next_id = self.state(), self.service.project.next_id
+        mutations = [["add", _random_hospital(random.Random(2))], ["update", 1, {"latitude": -33.87, "longitude": 151.21}],
+                     ["delete", 5], ["add", dict(_random_hospital(random.Random(3)), id=500)]]
+        with mock.patch.object(self.service.project, "save_snapshot", side_effect=OSError("disk full")):
+            with self.assertRaisesRegex(OSError, "disk full"):
+                asyncio.run(self.service.apply(mutations))
+        self.assertEqual(self.state(), before)
+        self.assertEqual(self.service.project.next_id, next_id)
+        self.assertEqual(self.query("/health"), {"version": 1, "hospitals": 100})
+        self.post(mutations)  # The same round succeeds once versions can be built again
+        self.assertEqual(self.query("/health"), {"version": 2, "hospitals": 101})
+
+
+class FlatServiceTest(_ServiceTest, unittest.TestCase):
+    def make_project(self):
+        return HospitalProject()
+
+    def test_http_round_trip(self):
+        async def request(port, line):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"{line}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+            response = await reader.read()
+            writer.close()
+            return response.decode('utf-8')
+
+        async def main():
+            server = await self.service.start(port=0)
+            async with server:
+                port = server.sockets[0].getsockname()[1]
+                return (await request(port, "GET /nearest?lat=nan&lon=0 HTTP/1.1"),
+                        await request(port, "GET /nearest?lat=40.7&lon=-73.9&k=1 HTTP/1.1"))
+
+        bad, good = asyncio.run(main())
+        self.assertTrue(bad.startswith("HTTP/1.1 400 Bad Request"))
+        self.assertIn('"error": "lat is not a finite number', bad)
+        self.assertTrue(good.startswith("HTTP/1.1 200 OK"))
+        self.assertEqual(len(json.loads(good.split("\r\n\r\n", 1)[1])["results"]), 1)
+
+
+class ShardedServiceTest(_ServiceTest, unittest.TestCase):
+    def make_project(self):
+        return ShardedHospitalProject(tile_degrees=0.1)
+
+
+class ValidateMutationTest(unittest.TestCase):
+    def test_normalises_or_rejects(self):
+        self.assertEqual(validate_mutation(["update", 3, {"rating": "4"}]), ("update", 3, {"rating": 4.0}))
+        self.assertEqual(validate_mutation(["delete", 3]), ("delete", 3))
+        for mutation in ([], "delete", ["delete"], ["delete", True], ["update", 3, [1]], ["add", {"name": "x"}, 1]):
+            with self.assertRaises(ValueError):
+                validate_mutation(mutation)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import copy
+import os
+import random
+import tempfile
+import unittest
+
+from p4 import HospitalProject
+from p13 import ShardedHospitalProject
+from test_indexes import CITIES, PREFIXES, _apply_one_by_one, _random_hospital, _random_location, _random_mutations
+
+
+def _pairs(results):
+    return [(round(distance, 6), hospital.id) for distance, hospital in results]
+
+
+def _ids(hospitals):
+    return sorted(hospital.id for hospital in hospitals)
+
+
+class ShardedMatchesFlatTest(unittest.TestCase):
+    """A sharded project must answer like one flat project holding the same hospitals, after the same
+    mutations, including updates that move hospitals into another shard's tile."""
+
+    def setUp(self):
+        self.rng = random.Random(17)
+        hospitals = [_random_hospital(self.rng) for _ in range(300)]
+        self.sharded = ShardedHospitalProject(tile_degrees=0.1)  # The city cluster spans several tiles
+        self.flat = HospitalProject()
+        self.sharded.add_hospitals(copy.deepcopy(hospitals))
+        self.flat.add_hospitals(copy.deepcopy(hospitals))
+        for round_number in range(4):
+            mutations = _random_mutations(self.rng, [hospital.id for hospital in self.flat.hospitals], 80)
+            if round_number == 3:
+                _apply_one_by_one(self.sharded, copy.deepcopy(mutations))
+                _apply_one_by_one(self.flat, copy.deepcopy(mutations))
+            else:
+                self.sharded.apply_batch(copy.deepcopy(mutations))
+                self.flat.apply_batch(copy.deepcopy(mutations))
+        self.locations = [_random_location(self.rng) for _ in range(30)]
+
+    def assertSameAnswers(self, sharded):
+        flat = self.flat
+        self.assertEqual(len(sharded), len(flat))
+        self.assertEqual(_ids(sharded.hospitals), _ids(flat.hospitals))
+        for location in self.locations:
+            self.assertEqual(_pairs(sharded.search_nearest(location, 5)), _pairs(flat.search_nearest(location, 5)))
+            self.assertEqual(_pairs(sharded.search_nearest(location, None, 8.0)), _pairs(flat.search_nearest(location, None, 8.0)))
+            self.assertEqual([(hospital.rating, round(distance, 6)) for distance, hospital in sharded.search_top_rated(location, 10.0, 3)],
+                             [(hospital.rating, round(distance, 6)) for distance, hospital in flat.search_top_rated(location, 10.0, 3)])
+            window = (location[0] - 0.1, location[1] - 0.15, location[0] + 0.1, location[1] + 0.15)
+            self.assertEqual(_ids(sharded.search_window(*window)), _ids(flat.search_window(*window)))
+        for prefix in PREFIXES:
+            self.assertEqual(_ids(sharded.search_name(prefix)), _ids(flat.search_name(prefix)))
+            self.assertEqual([hospital.rating for hospital in sharded.autocomplete_name(prefix, 5)],
+                             [hospital.rating for hospital in flat.autocomplete_name(prefix, 5)])
+        for city in CITIES:
+            self.assertEqual(_ids(sharded.search_city(city)), _ids(flat.search_city(city)))
+
+    def test_matches_flat_project(self):
+        self.assertSameAnswers(self.sharded)
+
+    def test_records_live_in_the_shard_of_their_tile(self):
+        self.assertTrue(all(len(shard) for shard in self.sharded.shards.values()))
+        for hospital in self.sharded.hospitals:
+            key = self.sharded.tile_of[hospital.id]
+            self.assertEqual(key, self.sharded._tile_key(hospital.latitude, hospital.longitude))
+            self.assertIs(self.sharded.shards[key].get_hospital(hospital.id), hospital)
+
+    def test_move_to_another_tile_keeps_id(self):
+        hospital = self.sharded.hospitals[0]
+        old_key = self.sharded.tile_of[hospital.id]
+        moved = self.sharded.update_hospital(hospital.id, latitude=-33.87, longitude=151.21, rating=4.9)
+        self.flat.update_hospital(hospital.id, latitude=-33.87, longitude=151.21, rating=4.9)
+        self.assertEqual(moved.id, hospital.id)
+        self.assertNotEqual(self.sharded.tile_of[hospital.id], old_key)
+        self.assertIs(self.sharded.get_hospital(hospital.id), moved)
+        self.assertSameAnswers(self.sharded)
+
+    def test_bad_move_leaves_hospital_in_place(self):
+        hospital = self.sharded.hospitals[0]
+        shard_count = len(self.sharded.shards)
+        with self.assertRaises(ValueError):
+            self.sharded.update_hospital(hospital.id, latitude=-33.87, longitude=151.21, rating=9.0)
+        self.assertIs(self.sharded.get_hospital(hospital.id), hospital)
+        self.assertEqual(len(self.sharded.shards), shard_count)
+        self.assertSameAnswers(self.sharded)
+
+    def test_coverage_and_batch_queries(self):
+        demand = [_random_location(self.rng) for _ in range(100)]
+        self.assertEqual(self.sharded.coverage_analysis(demand, 3.0), self.flat.coverage_analysis(demand, 3.0))
+        _, sharded_distances = self.sharded.batch_nearest(self.locations, k=3, workers=1)
+        _, flat_distances = self.flat.batch_nearest(self.locations, k=3, workers=1)
+        self.assertEqual([round(distance, 6) for distance in sharded_distances], [round(distance, 6) for distance in flat_distances])
+
+    def test_snapshot_matches_flat_project(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shards")
+            self.sharded.save_snapshot(path)
+            loaded = ShardedHospitalProject.load_snapshot(path)
+            self.assertEqual(loaded.next_id, self.sharded.next_id)
+            self.assertEqual(loaded.tile_of, self.sharded.tile_of)
+            self.assertSameAnswers(loaded)
+
+    def test_duplicate_id_is_refused(self):
+        hospital = self.sharded.hospitals[0]
+        with self.assertRaisesRegex(ValueError, "already in use"):
+            self.sharded.add_hospital(dict(_random_hospital(self.rng), id=hospital.id))
+        with self.assertRaisesRegex(ValueError, "already in use"):
+            self.sharded.add_hospitals([dict(_random_hospital(self.rng), id=10**7), dict(_random_hospital(self.rng), id=10**7)])
+
+
+if __name__ == "__main__":
+    unittest.main()
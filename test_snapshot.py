@@ -0,0 +1,96 @@
+import os
+import random
+import tempfile
+import unittest
+
+from p4 import HospitalProject
+from p8 import SNAPSHOT_VERSION, _HEADER, _SECTION
+from test_indexes import CITIES, PREFIXES, _random_hospital, _random_location, _random_mutations
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.live = HospitalProject()
+        self.live.add_hospitals([_random_hospital(rng) for _ in range(300)])
+        self.live.apply_batch(_random_mutations(rng, [hospital.id for hospital in self.live.hospitals], 100))
+        self.locations = [_random_location(rng) for _ in range(30)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "hospitals.snap")
+        self.live.save_snapshot(self.path)
+
+    def _load(self):
+        return HospitalProject.load_snapshot(self.path)
+
+    def _rewrite(self, change):
+        # Apply change(bytearray) to the snapshot file
+        with open(self.path, "rb") as file:
+            data = bytearray(file.read())
+        change(data)
+        with open(self.path, "wb") as file:
+            file.write(data)
+
+    def assertSameHospitals(self, found, expected):
+        self.assertEqual([hospital.id for hospital in found], [hospital.id for hospital in expected])
+
+    def assertSameResults(self, found, expected):
+        self.assertEqual([(round(distance, 6), hospital.id) for distance, hospital in found],
+                         [(round(distance, 6), hospital.id) for distance, hospital in expected])
+
+    def test_queries_match_live_project(self):
+        mapped = self._load()
+        self.assertEqual(len(mapped), len(self.live))
+        for location in self.locations:
+            self.assertSameResults(mapped.search_nearest(location, 5), self.live.search_nearest(location, 5))
+            self.assertSameResults(mapped.search_nearest(location, None, 5.0), self.live.search_nearest(location, None, 5.0))
+            self.assertSameResults(mapped.search_top_rated(location, 10.0, 3), self.live.search_top_rated(location, 10.0, 3))
+            window = (location[0] - 0.05, location[1] - 0.07, location[0] + 0.05, location[1] + 0.07)
+            self.assertEqual(sorted(hospital.id for hospital in mapped.search_window(*window)),
+                             sorted(hospital.id for hospital in self.live.search_window(*window)))
+        for prefix in PREFIXES:
+            self.assertEqual(sorted(hospital.id for hospital in mapped.search_name(prefix)),
+                             sorted(hospital.id for hospital in self.live.search_name(prefix)))
+            self.assertEqual([hospital.rating for hospital in mapped.autocomplete_name(prefix, 5)],
+                             [hospital.rating for hospital in self.live.autocomplete_name(prefix, 5)])
+        self.assertEqual(sorted(hospital.id for hospital in mapped.fuzzy_search_name("City Hospitl 3")),
+                         sorted(hospital.id for hospital in self.live.fuzzy_search_name("City Hospitl 3")))
+        for city in CITIES:
+            self.assertSameHospitals(mapped.search_city(city), self.live.search_city(city))
+
+    def test_loaded_project_is_read_only(self):
+        mapped = self._load()
+        hospital_id = self.live.hospitals[0].id
+        with self.assertRaises(TypeError):
+            mapped.delete_hospital_by_id(hospital_id)
+        with self.assertRaises(TypeError):
+            mapped.add_hospital(_random_hospital(random.Random(1)))
+
+    def test_other_version_is_refused(self):
+        def set_version(data):
+            magic, byte_order, _, section_count = _HEADER.unpack_from(data)
+            _HEADER.pack_into(data, 0, magic, byte_order, SNAPSHOT_VERSION - 1, section_count)
+        self._rewrite(set_version)
+        with self.assertRaisesRegex(ValueError, "Unsupported snapshot version"):
+            self._load()
+
+    def test_short_rtree_meta_is_refused(self):
+        def shorten_meta(data):
+            section_count = _HEADER.unpack_from(data)[3]
+            for number in range(section_count):
+                position = _HEADER.size + number * _SECTION.size
+                name, typecode, offset, length = _SECTION.unpack_from(data, position)
+                if name.rstrip(b"\0") == b"rtree.meta":
+                    _SECTION.pack_into(data, position, name, typecode, offset, 2)
+        self._rewrite(shorten_meta)
+        with self.assertRaisesRegex(ValueError, "rtree.meta has 2 fields"):
+            self._load()
+
+    def test_not_a_snapshot(self):
+        self._rewrite(lambda data: data.__setitem__(slice(0, 6), b"NOTSNP"))
+        with self.assertRaisesRegex(ValueError, "not a hospital snapshot"):
+            self._load()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import math
+import random
+import re
+import unittest
+
+from p15 import COUNTERS, LATENCY_BUCKETS, STATS, Instrumentation
+from p4 import HospitalProject
+from test_indexes import _random_hospital, _random_location
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = Instrumentation()
+
+    def test_quantiles_are_bucket_bounds(self):
+        for seconds in [0.00002] * 98 + [0.3, 3.0]:
+            self.stats.observe("query", seconds)
+        latency = self.stats.stats()["latency"]["query"]
+        self.assertEqual(latency["count"], 100)
+        self.assertEqual(latency["p50_s"], 0.000025)
+        self.assertEqual(latency["p99_s"], 0.5)
+        self.assertAlmostEqual(latency["mean_s"], (98 * 0.00002 + 3.3) / 100)
+
+    def test_prometheus_text(self):
+        self.stats.count("nodes_visited", 7)
+        for seconds in (0.00002, 0.002, 5.0):
+            self.stats.observe("find", seconds)
+        lines = self.stats.prometheus_text().splitlines()
+        self.assertIn("# TYPE geohealth_nodes_visited_total counter", lines)
+        self.assertIn("geohealth_nodes_visited_total 7", lines)
+        self.assertEqual(sum(line.startswith("# HELP geohealth_") for line in lines), len(COUNTERS) + 1)
+        buckets = [line for line in lines if line.startswith("geohealth_operation_seconds_bucket")]
+        self.assertEqual(len(buckets), len(LATENCY_BUCKETS))
+        counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))  # Cumulative, as Prometheus expects
+        self.assertEqual(buckets[-1], 'geohealth_operation_seconds_bucket{operation="find",le="+Inf"} 3')
+        self.assertIn('geohealth_operation_seconds_count{operation="find"} 3', lines)
+        for line in lines:
+            if not line.startswith("#"):
+                self.assertRegex(line, r'^[a-z_]+(\{[^}]*\})? \S+$')
+
+    def test_reset(self):
+        self.stats.count("distance_evaluations", 3)
+        self.stats.observe("find", 0.1)
+        self.stats.reset()
+        self.assertEqual(self.stats.stats(), {"enabled": False, "counters": dict.fromkeys(COUNTERS, 0), "latency": {}})
+
+
+class HotPathTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(31)
+        self.project = HospitalProject()
+        self.project.add_hospitals([_random_hospital(rng) for _ in range(300)])
+        self.locations = [_random_location(rng) for _ in range(10)]
+        STATS.reset()
+        self.addCleanup(STATS.reset)
+        self.addCleanup(STATS.disable)
+
+    def test_disabled_records_nothing(self):
+        for location in self.locations:
+            self.project.find_nearest_hospitals(location, 3)
+        self.assertEqual(STATS.stats(), {"enabled": False, "counters": dict.fromkeys(COUNTERS, 0), "latency": {}})
+
+    def test_queries_are_counted_and_timed(self):
+        STATS.enable()
+        found = 0
+        for location in self.locations:
+            found += len(self.project.find_nearest_hospitals(location, 3))
+            found += len(self.project.find_nearest_hospitals_within_range(location, 5.0))
+        stats = STATS.stats()
+        self.assertEqual(stats["latency"]["find_nearest_hospitals"]["count"], len(self.locations))
+        self.assertEqual(stats["latency"]["find_nearest_hospitals_within_range"]["count"], len(self.locations))
+        self.assertEqual(stats["counters"]["results_materialised"], found)
+        self.assertGreater(stats["counters"]["nodes_visited"], 0)
+        self.assertGreaterEqual(stats["counters"]["distance_evaluations"], found)
+        self.assertTrue(math.isfinite(stats["latency"]["find_nearest_hospitals"]["p99_s"]))
+        self.assertRegex(STATS.prometheus_text(), re.escape('geohealth_operation_seconds_count{operation="find_nearest_hospitals"} 10'))
+
+
+if __name__ == "__main__":
+    unittest.main()
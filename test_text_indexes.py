@@ -0,0 +1,101 @@
+import random
+import unittest
+
+from p3 import InvertedIndex, RadixTrie, Trie
+
+WORDS = ["city", "cite", "sity", "hospital", "hospitol", "clinic", "st", "mary", "marys", "peter", "metro", ""]
+
+
+def _levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        previous, row = row, [i]
+        for j in range(1, len(b) + 1):
+            row.append(min(row[j - 1] + 1, previous[j] + 1, previous[j - 1] + (char != b[j - 1])))
+    return row[-1]
+
+
+class _FuzzySearchMatchesBruteForce:
+    """Checks fuzzy_search against the edit distance of every key. Subclasses set trie_class."""
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.trie = self.trie_class()
+        self.entries = []
+        for number in range(300):
+            key = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(1, 3)))
+            hospital = {"id": number, "rating": round(rng.uniform(1.0, 5.0), 1)}
+            self.trie.insert(key.title(), hospital)
+            self.entries.append((key, hospital))
+        self.queries = ["City", "cty hospital", "mary", "metro clinic", "x", "", "hospitalx"]
+
+    def test_matches_edit_distance(self):
+        for query in self.queries:
+            for max_edits in (0, 1, 2, 3):
+                expected = [hospital["id"] for key, hospital in self.entries if _levenshtein(key, query.lower()) <= max_edits]
+                found = self.trie.fuzzy_search(query, max_edits=max_edits)
+                self.assertEqual(sorted(hospital["id"] for hospital in found), sorted(expected))
+                ranks = [(_levenshtein(key, query.lower()), -hospital["rating"])
+                         for hospital in found for key, entry in self.entries if entry is hospital]
+                self.assertEqual(ranks, sorted(ranks))
+
+    def test_limit(self):
+        for query in self.queries:
+            everything = self.trie.fuzzy_search(query, max_edits=2)
+            self.assertEqual(self.trie.fuzzy_search(query, max_edits=2, limit=3), everything[:3])
+
+
+class _DeleteByIdentity:
+    """Deleting one of two hospitals with equal fields under the same key removes that one, not its twin."""
+
+    def test_delete_removes_the_given_hospital(self):
+        trie = self.trie_class()
+        first, second = {"name": "Twin", "rating": 4.0}, {"name": "Twin", "rating": 4.0}
+        trie.insert("Twin", first)
+        trie.insert("Twin", second)
+        self.assertTrue(trie.delete("Twin", second))
+        found = trie.search("twin")
+        self.assertEqual(len(found), 1)
+        self.assertIs(found[0], first)
+        self.assertIs(trie.autocomplete("tw", limit=5)[0], first)
+        self.assertFalse(trie.delete("Twin", {"name": "Twin", "rating": 4.0}))
+
+
+class TrieTest(_FuzzySearchMatchesBruteForce, _DeleteByIdentity, unittest.TestCase):
+    trie_class = Trie
+
+
+class RadixTrieTest(_FuzzySearchMatchesBruteForce, _DeleteByIdentity, unittest.TestCase):
+    trie_class = RadixTrie
+
+
+class InvertedIndexBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.kept = {"name": "Kept", "rating": 4.0}
+        self.moved = {"name": "Moved", "rating": 3.0}
+        self.removed = {"name": "Removed", "rating": 5.0}
+        for hospital in (self.kept, self.moved, self.removed):
+            self.index.add("1 Main St, New York", hospital)
+
+    def test_search_mid_batch_skips_removed_and_duplicates(self):
+        self.index.begin_batch()
+        self.index.remove(self.removed)
+        self.index.remove(self.moved)
+        self.index.add("2 Main St, New York", self.moved)  # Now listed twice under "main" and "new"
+        found = self.index.search("new york")
+        self.assertEqual(sorted(hospital["name"] for hospital in found), ["Kept", "Moved"])
+        self.assertEqual(len(self.index.search("york", limit=1)), 1)
+        self.index.end_batch()
+        self.assertEqual(self.index.search("new york"), [self.kept, self.moved])
+
+    def test_search_is_a_phrase_search(self):
+        haven = {"name": "Haven", "rating": 4.5}
+        self.index.add("1 York Ave, New Haven", haven)
+        self.assertEqual(self.index.search("new york"), [self.removed, self.kept, self.moved])
+        self.assertEqual(self.index.search("york ave"), [haven])
+        self.assertEqual(self.index.search("boston"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()